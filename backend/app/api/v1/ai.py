@@ -1,11 +1,16 @@
 # filepath: d:\医学竞赛\backend\app\api\v1\ai.py
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends, Request, Query
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from starlette.background import BackgroundTask
 from typing import List, Optional
 import httpx
+import asyncio
+import base64
 import json
 import os
-from datetime import datetime
+import tempfile
+from pathlib import Path
+from starlette.concurrency import run_in_threadpool
 from ...models.schemas import (
     HealthCheckResponse, 
     SupportedModalitiesResponse, 
@@ -13,245 +18,342 @@ from ...models.schemas import (
     PredictRequest,
     PredictResponse,
     BatchPredictRequest,
-    BatchPredictResponse
+    BatchPredictResponse,
+    SegmentationMeasurements
 )
+from ...config import settings
+from ...services.upload_service import stream_to_temp, discard_upload, FileTooLargeError, StoredUpload
+from ...services.ai_proxy import ai_timeout, cached_predict, fan_out_batch_predict
+from ...services.ai_service import DEFAULT_CONNECTIVITY, NEIGHBOR_OFFSETS, measure_nifti
+from ...services.executors import cpu_executor, io_executor
+from ...services import mask_codec
+from ...services import ai_metadata
+from ...services.result_cache import result_cache
+from ...services.circuit_breaker import ai_breaker
+from ...services.session_watch import session_watcher, SESSION_FINISHED_STATES
+from ...services.http_range import parse_range_header, content_range, iter_file_range, slice_stream, RangeNotSatisfiable
 
 router = APIRouter(tags=["AI Analysis"])
 
 # AI服务地址
-AI_SERVICE_URL = "http://localhost:5002"
+AI_SERVICE_URL = settings.AI_SERVICE_URL
 
-async def get_ai_client():
-    """获取AI服务客户端"""
-    return httpx.AsyncClient(base_url=AI_SERVICE_URL, timeout=300.0)
+# SSE 心跳间隔（秒）
+EVENT_KEEPALIVE_INTERVAL = 15.0
+
+
+def get_ai_client(request: Request) -> httpx.AsyncClient:
+    """获取AI服务客户端（由应用生命周期持有）"""
+    return request.app.state.ai_client
 
 @router.get("/health", response_model=HealthCheckResponse)
-async def check_ai_health():
-    """检查AI服务健康状态"""
-    try:
-        print(f"[DEBUG] 尝试连接 AI 服务: {AI_SERVICE_URL}/health")
-        
-        # 创建连接配置，添加更多的连接参数
-        timeout = httpx.Timeout(10.0, connect=5.0)
-        limits = httpx.Limits(max_keepalive_connections=5, max_connections=10)
-        
-        async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
-            response = await client.get(f"{AI_SERVICE_URL}/health")
-            print(f"[DEBUG] AI 服务响应状态码: {response.status_code}")
-            print(f"[DEBUG] AI 服务响应内容: {response.text}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                print(f"[DEBUG] 解析后的数据: {data}")
-                print(f"[DEBUG] 数据类型: {type(data)}")
-                print(f"[DEBUG] 数据字段: {list(data.keys()) if isinstance(data, dict) else 'Not a dict'}")
-                
-                # 验证数据结构
-                try:
-                    health_response = HealthCheckResponse(**data)
-                    print(f"[DEBUG] HealthCheckResponse创建成功: {health_response}")
-                    return health_response
-                except Exception as pydantic_error:
-                    print(f"[ERROR] Pydantic验证失败: {pydantic_error}")
-                    print(f"[DEBUG] 尝试手动创建响应...")
-                    return HealthCheckResponse(
-                        status=data.get("status", "unknown"),
-                        service=data.get("service"),
-                        version=data.get("version"),
-                        timestamp=data.get("timestamp", datetime.now().isoformat()),
-                        gpu_available=data.get("gpu_available"),
-                        model_loaded=data.get("model_loaded")
-                    )
-            else:
-                print(f"[ERROR] AI 服务返回非200状态码: {response.status_code}")
-                # 返回断开连接状态而不是抛出异常
-                return HealthCheckResponse(
-                    status="disconnected",
-                    timestamp=datetime.now().isoformat(),
-                    service="AI Analysis Service",
-                    version="unknown"
-                )
-    except httpx.RequestError as e:
-        print(f"[ERROR] 连接 AI 服务失败: {type(e).__name__}: {str(e)}")
-        # 返回断开连接状态而不是抛出异常
-        return HealthCheckResponse(
-            status="disconnected", 
-            timestamp=datetime.now().isoformat(),
-            service="AI Analysis Service",
-            version="unknown"
-        )
-    except Exception as e:
-        print(f"[ERROR] 处理 AI 健康检查时发生未知错误: {type(e).__name__}: {str(e)}")
-        # 返回错误状态而不是抛出异常  
-        return HealthCheckResponse(
-            status="error",
-            timestamp=datetime.now().isoformat(), 
-            service="AI Analysis Service",
-            version="unknown"
-        )
+async def check_ai_health(client: httpx.AsyncClient = Depends(get_ai_client)):
+    """检查AI服务健康状态（读取后台探测的缓存结果）"""
+    return await ai_metadata.get_health(client)
 
 @router.get("/supported_modalities", response_model=SupportedModalitiesResponse)
-async def get_supported_modalities():
+async def get_supported_modalities(client: httpx.AsyncClient = Depends(get_ai_client)):
     """获取支持的影像模态"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{AI_SERVICE_URL}/supported_modalities")
-            response.raise_for_status()
-            data = response.json()
-            return SupportedModalitiesResponse(**data)
+        data = await ai_metadata.get_supported_modalities(client)
+        return SupportedModalitiesResponse(**data)
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"AI service error: {str(e)}")
 
 @router.get("/model_info", response_model=ModelInfoResponse)
-async def get_model_info():
+async def get_model_info(client: httpx.AsyncClient = Depends(get_ai_client)):
     """获取AI模型信息"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{AI_SERVICE_URL}/model_info")
-            response.raise_for_status()
-            data = response.json()
-            return ModelInfoResponse(**data)
+        data = await ai_metadata.get_model_info(client)
+        return ModelInfoResponse(**data)
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"AI service error: {str(e)}")
 
-@router.post("/predict", response_model=PredictResponse)
-async def predict_tumor(
-    file: UploadFile = File(...),
-    modality: str = Form(...),
-    patient_id: Optional[str] = Form(None)
-):
-    """肿瘤分析预测"""
-    # 验证文件类型
+def check_file_type(filename: str) -> None:
+    """验证预测文件类型"""
     allowed_extensions = ['.dcm', '.dicom', '.nii', '.nii.gz']
-    file_extension = os.path.splitext(file.filename.lower())[1]
+    file_extension = os.path.splitext(filename.lower())[1]
     if file_extension == '.gz':
         # 处理 .nii.gz 文件
-        base_name = os.path.splitext(file.filename[:-3])[0]
+        base_name = os.path.splitext(filename[:-3])[0]
         if base_name.endswith('.nii'):
             file_extension = '.nii.gz'
-    
+
     if file_extension not in allowed_extensions:
         raise HTTPException(
-            status_code=400, 
+            status_code=400,
             detail=f"Unsupported file type. Allowed: {allowed_extensions}"
         )
-    
-    # 验证影像模态
+
+
+def check_modality(modality: str) -> None:
+    """验证影像模态"""
     allowed_modalities = ['MRI', 'CT', 'PET', 'US']
     if modality.upper() not in allowed_modalities:
         raise HTTPException(
             status_code=400,
             detail=f"Unsupported modality. Allowed: {allowed_modalities}"
         )
-    
+
+
+def parse_patient_ids(patient_ids: Optional[str]) -> List[str]:
+    """解析JSON字符串形式的patient_ids列表"""
+    if not patient_ids:
+        return []
     try:
-        # 读取文件内容
-        file_content = await file.read()
-        
-        # 准备发送到AI服务的文件数据
-        files = {"file": (file.filename, file_content, file.content_type)}
-        data = {
-            "modality": modality.upper(),
-            "patient_id": patient_id
-        }
-        
-        # 发送到AI服务
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            response = await client.post(
-                f"{AI_SERVICE_URL}/predict",
-                files=files,
-                data=data
-            )
-            
-            if response.status_code == 200:
-                result_data = response.json()
-                return PredictResponse(
-                    success=True,
-                    session_id=result_data.get("session_id"),
-                    result=result_data.get("result")
-                )
-            else:
-                error_detail = response.text
-                return PredictResponse(
-                    success=False,
-                    error=f"AI analysis failed: {error_detail}"
-                )
-                
-    except httpx.RequestError as e:
-        return PredictResponse(
-            success=False,
-            error=f"Connection error: {str(e)}"
-        )
-    except Exception as e:
-        return PredictResponse(
-            success=False,
-            error=f"Unexpected error: {str(e)}"
+        return json.loads(patient_ids)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid patient_ids format")
+
+
+async def spool_uploads(files: List[UploadFile]) -> List[StoredUpload]:
+    """逐个流式落盘到临时文件，超限时清理已写入的文件"""
+    stored_files = []
+    try:
+        for file in files:
+            stored_files.append(await stream_to_temp(file))
+    except FileTooLargeError as e:
+        for stored in stored_files:
+            discard_upload(stored)
+        raise HTTPException(status_code=413, detail=f"{file.filename}: {str(e)}")
+    return stored_files
+
+
+@router.post("/predict", response_model=PredictResponse)
+async def predict_tumor(
+    file: UploadFile = File(...),
+    modality: str = Form(...),
+    patient_id: Optional[str] = Form(None),
+    client: httpx.AsyncClient = Depends(get_ai_client)
+):
+    """肿瘤分析预测"""
+    check_file_type(file.filename)
+    check_modality(modality)
+    ai_breaker.check()
+
+    # 流式落盘到临时文件，避免整个文件驻留内存
+    try:
+        stored = await stream_to_temp(file)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    try:
+        return await cached_predict(
+            client, stored, file.filename, file.content_type, modality, patient_id
         )
+    finally:
+        discard_upload(stored)
 
 @router.post("/batch_predict", response_model=BatchPredictResponse)
 async def batch_predict_tumors(
     files: List[UploadFile] = File(...),
     modality: str = Form(...),
     batch_name: Optional[str] = Form(None),
-    patient_ids: Optional[str] = Form(None)  # JSON字符串形式的patient_ids列表
+    patient_ids: Optional[str] = Form(None),  # JSON字符串形式的patient_ids列表
+    client: httpx.AsyncClient = Depends(get_ai_client)
 ):
     """批量肿瘤分析"""
-    # 解析patient_ids
-    patient_id_list = []
-    if patient_ids:
-        try:
-            patient_id_list = json.loads(patient_ids)
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=400, detail="Invalid patient_ids format")
-    
+    patient_id_list = parse_patient_ids(patient_ids)
+
     # 验证文件数量
     if len(files) == 0:
         raise HTTPException(status_code=400, detail="No files provided")
-    
-    # 验证影像模态
-    allowed_modalities = ['MRI', 'CT', 'PET', 'US']
-    if modality.upper() not in allowed_modalities:
+
+    check_modality(modality)
+    ai_breaker.check()
+
+    stored_files = await spool_uploads(files)
+    try:
+        items = [
+            (file.filename, stored, file.content_type)
+            for file, stored in zip(files, stored_files)
+        ]
+        # 逐文件并发提交，单个文件失败只体现在对应条目的状态中
+        return await fan_out_batch_predict(client, items, modality, batch_name, patient_id_list)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch processing error: {str(e)}")
+    finally:
+        for stored in stored_files:
+            discard_upload(stored)
+
+@router.post("/segmentation/measure", response_model=SegmentationMeasurements)
+async def measure_segmentation(
+    file: UploadFile = File(...),
+    connectivity: int = Form(DEFAULT_CONNECTIVITY),
+    threshold: Optional[float] = Form(None)
+):
+    """
+    在后端本地从分割掩码（NIfTI）计算每个病灶的体积、包围盒、质心和直径，无需再次请求AI服务
+    - 整数掩码按标签值区分病灶类别；概率图可通过 threshold 二值化
+    - connectivity: 6（面相邻）或 26（含棱、角相邻）
+    """
+    if not file.filename.lower().endswith(('.nii', '.nii.gz')):
+        raise HTTPException(status_code=400, detail="分割掩码需为NIfTI格式（.nii/.nii.gz）")
+    if connectivity not in NEIGHBOR_OFFSETS:
+        raise HTTPException(status_code=400, detail=f"connectivity 可选 {sorted(NEIGHBOR_OFFSETS)}")
+
+    suffix = ".nii.gz" if file.filename.lower().endswith(".gz") else ".nii"
+    try:
+        stored = await stream_to_temp(file, suffix=suffix)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        return await cpu_executor.run(measure_nifti, stored.path, connectivity, threshold)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        discard_upload(stored)
+
+def _range_response(content: bytes, media_type: str, filename: str, range_header: Optional[str]) -> Response:
+    """返回内存中的内容（兼容 base64-in-JSON 信封），支持 Range"""
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Accept-Ranges": "bytes"
+    }
+    try:
+        byte_range = parse_range_header(range_header, len(content))
+    except RangeNotSatisfiable as e:
         raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported modality. Allowed: {allowed_modalities}"
+            status_code=416,
+            detail=str(e),
+            headers={"Content-Range": f"bytes */{e.size}"}
         )
-    
+    if byte_range is None:
+        return Response(content, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = content_range(start, end, len(content))
+    return Response(content[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+
+async def _file_range_response(path: Path, media_type: str, filename: str, range_header: Optional[str]) -> Response:
+    """直接从磁盘返回文件（不读入内存），支持 Range"""
+    stat = await io_executor.run(path.stat)
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Accept-Ranges": "bytes"
+    }
     try:
-        # 准备批量文件数据
-        file_data = []
-        for i, file in enumerate(files):
-            content = await file.read()
-            file_data.append(("files", (file.filename, content, file.content_type)))
-        
-        # 准备表单数据
-        data = {
-            "modality": modality.upper(),
-            "batch_name": batch_name or f"batch_{len(files)}_files"
-        }
-        
-        if patient_id_list:
-            data["patient_ids"] = json.dumps(patient_id_list)
-        
-        # 发送到AI服务
-        async with httpx.AsyncClient(timeout=600.0) as client:  # 批量处理需要更长超时
-            response = await client.post(
-                f"{AI_SERVICE_URL}/batch_predict",
-                files=file_data,
-                data=data
-            )
-            
-            response.raise_for_status()
-            result_data = response.json()
-            return BatchPredictResponse(**result_data)
-            
+        byte_range = parse_range_header(range_header, stat.st_size)
+    except RangeNotSatisfiable as e:
+        raise HTTPException(
+            status_code=416,
+            detail=str(e),
+            headers={"Content-Range": f"bytes */{e.size}"}
+        )
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
+
+    start, end = byte_range
+    headers["Content-Range"] = content_range(start, end, stat.st_size)
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file_range(path, start, end, settings.STREAM_CHUNK_SIZE),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
+
+
+async def _spool_segmentation(client: httpx.AsyncClient, session_id: str) -> Path:
+    """从AI服务下载分割结果（NIfTI）到临时文件，兼容 base64-in-JSON 信封"""
+    try:
+        upstream_request = client.build_request(
+            "GET",
+            f"/download/{session_id}/segmentation",
+            timeout=ai_timeout(settings.AI_TIMEOUT_DOWNLOAD)
+        )
+        response = await client.send(upstream_request, stream=True, follow_redirects=True)
     except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"AI service error: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Batch processing error: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Download error: {str(e)}")
+
+    if response.status_code != 200:
+        await response.aclose()
+        raise HTTPException(
+            status_code=response.status_code,
+            detail="Failed to download file from AI service"
+        )
+
+    settings.TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=settings.TEMP_DIR, suffix=".part")
+    tmp_path = Path(tmp_name)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if response.headers.get("content-type", "").startswith("application/json"):
+                result = json.loads(await response.aread())
+                await run_in_threadpool(out.write, base64.b64decode(result["content"]))
+            else:
+                async for chunk in response.aiter_bytes(settings.STREAM_CHUNK_SIZE):
+                    await run_in_threadpool(out.write, chunk)
+        with open(tmp_path, "rb") as f:
+            gzipped = f.read(2) == b"\x1f\x8b"
+        # nibabel 按扩展名识别压缩格式
+        return tmp_path.rename(tmp_path.with_suffix(".nii.gz" if gzipped else ".nii"))
+    except httpx.RequestError as e:
+        tmp_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=503, detail=f"Download error: {str(e)}")
+    except (KeyError, ValueError) as e:
+        tmp_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=502, detail=f"AI服务返回的分割结果格式错误: {e}")
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        await response.aclose()
+
+
+async def _compact_segmentation(client: httpx.AsyncClient, session_id: str) -> Path:
+    """获取会话分割结果的紧凑格式文件，首次请求时从AI服务下载并转换（结果按会话缓存）"""
+    path = mask_codec.mask_path(session_id)
+    if path.exists():
+        return path
+    source = await _spool_segmentation(client, session_id)
+    try:
+        await cpu_executor.run(mask_codec.build_mask_file, source, path, settings.MASK_ENCODING)
+    except ValueError as e:
+        raise HTTPException(status_code=502, detail=f"AI服务返回的分割结果无法转换: {e}")
+    finally:
+        source.unlink(missing_ok=True)
+    return path
+
+
+@router.get("/download/{session_id}/segmentation/slices/{index}")
+async def download_segmentation_slice(
+    session_id: str,
+    index: int,
+    client: httpx.AsyncClient = Depends(get_ai_client)
+):
+    """
+    按层获取分割结果（紧凑格式中单层的编码数据，只读取这一层，无需解码整个体积）
+    - 响应头 X-Mask-Encoding: empty / bitpack / rle，X-Mask-Shape: 层的 (i, j) 尺寸，X-Mask-Dtype: 像素类型
+    - 像素按 Fortran 顺序展平（i 变化最快）；编码细节见 services/mask_codec.py
+    """
+    path = await _compact_segmentation(client, session_id)
+    try:
+        record = await io_executor.run(mask_codec.read_slice_record, path, index)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(
+        record["data"],
+        media_type="application/octet-stream",
+        headers={
+            "X-Mask-Encoding": record["encoding"],
+            "X-Mask-Shape": ",".join(str(n) for n in record["shape"]),
+            "X-Mask-Dtype": record["dtype"],
+            "X-Mask-Slice-Count": str(record["slice_count"]),
+        }
+    )
+
 
 @router.get("/download/{session_id}/{file_type}")
-async def download_analysis_result(session_id: str, file_type: str):
-    """下载分析结果文件"""
+async def download_analysis_result(
+    session_id: str,
+    file_type: str,
+    request: Request,
+    output_format: Optional[str] = Query(None, alias="format"),
+    client: httpx.AsyncClient = Depends(get_ai_client)
+):
+    """下载分析结果文件（流式代理，支持 Range）；分割结果可用 format=compact 获取紧凑格式"""
     # 验证文件类型
     allowed_file_types = ['segmentation', 'report', 'raw_output', 'pdf']
     if file_type not in allowed_file_types:
@@ -259,75 +361,162 @@ async def download_analysis_result(session_id: str, file_type: str):
             status_code=400,
             detail=f"Invalid file type. Allowed: {allowed_file_types}"
         )
-    
+
+    range_header = request.headers.get("range")
+    if output_format not in (None, "raw", "compact"):
+        raise HTTPException(status_code=400, detail="format 可选 raw / compact")
+    if output_format == "compact":
+        if file_type != "segmentation":
+            raise HTTPException(status_code=400, detail="只有分割结果支持紧凑格式")
+        path = await _compact_segmentation(client, session_id)
+        return await _file_range_response(path, mask_codec.MASK_MEDIA_TYPE, f"{session_id}_segmentation.mask", range_header)
+
+    upstream_headers = {"Range": range_header} if range_header else {}
+
     try:
-        # 代理下载请求到AI服务
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(
-                f"{AI_SERVICE_URL}/download/{session_id}/{file_type}",
-                follow_redirects=True
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                # 如果是PDF文件，需要解码base64内容
-                if file_type == "pdf":
-                    import base64
-                    pdf_content = base64.b64decode(result["content"])
-                    return StreamingResponse(
-                        iter([pdf_content]),
-                        media_type="application/pdf",
-                        headers={
-                            "Content-Disposition": f"attachment; filename={result['filename']}"
-                        }
-                    )
-                elif file_type == "report":
-                    # 文本报告
-                    content = result["content"].encode('utf-8')
-                    return StreamingResponse(
-                        iter([content]),
-                        media_type="text/plain; charset=utf-8",
-                        headers={
-                            "Content-Disposition": f"attachment; filename={result['filename']}"
-                        }
-                    )
-                else:
-                    # 其他文件类型
-                    return StreamingResponse(
-                        iter([response.content]),
-                        media_type=response.headers.get('content-type', 'application/octet-stream'),
-                        headers={
-                            "Content-Disposition": f"attachment; filename={session_id}_{file_type}"
-                        }
-                    )
-            else:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Failed to download file from AI service"
-                )
-                
+        # 代理下载请求到AI服务（流式接收，不缓冲整个响应）
+        upstream_request = client.build_request(
+            "GET",
+            f"/download/{session_id}/{file_type}",
+            headers=upstream_headers,
+            timeout=ai_timeout(settings.AI_TIMEOUT_DOWNLOAD)
+        )
+        response = await client.send(upstream_request, stream=True, follow_redirects=True)
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Download error: {str(e)}")
 
+    if response.status_code not in (200, 206):
+        await response.aclose()
+        raise HTTPException(
+            status_code=response.status_code,
+            detail="Failed to download file from AI service"
+        )
+
+    content_type = response.headers.get("content-type", "application/octet-stream")
+
+    # 兼容旧的 base64-in-JSON 信封传输
+    if content_type.startswith("application/json"):
+        try:
+            body = await response.aread()
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=503, detail=f"Download error: {str(e)}")
+        finally:
+            await response.aclose()
+        result = json.loads(body)
+
+        # 如果是PDF文件，需要解码base64内容
+        if file_type == "pdf":
+            return _range_response(
+                base64.b64decode(result["content"]), "application/pdf", result["filename"], range_header
+            )
+        elif file_type == "report":
+            # 文本报告
+            return _range_response(
+                result["content"].encode('utf-8'), "text/plain; charset=utf-8", result["filename"], range_header
+            )
+        else:
+            # 其他文件类型
+            return _range_response(body, content_type, f"{session_id}_{file_type}", range_header)
+
+    # 原始二进制传输：逐块透传，内存占用恒定
+    headers = {
+        "Content-Disposition": response.headers.get(
+            "content-disposition", f"attachment; filename={session_id}_{file_type}"
+        ),
+        "Accept-Ranges": "bytes"
+    }
+    for name in ("etag", "last-modified"):
+        if name in response.headers:
+            headers[name] = response.headers[name]
+
+    encoded = "content-encoding" in response.headers
+    content_length = response.headers.get("content-length")
+    body = response.aiter_bytes(settings.STREAM_CHUNK_SIZE)
+    status_code = response.status_code
+
+    if status_code == 206:
+        # AI服务已处理 Range，直接透传
+        headers["Content-Range"] = response.headers.get("content-range", "")
+    elif range_header and content_length is not None and not encoded:
+        # AI服务不支持 Range 时在本地按流截取
+        size = int(content_length)
+        try:
+            byte_range = parse_range_header(range_header, size)
+        except RangeNotSatisfiable as e:
+            await response.aclose()
+            raise HTTPException(
+                status_code=416,
+                detail=str(e),
+                headers={"Content-Range": f"bytes */{e.size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            body = slice_stream(body, start, end)
+            status_code = 206
+            headers["Content-Range"] = content_range(start, end, size)
+            content_length = str(end - start + 1)
+
+    if content_length is not None and not encoded:
+        headers["Content-Length"] = content_length
+
+    return StreamingResponse(
+        body,
+        status_code=status_code,
+        media_type=content_type,
+        headers=headers,
+        background=BackgroundTask(response.aclose)
+    )
+
 @router.get("/sessions/{session_id}/status")
-async def get_analysis_status(session_id: str):
-    """获取分析会话状态"""
+async def get_analysis_status(session_id: str, client: httpx.AsyncClient = Depends(get_ai_client)):
+    """获取分析会话状态（会话正在被推送时直接返回最新状态，不再请求AI服务）"""
+    cached = session_watcher.cached_status(session_id)
+    if cached is not None:
+        return cached
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{AI_SERVICE_URL}/sessions/{session_id}/status")
-            response.raise_for_status()
-            return response.json()
+        response = await client.get(f"/sessions/{session_id}/status")
+        response.raise_for_status()
+        return response.json()
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"AI service error: {str(e)}")
 
+@router.get("/sessions/{session_id}/events")
+async def stream_analysis_status(session_id: str, client: httpx.AsyncClient = Depends(get_ai_client)):
+    """以SSE推送分析会话状态：同一会话无论多少客户端观看，后端只向AI服务轮询一次
+
+    事件类型固定为 status，具体状态（取自AI服务，可能出现新值）在数据的 status 字段中
+    """
+    async def event_stream():
+        queue = session_watcher.subscribe(client, session_id)
+        try:
+            while True:
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                status = snapshot.get("status", "unknown")
+                yield f"event: status\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+                if status in SESSION_FINISHED_STATES:
+                    break
+        finally:
+            session_watcher.unsubscribe(session_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.delete("/sessions/{session_id}")
-async def delete_analysis_session(session_id: str):
+async def delete_analysis_session(session_id: str, client: httpx.AsyncClient = Depends(get_ai_client)):
     """删除分析会话"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.delete(f"{AI_SERVICE_URL}/sessions/{session_id}")
-            response.raise_for_status()
-            return {"message": f"Session {session_id} deleted successfully"}
+        response = await client.delete(f"/sessions/{session_id}")
+        response.raise_for_status()
+        mask_codec.mask_path(session_id).unlink(missing_ok=True)
+        # 缓存命中会返回原分析的会话ID，会话删除后这些结果不再可用
+        await result_cache.invalidate_session(session_id)
+        return {"message": f"Session {session_id} deleted successfully"}
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"AI service error: {str(e)}")
\ No newline at end of file
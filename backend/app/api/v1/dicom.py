@@ -1,12 +1,26 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, status,Depends, Response
+from fastapi import APIRouter, UploadFile, File, HTTPException, status,Depends, Response, Query, Request, BackgroundTasks, Header
+from fastapi.responses import FileResponse, StreamingResponse
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
+from typing import List, Optional, Tuple
+import logging
+import secrets
+import numpy as np
 from app.config import settings
-from app.services.dicom_service import validate_dicom
-from app.models.schemas import UploadResponse
+from app.models import database
+from app.services import blob_store, render_service, tile_service, volume_store
+from app.services.executors import io_executor, cpu_executor, ExecutorBusyError
+from app.services.ingest_service import ingest_uploads
+from app.services.dicom_service import validate_dicom, index_file, read_frame, reconcile_index
+from app.services.upload_service import stream_to_temp, discard_upload, FileTooLargeError
+from app.services.http_range import parse_range_header, content_range, iter_file_range, RangeNotSatisfiable
+from app.models.schemas import UploadResponse, IngestResponse
 from app.services.dicom_service import get_dicom_results
-from app.models.schemas import DicomResultsResponse
+from app.models.schemas import DicomResultsResponse, SeriesListResponse, SeriesSummary, SeriesManifest, SeriesInstance
+from app.models.schemas import TilePyramid, TileLevel
 
 router = APIRouter(tags=["DICOM操作"])
+logger = logging.getLogger(__name__)
 
 @router.get("/test")
 async def test_dicom_route():
@@ -14,45 +28,83 @@ async def test_dicom_route():
     return {"message": "DICOM路由工作正常", "path": "/api/v1/dicom/test"}
 
 
+async def _precompute_renders(file_path: Path, sha256: str, modality: Optional[str]) -> None:
+    """后台生成默认渲染（在进程池排队，不设等待上限；失败时访问预览会按需重试）"""
+    try:
+        await cpu_executor.run(render_service.precompute_renders, file_path, sha256, modality, timeout=None)
+    except Exception as e:
+        logger.error(f"后台生成预览失败: {file_path}: {e}")
+
+
 @router.post("/upload", response_model=UploadResponse)
-async def upload_dicom(file: UploadFile = File(...)):
+async def upload_dicom(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """
     上传医学影像文件
     - 支持.dcm, .nii, .nii.gz格式
-    - 最大50MB
+    - 大小上限由 settings.MAX_FILE_SIZE 决定（默认50MB）
     """
     try:
         # 验证文件类型
-        valid_extensions = ['.dcm', '.nii', '.nii.gz']
-        filename_lower = file.filename.lower()
-        is_valid = any(filename_lower.endswith(ext) for ext in valid_extensions)
-        
-        if not is_valid:
+        extension = blob_store.file_extension(file.filename)
+
+        if extension is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="仅支持医学影像格式文件: .dcm, .nii, .nii.gz"
             )
 
-        # 保存文件
-        save_path = settings.UPLOAD_DIR / file.filename
-        with open(save_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        #print(f'保存路径在:{save_path}')#用于检查pathisWhere
+        # 流式写入临时文件（分块写入、边写边哈希、校验大小上限）
+        try:
+            stored = await stream_to_temp(file, suffix=extension)
+        except FileTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+
+        # 验证文件有效性（头部解析在I/O线程池中执行，不阻塞事件循环）
+        try:
+            valid = await io_executor.run(validate_dicom, stored.path)
+        except ExecutorBusyError:
+            discard_upload(stored)
+            raise
+        if not valid:
+            discard_upload(stored)  # 删除无效文件
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="无效的DICOM文件"
+            )
+
+        # 移入内容寻址存储（相同内容只保存一份），并在同一次调用中写入元数据索引、登记文件名
+        # （同名不同内容时自动改名）；登记完成前blob处于预留状态，不会被并发的回收或删除清理
+        def register(path: Path, blob: str):
+            return index_file(path, filename=Path(file.filename).name, sha256=stored.sha256, blob=blob)
 
-        # 验证文件有效性
-        if not validate_dicom(save_path):
-            save_path.unlink()  # 删除无效文件
+        try:
+            result = await io_executor.run(blob_store.store_upload, stored, extension, register)
+        except ExecutorBusyError:
+            discard_upload(stored)
+            raise
+        if result is None:
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail="无效的DICOM文件"
             )
+        save_path = blob_store.blob_path(blob_store.blob_key(stored.sha256, extension))
+
+        # 响应返回后在后台生成缩略图和关键层预览（在进程池排队，不设等待上限）
+        if settings.RENDER_ON_UPLOAD:
+            background_tasks.add_task(_precompute_renders, save_path, stored.sha256, result.modality)
 
         return UploadResponse(
-            filename=file.filename,
+            filename=result.filename,
             saved_path=str(save_path),
-            message="上传成功"
+            message="上传成功",
+            size=stored.size,
+            sha256=stored.sha256
         )
+    except (HTTPException, ExecutorBusyError):
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -60,20 +112,487 @@ async def upload_dicom(file: UploadFile = File(...)):
         )
 
 
+@router.post("/ingest", response_model=IngestResponse)
+async def ingest_dicom(files: List[UploadFile] = File(...)):
+    """
+    批量导入整个检查
+    - 支持一次上传多个文件，或 .zip / .tar / .tar.gz / .tgz 压缩包（边解包边处理）
+    - 无扩展名的文件按DICOM魔数识别，DICOMDIR和隐藏文件会被跳过
+    - 校验与索引在进程池中并行执行，返回逐文件的处理报告
+    """
+    return await ingest_uploads(files)
+
+
 @router.get("/results", response_model=DicomResultsResponse)
-async def dicom_results():
-    """获取所有已上传DICOM文件的处理结果"""
-    results = get_dicom_results(settings.UPLOAD_DIR)
-    return DicomResultsResponse(results=results)
+async def dicom_results(
+    patient_id: Optional[str] = None,
+    modality: Optional[str] = None,
+    study_date: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000)
+):
+    """获取已上传DICOM文件的处理结果（支持分页与按患者ID/模态/检查日期筛选）"""
+    results, total = await io_executor.run(
+        get_dicom_results,
+        patient_id=patient_id,
+        modality=modality,
+        study_date=study_date,
+        offset=offset,
+        limit=limit
+    )
+    return DicomResultsResponse(results=results, total=total, offset=offset, limit=limit)
+
+async def _frame_response(file_path: Path, index: int) -> Response:
+    """以原始像素字节返回单帧，像素属性放在响应头中（解码在进程池中执行）"""
+    try:
+        frame, meta = await cpu_executor.run(read_frame, file_path, index)
+    except IndexError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    frame = np.ascontiguousarray(frame)
+    return Response(
+        frame.tobytes(),
+        media_type="application/octet-stream",
+        headers={
+            "X-Rows": str(frame.shape[0]),
+            "X-Columns": str(frame.shape[1]),
+            "X-Samples-Per-Pixel": str(frame.shape[2] if frame.ndim == 3 else 1),
+            "X-Dtype": frame.dtype.str,
+            "X-Frame-Count": str(meta["frame_count"]),
+            "X-Rescale-Slope": str(meta["rescale_slope"]),
+            "X-Rescale-Intercept": str(meta["rescale_intercept"]),
+            "Cache-Control": f"private, max-age={settings.FILE_CACHE_MAX_AGE}"
+        }
+    )
+
+
+def _lookup_file(filename: str) -> Tuple[Optional[Path], Optional[dict]]:
+    return blob_store.resolve_file(filename), database.get_record(filename)
+
+
+async def _resolve_file(filename: str) -> Tuple[Path, Optional[dict]]:
+    """在I/O线程池中解析文件的存储路径并读取索引记录，文件不存在时返回404"""
+    file_path, record = await io_executor.run(_lookup_file, filename)
+    if file_path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="文件未找到"
+        )
+    return file_path, record
+
+
+async def _series_instances(series_uid: str) -> list:
+    instances = await io_executor.run(database.get_series_instances, series_uid)
+    if not instances:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="序列未找到")
+    return instances
+
+
+@router.get("/series", response_model=SeriesListResponse)
+async def list_series(study_uid: Optional[str] = None):
+    """按 Study/Series UID 分组列出已上传的DICOM序列"""
+    rows = await io_executor.run(database.query_series, study_uid)
+    return SeriesListResponse(series=[
+        SeriesSummary(
+            study_instance_uid=row["study_uid"],
+            series_instance_uid=row["series_uid"],
+            patient_id=row["patient_id"],
+            modality=row["modality"],
+            study_date=row["study_date"],
+            instance_count=row["instance_count"],
+            frame_count=row["frame_count"]
+        )
+        for row in rows
+    ])
+
+
+@router.get("/series/{series_uid}", response_model=SeriesManifest)
+async def get_series_manifest(series_uid: str):
+    """序列清单：实例按切片位置排序，并给出每个实例在序列中的帧范围"""
+    instances = await _series_instances(series_uid)
+    items = []
+    first_frame = 0
+    for row in instances:
+        frame_count = row["number_of_frames"] or 1
+        items.append(SeriesInstance(
+            filename=row["filename"],
+            instance_number=row["instance_number"],
+            slice_position=row["slice_position"],
+            frame_count=frame_count,
+            first_frame=first_frame
+        ))
+        first_frame += frame_count
+    return SeriesManifest(
+        study_instance_uid=instances[0]["study_uid"],
+        series_instance_uid=series_uid,
+        patient_id=instances[0]["patient_id"],
+        modality=instances[0]["modality"],
+        frame_count=first_frame,
+        instances=items
+    )
+
+
+@router.get("/series/{series_uid}/frames/{index}")
+async def get_series_frame(series_uid: str, index: int):
+    """按序列内的全局索引获取单帧像素"""
+    first_frame = 0
+    for row in await _series_instances(series_uid):
+        frame_count = row["number_of_frames"] or 1
+        if first_frame <= index < first_frame + frame_count:
+            file_path = await io_executor.run(blob_store.resolve_file, row["filename"])
+            if file_path is None:
+                break
+            return await _frame_response(file_path, index - first_frame)
+        first_frame += frame_count
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"帧索引越界: {index}")
+
+
+def _negotiate_format(request: Request, fmt: Optional[str]) -> str:
+    """未指定格式时按 Accept 头协商（支持时优先WebP）"""
+    available = render_service.available_formats()
+    if fmt is None:
+        return "webp" if "webp" in available and "image/webp" in request.headers.get("accept", "") else "png"
+    if fmt not in available:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"不支持的图像格式: {fmt}，可用格式: {', '.join(available)}"
+        )
+    return fmt
+
+
+async def _preview_response(
+    request: Request,
+    filename: str,
+    kind: str,
+    fmt: Optional[str],
+    index: Optional[int],
+    window_center: Optional[float],
+    window_width: Optional[float]
+) -> Response:
+    """返回渲染图像：默认窗的渲染按内容哈希缓存，自定义窗宽窗位时即时渲染"""
+    file_path, record = await _resolve_file(filename)
+    fmt = _negotiate_format(request, fmt)
+    modality = record["modality"] if record is not None else None
+    sha256 = record["sha256"] if record is not None else None
+    headers = {
+        "Cache-Control": f"private, max-age={settings.FILE_CACHE_MAX_AGE}",
+        "Vary": "Accept"
+    }
+    window = (window_center, window_width) if window_center is not None and window_width else None
+
+    try:
+        if window is not None or sha256 is None:
+            content = await cpu_executor.run(
+                render_service.render_frame, file_path, index, kind, fmt, modality, window
+            )
+            return Response(content, media_type=render_service.MEDIA_TYPES[fmt], headers=headers)
+
+        headers["ETag"] = f'"{sha256}-{kind}-{"key" if index is None else index}-{fmt}"'
+        if _not_modified(request, headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        render_path = await cpu_executor.run(
+            render_service.get_render, file_path, sha256, kind, fmt, index, modality
+        )
+    except IndexError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return FileResponse(render_path, media_type=render_service.MEDIA_TYPES[fmt], headers=headers)
+
+
+@router.get("/series/{series_uid}/preview")
+async def get_series_preview(
+    series_uid: str,
+    request: Request,
+    kind: str = Query("thumbnail", regex="^(thumbnail|preview)$"),
+    format: Optional[str] = Query(None, regex="^(png|webp)$"),
+    wc: Optional[float] = None,
+    ww: Optional[float] = Query(None, gt=0)
+):
+    """序列缩略图：取序列中间一帧（按切片位置排序）渲染"""
+    instances = await _series_instances(series_uid)
+    frame_counts = [row["number_of_frames"] or 1 for row in instances]
+    index = render_service.key_frame_index(sum(frame_counts))
+    for row, frame_count in zip(instances, frame_counts):
+        if index < frame_count:
+            return await _preview_response(request, row["filename"], kind, format, index, wc, ww)
+        index -= frame_count
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="序列未找到")
+
+
+@router.get("/{filename}/preview")
+async def get_file_preview(
+    filename: str,
+    request: Request,
+    kind: str = Query("thumbnail", regex="^(thumbnail|preview)$"),
+    format: Optional[str] = Query(None, regex="^(png|webp)$"),
+    frame: Optional[int] = Query(None, ge=0),
+    wc: Optional[float] = None,
+    ww: Optional[float] = Query(None, gt=0)
+):
+    """
+    获取影像的缩略图(thumbnail)或关键层预览(preview)
+    - 默认渲染中间一帧/一层，CT使用软组织窗，MR等按强度分布自动取窗
+    - 可通过 frame 指定帧，通过 wc/ww 指定窗位/窗宽
+    """
+    return await _preview_response(request, filename, kind, format, frame, wc, ww)
+
+
+async def _load_pyramid(filename: str, frame: int):
+    """解析文件并获取指定帧的瓦片金字塔：已缓存时在I/O线程池中只读头部，只有首次构建才使用进程池"""
+    file_path, record = await _resolve_file(filename)
+    if record is None or not record["sha256"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="文件未找到"
+        )
+    cached = await io_executor.run(tile_service.cached_pyramid, record["sha256"], frame)
+    if cached is not None:
+        return (record, *cached)
+
+    try:
+        path, header = await cpu_executor.run(
+            tile_service.get_pyramid, file_path, record["sha256"], frame, record["modality"]
+        )
+    except IndexError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return record, path, header
+
+
+@router.get("/{filename}/tiles", response_model=TilePyramid)
+async def get_tile_pyramid(filename: str, frame: int = Query(0, ge=0)):
+    """获取单帧的多分辨率瓦片金字塔描述（首次访问时构建并缓存）"""
+    _, _, header = await _load_pyramid(filename, frame)
+    window = header["window"] or [None, None]
+    return TilePyramid(
+        filename=filename,
+        frame=frame,
+        frame_count=header["frame_count"],
+        tile_size=header["tile_size"],
+        dtype=header["dtype"],
+        samples_per_pixel=header["samples_per_pixel"],
+        rescale_slope=header["rescale_slope"],
+        rescale_intercept=header["rescale_intercept"],
+        window_center=window[0],
+        window_width=window[1],
+        levels=[
+            TileLevel(
+                level=level,
+                width=info["width"],
+                height=info["height"],
+                tiles_x=info["tiles_x"],
+                tiles_y=info["tiles_y"],
+                downsample=2 ** level
+            )
+            for level, info in enumerate(header["levels"])
+        ]
+    )
+
+
+@router.get("/{filename}/tiles/{level}/{x}/{y}")
+async def get_tile(
+    filename: str,
+    level: int,
+    x: int,
+    y: int,
+    request: Request,
+    frame: int = Query(0, ge=0),
+    format: Optional[str] = Query(None, regex="^(raw|png|webp)$"),
+    wc: Optional[float] = None,
+    ww: Optional[float] = Query(None, gt=0)
+):
+    """
+    获取单个瓦片（层级0为原始分辨率，x/y为瓦片列/行号）
+    - format=raw 返回原始像素（像素属性在响应头中），png/webp 按金字塔默认窗或 wc/ww 渲染
+    """
+    record, path, header = await _load_pyramid(filename, frame)
+    etag = f'"{record["sha256"]}-{frame}-{level}-{x}-{y}-{format or "auto"}-{wc}-{ww}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.FILE_CACHE_MAX_AGE}",
+        "Vary": "Accept"
+    }
+    if _not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        tile = await io_executor.run(tile_service.read_tile, path, header, level, x, y)
+    except IndexError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    if format == "raw":
+        headers.update({
+            "X-Rows": str(tile.shape[0]),
+            "X-Columns": str(tile.shape[1]),
+            "X-Samples-Per-Pixel": str(header["samples_per_pixel"]),
+            "X-Dtype": header["dtype"],
+            "X-Rescale-Slope": str(header["rescale_slope"]),
+            "X-Rescale-Intercept": str(header["rescale_intercept"])
+        })
+        return Response(np.ascontiguousarray(tile).tobytes(), media_type="application/octet-stream", headers=headers)
+
+    fmt = _negotiate_format(request, format)
+    window = (wc, ww) if wc is not None and ww else None
+    content = await cpu_executor.run(tile_service.encode_tile, tile, header, fmt, window)
+    return Response(content, media_type=render_service.MEDIA_TYPES[fmt], headers=headers)
+
+
+@router.get("/{filename}/frames/{index}")
+async def get_file_frame(filename: str, index: int):
+    """获取单个文件中的一帧（DICOM多帧）或一层（NIfTI）像素"""
+    file_path, _ = await _resolve_file(filename)
+    return await _frame_response(file_path, index)
+
+
+async def _open_volume(filename: str) -> volume_store.Volume:
+    """打开已上传 NIfTI 的内存映射体积（首次访问时转换）"""
+    file_path, record = await _resolve_file(filename)
+    if record is None or not record["sha256"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="文件未找到"
+        )
+    if blob_store.file_extension(filename) not in (".nii", ".nii.gz"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="仅支持NIfTI文件")
+    try:
+        return await io_executor.run(volume_store.open_volume, file_path, record["sha256"], timeout=None)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/{filename}/volume")
+async def get_volume_info(filename: str):
+    """NIfTI 体积信息：形状、数据类型、仿射矩阵、体素间距与缩放参数"""
+    volume = await _open_volume(filename)
+    return volume.info()
+
+
+@router.get("/{filename}/volume/roi")
+async def get_volume_roi(
+    filename: str,
+    i0: int = Query(0, ge=0), i1: Optional[int] = None,
+    j0: int = Query(0, ge=0), j1: Optional[int] = None,
+    k0: int = Query(0, ge=0), k1: Optional[int] = None,
+    volume: int = Query(0, ge=0)
+):
+    """
+    读取三维感兴趣区 [i0, i1) x [j0, j1) x [k0, k1) 的原始体素（未缩放，只读取所需页面）
+    - 省略上界表示到该维末尾；像素按 i 变化最快的顺序排列
+    - 响应头 X-Shape 为区域的 (i, j, k) 尺寸，X-Dtype 为数据类型
+    """
+    store = await _open_volume(filename)
+    shape = store.shape[:3]
+    start = (i0, j0, k0)
+    stop = tuple(shape[n] if bound is None else bound for n, bound in enumerate((i1, j1, k1)))
+    try:
+        roi = await io_executor.run(store.read_roi, start, stop, volume)
+    except IndexError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return Response(
+        roi.tobytes(order="F"),
+        media_type="application/octet-stream",
+        headers={
+            "X-Shape": ",".join(str(n) for n in roi.shape),
+            "X-Dtype": roi.dtype.str,
+            "X-Rescale-Slope": str(store.slope),
+            "X-Rescale-Intercept": str(store.intercept),
+            "Cache-Control": f"private, max-age={settings.FILE_CACHE_MAX_AGE}"
+        }
+    )
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """管理接口鉴权：未配置 ADMIN_TOKEN 时一律拒绝"""
+    if not settings.ADMIN_TOKEN or not secrets.compare_digest(x_admin_token or "", settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="无权访问管理接口")
+
+
+@router.post("/reconcile", dependencies=[Depends(require_admin)])
+async def reconcile_metadata_index():
+    """立即对账元数据索引（迁移平铺文件、重新解析变化的文件、清除已删除文件的记录）"""
+    await io_executor.run(reconcile_index, settings.UPLOAD_DIR, timeout=None)
+    return {"message": "对账完成"}
+
+
+@router.post("/gc", dependencies=[Depends(require_admin)])
+async def collect_garbage():
+    """回收未被引用的blob和过期的临时文件（遍历整个存储目录，在I/O线程池中执行）"""
+    return await io_executor.run(blob_store.collect_garbage, timeout=None)
+
+
+def _not_modified(request: Request, etag: str, mtime: Optional[float] = None) -> bool:
+    """判断条件请求是否命中缓存（If-None-Match 优先于 If-Modified-Since）"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and mtime is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
 #新增接口，实现前后端相连
 @router.get("/{filename}")
-async def get_dicom_file(filename: str):
-    file_path = settings.UPLOAD_DIR / filename
-    if not file_path.exists():
+async def get_dicom_file(filename: str, request: Request):
+    """获取影像文件：零拷贝文件响应，支持 Range、ETag/Last-Modified 条件请求和浏览器缓存"""
+    file_path, record = await _resolve_file(filename)
+    stat = await io_executor.run(file_path.stat)
+    # blob按内容寻址，直接用内容哈希作为强ETag
+    if record is not None and record["sha256"]:
+        etag = f'"{record["sha256"]}"'
+    else:
+        etag = f'"{int(stat.st_mtime)}-{stat.st_size}"'
+    media_type = "application/dicom" if file_path.name.lower().endswith(".dcm") else "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": f"private, max-age={settings.FILE_CACHE_MAX_AGE}",
+        "Accept-Ranges": "bytes"
+    }
+
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() in (etag, headers["Last-Modified"])):
+        try:
+            byte_range = parse_range_header(range_header, stat.st_size)
+        except RangeNotSatisfiable as e:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail=str(e),
+                headers={"Content-Range": f"bytes */{e.size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = content_range(start, end, stat.st_size)
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                iter_file_range(file_path, start, end, settings.STREAM_CHUNK_SIZE),
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=media_type,
+                headers=headers
+            )
+
+    return FileResponse(file_path, media_type=media_type, headers=headers, stat_result=stat)
+
+def _delete_file(filename: str, blob: Optional[str]) -> None:
+    database.delete_records([filename])
+    if blob:
+        blob_store.release_blob(blob)
+    else:
+        (settings.UPLOAD_DIR / Path(filename).name).unlink(missing_ok=True)
+
+
+@router.delete("/{filename}")
+async def delete_dicom_file(filename: str):
+    """删除文件名映射；blob不再被引用时一并删除"""
+    record = await io_executor.run(database.get_record, filename)
+    if record is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="文件未找到"
         )
-    with open(file_path, "rb") as file:
-        content = file.read()
-    return Response(content, media_type="application/dicom")
\ No newline at end of file
+    await io_executor.run(_delete_file, filename, record["blob"])
+    return {"message": f"{filename} 已删除"}
\ No newline at end of file
@@ -0,0 +1,101 @@
+import sqlite3
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from app.services.ai_metadata import metadata_cache
+from app.services.circuit_breaker import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, ai_breaker
+from app.services.executors import ExecutorBusyError, cpu_executor, io_executor
+from app.services.metrics import registry, ratio
+from app.services.pixel_cache import pixel_cache
+from app.services.profiler import profiler
+from app.services.result_cache import result_cache
+from app.services.structured_log import dropped_count
+
+router = APIRouter(tags=["监控"])
+
+# Prometheus 文本格式的 Content-Type
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# 解码像素缓存的统计需要查询共享索引，由 /metrics 在I/O线程池中读取后放在这里供采集器使用
+_pixel_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0, "entries": 0}
+
+
+def collect_caches():
+    pixels = _pixel_stats
+    caches = {"ai_result": result_cache.stats(), "ai_metadata": metadata_cache.stats(), "decoded_pixels": pixels}
+    yield "cache_hits_total", "counter", "缓存命中次数", [({"cache": name}, s["hits"]) for name, s in caches.items()]
+    yield "cache_misses_total", "counter", "缓存未命中次数", [({"cache": name}, s["misses"]) for name, s in caches.items()]
+    yield "cache_hit_ratio", "gauge", "缓存命中率（启动以来）", [
+        ({"cache": name}, ratio(s["hits"], s["misses"]))
+        for name, s in caches.items() if ratio(s["hits"], s["misses"]) is not None
+    ]
+    yield "cache_evictions_total", "counter", "缓存因超出预算被淘汰的条目数", [
+        ({"cache": "decoded_pixels"}, pixels["evictions"])
+    ]
+    yield "cache_bytes", "gauge", "缓存占用字节数", [({"cache": "decoded_pixels"}, pixels["bytes"])]
+    yield "cache_entries", "gauge", "缓存条目数", [({"cache": "decoded_pixels"}, pixels["entries"])]
+
+
+def collect_executors():
+    executors = {executor.name: executor.stats() for executor in (io_executor, cpu_executor)}
+    yield "executor_in_flight", "gauge", "执行器中正在执行或排队的任务数", [
+        ({"executor": name}, s["in_flight"]) for name, s in executors.items()
+    ]
+    yield "executor_rejected_total", "counter", "因排队超时被拒绝的任务数", [
+        ({"executor": name}, s["rejected"]) for name, s in executors.items()
+    ]
+
+
+def collect_breaker():
+    stats = ai_breaker.stats()
+    state = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1}.get(stats["state"], 2)
+    yield "ai_circuit_state", "gauge", "AI服务熔断器状态（0=关闭，1=半开，2=打开）", [({}, state)]
+    yield "ai_in_flight", "gauge", "正在进行的AI服务请求数", [({}, stats["in_flight"])]
+    yield "ai_circuit_trips_total", "counter", "熔断次数", [({}, stats["trips"])]
+
+
+def collect_logging():
+    yield "log_dropped_total", "counter", "异步日志队列已满时丢弃的日志条数", [({}, dropped_count())]
+
+
+registry.register_collector(collect_caches)
+registry.register_collector(collect_executors)
+registry.register_collector(collect_breaker)
+registry.register_collector(collect_logging)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus 格式的运行指标"""
+    try:
+        _pixel_stats.update(await io_executor.run(pixel_cache.stats))
+    except (ExecutorBusyError, OSError, sqlite3.Error):
+        # I/O线程池繁忙或共享索引不可读时沿用上次抓取的像素缓存统计，不让监控抓取失败
+        pass
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/metrics/caches")
+async def get_cache_stats():
+    """各缓存的统计（解码像素缓存的计数由所有进程共享）"""
+    return {
+        "ai_result": result_cache.stats(),
+        "ai_metadata": metadata_cache.stats(),
+        "decoded_pixels": await io_executor.run(pixel_cache.stats),
+    }
+
+
+@router.get("/metrics/profiles")
+async def list_profiles():
+    """最近的请求采样分析结果"""
+    return {"profiles": profiler.recent()}
+
+
+@router.get("/metrics/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str):
+    """折叠栈格式的采样结果（可用 flamegraph.pl / speedscope 查看）"""
+    profile = profiler.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="分析结果不存在")
+    return PlainTextResponse(profile.collapsed())
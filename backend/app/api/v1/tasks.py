@@ -1,12 +1,188 @@
-from fastapi import APIRouter
-from app.models.schemas import StatusResponse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.models.schemas import StatusResponse, JobSubmitResponse, JobStatusResponse
+from app.api.v1.ai import get_ai_client, check_file_type, check_modality, parse_patient_ids, spool_uploads
+from app.services.ai_proxy import cached_predict, fan_out_batch_predict
+from app.services.circuit_breaker import ai_breaker
+from app.services.executors import ExecutorBusyError, io_executor
+from app.services.upload_service import stream_to_temp, discard_upload, FileTooLargeError
+from app.tasks.process_tasks import job_queue, Job, QueueFullError, JOB_FINISHED_STATES
 
 router = APIRouter(tags=["任务管理"])
 
+# SSE 心跳间隔（秒）
+EVENT_KEEPALIVE_INTERVAL = 15.0
+
 @router.get("/status", response_model=StatusResponse)
 def check_status():
     """检查服务状态"""
     return StatusResponse(
         status="running",
         message="服务运行正常"
-    )
\ No newline at end of file
+    )
+
+
+def _submit(kind: str, handler, cleanup) -> JobSubmitResponse:
+    """提交任务，队列已满时返回503"""
+    try:
+        job = job_queue.submit(kind, handler, cleanup)
+    except QueueFullError as e:
+        cleanup()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return JobSubmitResponse(
+        job_id=job.job_id,
+        status=job.status,
+        queue_position=job_queue.queue_position(job)
+    )
+
+
+@router.post("/predict", response_model=JobSubmitResponse, status_code=202)
+async def submit_predict(
+    file: UploadFile = File(...),
+    modality: str = Form(...),
+    patient_id: Optional[str] = Form(None),
+    client: httpx.AsyncClient = Depends(get_ai_client)
+):
+    """提交肿瘤分析任务，立即返回任务ID"""
+    check_file_type(file.filename)
+    check_modality(modality)
+    ai_breaker.check()
+
+    try:
+        stored = await stream_to_temp(file)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    filename, content_type = file.filename, file.content_type
+
+    async def handler(job: Job):
+        job_queue.update(job, message="AI服务分析中")
+        response = await cached_predict(client, stored, filename, content_type, modality, patient_id)
+        if not response.success:
+            raise RuntimeError(response.error)
+        return response.dict()
+
+    return _submit("predict", handler, lambda: discard_upload(stored))
+
+
+@router.post("/batch_predict", response_model=JobSubmitResponse, status_code=202)
+async def submit_batch_predict(
+    files: List[UploadFile] = File(...),
+    modality: str = Form(...),
+    batch_name: Optional[str] = Form(None),
+    patient_ids: Optional[str] = Form(None),  # JSON字符串形式的patient_ids列表
+    client: httpx.AsyncClient = Depends(get_ai_client)
+):
+    """提交批量肿瘤分析任务，立即返回任务ID"""
+    patient_id_list = parse_patient_ids(patient_ids)
+    if len(files) == 0:
+        raise HTTPException(status_code=400, detail="No files provided")
+    check_modality(modality)
+    ai_breaker.check()
+
+    stored_files = await spool_uploads(files)
+    items = [
+        (file.filename, stored, file.content_type)
+        for file, stored in zip(files, stored_files)
+    ]
+
+    async def handler(job: Job):
+        job_queue.update(job, message=f"AI服务批量分析中（{len(items)}个文件）")
+
+        def on_progress(batch):
+            done = batch.completed + batch.failed
+            job_queue.update(
+                job,
+                progress=100.0 * done / batch.total,
+                message=f"AI服务批量分析中（{done}/{batch.total}，失败{batch.failed}）"
+            )
+
+        response = await fan_out_batch_predict(
+            client, items, modality, batch_name, patient_id_list, on_progress=on_progress
+        )
+        return response.dict()
+
+    def cleanup():
+        for stored in stored_files:
+            discard_upload(stored)
+
+    return _submit("batch_predict", handler, cleanup)
+
+
+async def _get_snapshot(job_id: str) -> Dict[str, Any]:
+    """任务状态快照（不在本进程时读取共享存储，在I/O线程池中执行）"""
+    snapshot = await io_executor.run(job_queue.snapshot, job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return snapshot
+
+
+def _format_event(snapshot: Dict[str, Any]) -> str:
+    """事件类型固定为 status（与分析会话的 SSE 一致），具体状态在数据的 status 字段中"""
+    return f"event: status\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+
+
+@router.get("/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    """查询任务状态（多 worker 时任务可能在其他 worker 上执行）"""
+    return JobStatusResponse(**await _get_snapshot(job_id))
+
+
+async def _local_events(job: Job):
+    """本进程内的任务：订阅进度事件"""
+    queue = job_queue.subscribe(job)
+    try:
+        while True:
+            try:
+                snapshot = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield _format_event(snapshot)
+            if snapshot["status"] in JOB_FINISHED_STATES:
+                break
+    finally:
+        job_queue.unsubscribe(job, queue)
+
+
+async def _shared_events(job_id: str, snapshot: Dict[str, Any]):
+    """其他 worker 上的任务：轮询共享状态，有变化时推送"""
+    yield _format_event(snapshot)
+    last_sent = time.monotonic()
+    while snapshot["status"] not in JOB_FINISHED_STATES:
+        await asyncio.sleep(settings.JOB_STORE_POLL_INTERVAL)
+        try:
+            latest = await io_executor.run(job_queue.snapshot, job_id)
+        except ExecutorBusyError:
+            # I/O线程池繁忙时跳过本次轮询
+            latest = snapshot
+        if latest is None:
+            break
+        if latest["updated_at"] != snapshot["updated_at"]:
+            snapshot = latest
+            yield _format_event(snapshot)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= EVENT_KEEPALIVE_INTERVAL:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """以SSE推送任务进度，任务结束后关闭连接"""
+    job = job_queue.get(job_id)
+    event_stream = _local_events(job) if job is not None else _shared_events(job_id, await _get_snapshot(job_id))
+
+    return StreamingResponse(
+        event_stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,4 +1,20 @@
+import os
 from pathlib import Path
+from typing import Any
+
+# 环境变量覆盖配置：变量名为前缀加配置名，如 BACKEND_SERVER_MODE=production、BACKEND_WORKERS=8
+ENV_PREFIX = "BACKEND_"
+
+
+def _parse_env(value: str, default: Any) -> Any:
+    """按默认值的类型解析环境变量"""
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, Path):
+        return Path(value)
+    if isinstance(default, tuple):
+        return tuple(item.strip() for item in value.split(",") if item.strip())
+    return type(default)(value)
 
 
 class Settings:
@@ -8,14 +24,136 @@ class Settings:
     HOST = "0.0.0.0"
     PORT = 8000
 
+    # 服务进程
+    SERVER_MODE = "development"  # development：单进程，DEBUG 时代码变更自动重载；production：预派生多个 worker 进程
+    WORKERS = 0  # 生产模式的 worker 进程数，0 表示与CPU核数相同
+    KEEP_ALIVE_TIMEOUT = 75  # HTTP 空闲连接保持时间（秒），需大于前置代理/负载均衡的空闲超时
+    LIMIT_CONCURRENCY = 1000  # 每个 worker 同时处理的连接与请求上限，超出直接返回503，0 表示不限
+    BACKLOG = 4096  # 监听队列长度（受内核 net.core.somaxconn 限制）
+    GRACEFUL_SHUTDOWN_TIMEOUT = 330  # 关闭时等待进行中的上传、预测和后台任务完成的时间（秒），略大于 AI_TIMEOUT_PREDICT
+    EVENT_LOOP = "auto"  # auto：已安装 uvloop 时使用，否则 asyncio
+    HTTP_PARSER = "auto"  # auto：已安装 httptools 时使用，否则 h11
+
     # 文件存储
     UPLOAD_DIR = Path("uploads")
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+    UPLOAD_FORM_OVERHEAD = 64 * 1024  # 单文件上传请求在文件之外允许的表单开销（边界、字段）
+    MAX_REQUEST_SIZE = 2 * 1024 * 1024 * 1024  # 多文件/压缩包上传等其他请求的请求体上限 2GB
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # 流式上传块大小 1MB
+    TEMP_DIR = UPLOAD_DIR / ".tmp"  # 上传临时目录（与上传目录同一文件系统，保证原子重命名）
+    BLOB_DIR = UPLOAD_DIR / "blobs"  # 内容寻址存储（按SHA-256两级分片）
+    BLOB_GC_ON_STARTUP = True  # 启动时回收未被引用的blob
+    ADMIN_TOKEN = ""  # 管理接口（如 POST /dicom/gc）的访问令牌，请求头 X-Admin-Token 携带；为空时禁用管理接口
+    FILE_CACHE_MAX_AGE = 24 * 3600  # 影像文件浏览器缓存时间（秒）
+
+    # 预览渲染（缩略图和关键层预览，按内容哈希缓存）
+    RENDER_DIR = UPLOAD_DIR / "renders"
+    RENDER_ON_UPLOAD = True  # 上传后在后台预先生成默认渲染
+    THUMBNAIL_SIZE = 128  # 缩略图最长边（像素）
+    PREVIEW_SIZE = 512  # 关键层预览最长边（像素）
+    TILE_SIZE = 256  # 瓦片金字塔的瓦片边长（像素）
+    VOLUME_HANDLE_CACHE = 32  # 每个进程保持打开的内存映射体积数（NIfTI 首次访问时解压为原始布局）
+    # 压缩DICOM解码结果缓存：所有进程共享（优先放在共享内存 /dev/shm），按字节预算LRU淘汰，0 表示不缓存
+    PIXEL_CACHE_DIR = Path("/dev/shm/medical-pixel-cache") if Path("/dev/shm").is_dir() else Path("data") / "pixel_cache"
+    PIXEL_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 预算上限 1GB
+    PIXEL_CACHE_FREE_FRACTION = 0.5  # 预算不超过所在文件系统可用空间（含缓存已占用部分）的比例，Docker 默认 /dev/shm 只有 64MB
+    SEGMENTATION_SLAB_SLICES = 32  # 分割掩码后处理每次读取的层数（决定内存占用）
+    MASK_DIR = UPLOAD_DIR / "masks"  # 分割结果紧凑格式缓存（按会话）
+    MASK_ENCODING = "auto"  # 紧凑格式编码：auto（二值层取 bitpack/rle 较小者）、bitpack、rle
+
+    # AI服务
+    AI_SERVICE_URL = "http://localhost:5002"
+    AI_MAX_CONNECTIONS = 100  # 连接池最大连接数
+    AI_MAX_KEEPALIVE_CONNECTIONS = 20  # 最大保持活动连接数
+    AI_KEEPALIVE_EXPIRY = 30.0  # 空闲连接保持时间（秒）
+    AI_CONNECT_TIMEOUT = 5.0
+    AI_TIMEOUT_DEFAULT = 10.0  # health/metadata/sessions 等轻量接口
+    AI_TIMEOUT_PREDICT = 300.0
+    AI_TIMEOUT_BATCH = 600.0
+    AI_TIMEOUT_DOWNLOAD = 60.0
+    STREAM_CHUNK_SIZE = 64 * 1024  # 流式代理块大小
+    AI_BATCH_CONCURRENCY = 4  # 批量预测同时向AI服务提交的文件数
+    AI_BATCH_RETRIES = 2  # 批量预测单项失败（连接错误/429/5xx）的重试次数
+    AI_RETRY_BACKOFF = 0.5  # 重试退避基数（秒），按 2^n 递增
+    AI_SESSION_POLL_INTERVAL = 2.0  # 推送会话进度时向AI服务轮询的间隔（秒）
+    AI_HEALTH_TTL = 10.0  # 健康状态缓存时间（秒）
+    AI_HEALTH_PROBE_INTERVAL = 5.0  # 后台健康探测间隔（秒），0 表示不探测
+    AI_METADATA_TTL = 60.0  # 支持的模态/模型信息缓存时间（秒）
+    AI_MODEL_INFO_STALE_TTL = 600.0  # 模型信息过期后仍可返回旧值并后台刷新的时间（秒）
+    AI_BREAKER_FAILURE_THRESHOLD = 5  # 连续失败多少次后熔断
+    AI_BREAKER_RESET_TIMEOUT = 10.0  # 熔断后多久放行探测请求（秒），探测失败时加倍
+    AI_BREAKER_MAX_RESET_TIMEOUT = 120.0
+    AI_MAX_IN_FLIGHT = 100  # 同时发往AI服务的请求上限，超出直接返回503（通常与连接池大小一致）
+    AI_ADAPTIVE_TIMEOUT_FACTOR = 4.0  # 读超时 = 近期p99延迟 × 系数（不超过路由配置的超时），0 表示关闭
+    AI_ADAPTIVE_TIMEOUT_MIN = 5.0  # 自适应读超时下限（秒）
+    AI_ADAPTIVE_TIMEOUT_SAMPLES = 20  # 样本数达到后才启用自适应超时
+    AI_ADAPTIVE_TIMEOUT_EXCLUDE = ("/predict", "/batch_predict")  # 耗时随上传大小变化的接口，始终使用路由配置的超时
+
+    # 日志配置
+    LOG_LEVEL = "INFO"
+    LOG_FORMAT = "json"  # json（结构化，每行一条）或 text
+    LOG_QUEUE_SIZE = 10000  # 异步日志队列长度，满时丢弃新日志而不阻塞
+    LOG_RATE_LIMIT = 10.0  # 每个调用位置每秒最多输出的 INFO/DEBUG 日志条数，0 表示不限流
+    LOG_SAMPLE_EVERY = 100  # 超出限流后每隔多少条保留一条
+
+    # 监控配置
+    EVENT_LOOP_LAG_INTERVAL = 0.5  # 事件循环延迟采样间隔（秒），0 表示不采样
+    PROFILE_ENABLED = False  # 是否允许请求级采样分析
+    PROFILE_HEADER = "X-Profile"  # 带此请求头的请求会被采样分析
+    PROFILE_SAMPLE_RATE = 0.0  # 随机抽样分析的请求比例
+    PROFILE_INTERVAL = 0.005  # 调用栈采样间隔（秒）
+    PROFILE_KEEP = 50  # 保留最近的分析结果数
+
+    # 后台任务队列
+    JOB_WORKERS = 4  # 同时向AI服务派发的任务数上限
+    JOB_QUEUE_SIZE = 100  # 等待队列长度上限，超出时拒绝提交
+    JOB_RESULT_TTL = 3600  # 已结束任务的结果保留时间（秒）
+    JOB_STORE_PATH = Path("data") / "jobs.db"  # 多 worker 时共享任务状态，任意 worker 都能查询
+    JOB_STORE_POLL_INTERVAL = 1.0  # 订阅其他 worker 上任务的进度时轮询共享状态的间隔（秒）
+    JOB_STORE_FLUSH_INTERVAL = 0.5  # 进度更新合并写入共享状态的间隔（秒）；提交和结束立即写入
+    JOB_PRUNE_INTERVAL = 60.0  # 清理过期任务的间隔（秒）
+
+    # 推理结果缓存（按文件内容哈希 + 模态 + 模型版本）
+    RESULT_CACHE_MAX_ENTRIES = 1024  # 内存LRU条目上限
+    RESULT_CACHE_DISK_MAX_ENTRIES = 100000  # 磁盘缓存条目上限
+    RESULT_CACHE_TTL = 7 * 24 * 3600  # 缓存有效期（秒）
+    RESULT_CACHE_DIR = Path("data") / "result_cache"
+
+    # 批量导入
+    INGEST_CONCURRENCY = 16  # 同时处理中的文件数上限（限制临时文件占用）
+
+    # DICOM执行器（阻塞的解析与像素计算移出事件循环）
+    IO_WORKERS = min(32, (os.cpu_count() or 1) + 4)  # 头部解析/索引线程数
+    IO_QUEUE_SIZE = 256  # I/O线程池排队上限
+    CPU_WORKERS = 0  # 每个 worker 的像素处理进程数，0 表示CPU核数按 worker 数均分
+    CPU_QUEUE_SIZE = 64  # 进程池排队上限
+    EXECUTOR_QUEUE_TIMEOUT = 10.0  # 排队名额的最长等待（秒），超时返回503
+
+    # 元数据索引
+    DATABASE_PATH = Path("data") / "metadata.db"
+    INDEX_RECONCILE_INTERVAL = 600.0  # 后台对账元数据索引与上传目录的间隔（秒），启动时先对账一次；0 表示只在启动时对账
+
+    @classmethod
+    def load_env(cls):
+        """用环境变量覆盖配置（由其他配置派生的路径需单独覆盖）"""
+        for name, default in list(vars(cls).items()):
+            if name.isupper() and ENV_PREFIX + name in os.environ:
+                setattr(cls, name, _parse_env(os.environ[ENV_PREFIX + name], default))
+
+    @classmethod
+    def worker_count(cls) -> int:
+        """服务 worker 进程数：开发模式为单进程"""
+        if cls.SERVER_MODE != "production":
+            return 1
+        return cls.WORKERS or os.cpu_count() or 1
 
     @classmethod
     def setup(cls):
         """初始化目录结构"""
         cls.UPLOAD_DIR.mkdir(exist_ok=True)
+        cls.TEMP_DIR.mkdir(parents=True, exist_ok=True)
+        cls.DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 
+Settings.load_env()
 settings = Settings()
\ No newline at end of file
@@ -1,15 +1,84 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.v1 import dicom, tasks, ai
+from app.api.v1 import dicom, tasks, ai, metrics
 from app.config import settings
-import uvicorn
+from app.models.database import init_db
+from app.services.ai_metadata import probe_health
+from app.services.ai_proxy import create_ai_client
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.blob_store import collect_garbage
+from app.services.dicom_service import reconcile_periodically
+from app.services.executors import ExecutorBusyError, shutdown_executors
+from app.services.metrics import MetricsMiddleware, monitor_event_loop
+from app.services.profiler import ProfilingMiddleware
+from app.services.structured_log import RequestIdMiddleware, setup_logging, shutdown_logging
+from app.services.session_watch import session_watcher
+from app.services.upload_service import UploadLimitMiddleware
+from starlette.concurrency import run_in_threadpool
+from app.tasks.process_tasks import job_queue
+from app.server import run
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：初始化存储、共享的AI服务客户端和后台任务队列"""
+    setup_logging()
+    settings.setup()
+    init_db()
+    if settings.BLOB_GC_ON_STARTUP:
+        await run_in_threadpool(collect_garbage)
+    app.state.ai_client = create_ai_client()
+    await job_queue.start()
+    # 元数据索引在后台对账，请求路径只查询索引
+    background = [asyncio.create_task(reconcile_periodically(settings.UPLOAD_DIR, settings.INDEX_RECONCILE_INTERVAL))]
+    if settings.AI_HEALTH_PROBE_INTERVAL > 0:
+        background.append(asyncio.create_task(probe_health(app.state.ai_client, settings.AI_HEALTH_PROBE_INTERVAL)))
+    if settings.EVENT_LOOP_LAG_INTERVAL > 0:
+        background.append(asyncio.create_task(monitor_event_loop(settings.EVENT_LOOP_LAG_INTERVAL)))
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        # 进行中的请求已由服务器排空，这里再等待已提交的后台预测任务完成
+        await job_queue.stop(timeout=settings.GRACEFUL_SHUTDOWN_TIMEOUT)
+        await session_watcher.stop()
+        await app.state.ai_client.aclose()
+        shutdown_executors()
+        shutdown_logging()
+
 
 app = FastAPI(
     title="医学影像分析系统",
     version=settings.VERSION,
-    description="肿瘤影像分析后端API"
+    description="肿瘤影像分析后端API",
+    lifespan=lifespan
 )
 
+@app.exception_handler(ExecutorBusyError)
+async def executor_busy_handler(request: Request, exc: ExecutorBusyError):
+    """执行器排队已满时返回503，提示客户端稍后重试"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """AI服务熔断或过载时快速返回503，不再排队等待超时"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 # 配置跨域中间件
 origins = [
     "*"
@@ -17,6 +86,18 @@ origins = [
     # else 可能d的地址
 ]
 
+# 单文件上传接口的请求体上限为文件上限加表单开销，批量/压缩包上传使用 MAX_REQUEST_SIZE
+single_upload_limit = settings.MAX_FILE_SIZE + settings.UPLOAD_FORM_OVERHEAD
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={
+        "/api/v1/dicom/upload": single_upload_limit,
+        "/api/v1/ai/predict": single_upload_limit,
+        "/api/v1/ai/segmentation/measure": single_upload_limit,
+        "/api/v1/tasks/predict": single_upload_limit,
+    },
+    default=settings.MAX_REQUEST_SIZE
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -24,20 +105,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 # 包含路由
 app.include_router(dicom.router, prefix="/api/v1/dicom")
 app.include_router(tasks.router, prefix="/api/v1/tasks")
 app.include_router(ai.router, prefix="/api/v1/ai")
-
-@app.on_event("startup")
-async def startup():
-    settings.setup()
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host=settings.HOST,
-        port=settings.PORT,
-        reload=settings.DEBUG
-    )
\ No newline at end of file
+    run()
\ No newline at end of file
@@ -0,0 +1,310 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.config import settings
+
+# 元数据索引表结构
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dicom_files (
+    filename TEXT PRIMARY KEY,
+    patient_id TEXT,
+    study_date TEXT,
+    modality TEXT,
+    additional_info TEXT,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    indexed_at TEXT NOT NULL,
+    sha256 TEXT,
+    blob TEXT,
+    study_uid TEXT,
+    series_uid TEXT,
+    instance_number INTEGER,
+    slice_position REAL,
+    number_of_frames INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_dicom_patient_id ON dicom_files(patient_id);
+CREATE INDEX IF NOT EXISTS idx_dicom_modality ON dicom_files(modality);
+CREATE INDEX IF NOT EXISTS idx_dicom_study_date ON dicom_files(study_date);
+CREATE TABLE IF NOT EXISTS pending_blobs (
+    token TEXT PRIMARY KEY,
+    blob TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pending_blob ON pending_blobs(blob);
+"""
+
+# 旧版本数据库需要补充的列
+_MIGRATIONS = {
+    "sha256": "ALTER TABLE dicom_files ADD COLUMN sha256 TEXT",
+    "blob": "ALTER TABLE dicom_files ADD COLUMN blob TEXT",
+    "study_uid": "ALTER TABLE dicom_files ADD COLUMN study_uid TEXT",
+    "series_uid": "ALTER TABLE dicom_files ADD COLUMN series_uid TEXT",
+    "instance_number": "ALTER TABLE dicom_files ADD COLUMN instance_number INTEGER",
+    "slice_position": "ALTER TABLE dicom_files ADD COLUMN slice_position REAL",
+    "number_of_frames": "ALTER TABLE dicom_files ADD COLUMN number_of_frames INTEGER",
+}
+_POST_MIGRATION = """
+CREATE INDEX IF NOT EXISTS idx_dicom_blob ON dicom_files(blob);
+CREATE INDEX IF NOT EXISTS idx_dicom_series ON dicom_files(series_uid, slice_position, instance_number);
+CREATE INDEX IF NOT EXISTS idx_dicom_study ON dicom_files(study_uid);
+"""
+
+# 可写入的元数据列（filename 为主键，indexed_at 自动生成）
+_RECORD_COLUMNS = [
+    "patient_id", "study_date", "modality", "additional_info", "mtime", "size", "sha256", "blob",
+    "study_uid", "series_uid", "instance_number", "slice_position", "number_of_frames",
+]
+# 更新时保留旧值的列（重新解析文件时不会提供）
+_STICKY_COLUMNS = {"sha256", "blob"}
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def init_db(db_path: Optional[Path] = None) -> None:
+    """初始化元数据索引数据库"""
+    global _initialized
+    path = db_path or settings.DATABASE_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _init_lock:
+        conn = sqlite3.connect(str(path), timeout=30.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            # 多个 worker 进程同时启动：先取得写锁再检查表结构，避免重复迁移
+            conn.execute("BEGIN IMMEDIATE")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(dicom_files)")}
+            added = [column for column in _MIGRATIONS if column not in columns]
+            for column in added:
+                conn.execute(_MIGRATIONS[column])
+            if added:
+                # 新增列需要重新解析已索引的文件，对账时会因mtime不一致而重新索引
+                conn.execute("UPDATE dicom_files SET mtime = -1")
+            conn.commit()
+            conn.executescript(_POST_MIGRATION)
+        finally:
+            conn.close()
+        _initialized = True
+
+
+@contextmanager
+def get_connection() -> Iterator[sqlite3.Connection]:
+    """获取数据库连接（每次调用独立连接，保证线程安全）"""
+    if not _initialized:
+        init_db()
+    conn = sqlite3.connect(str(settings.DATABASE_PATH), timeout=30.0)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def upsert_record(filename: str, **fields: Any) -> None:
+    """写入或更新单个文件的元数据（字段见 _RECORD_COLUMNS）"""
+    with get_connection() as conn:
+        _upsert(conn, filename, fields)
+
+
+def _upsert(conn: sqlite3.Connection, filename: str, fields: Dict[str, Any]) -> None:
+    values = {column: fields.get(column) for column in _RECORD_COLUMNS}
+    if values["additional_info"] is not None:
+        values["additional_info"] = json.dumps(values["additional_info"], ensure_ascii=False)
+    values["indexed_at"] = datetime.now().isoformat()
+
+    columns = list(values)
+    updates = ",\n            ".join(
+        f"{column} = COALESCE(excluded.{column}, dicom_files.{column})"
+        if column in _STICKY_COLUMNS else f"{column} = excluded.{column}"
+        for column in columns
+    )
+    conn.execute(
+        f"""
+        INSERT INTO dicom_files (filename, {", ".join(columns)})
+        VALUES ({", ".join("?" * (len(columns) + 1))})
+        ON CONFLICT(filename) DO UPDATE SET
+            {updates}
+        """,
+        [filename] + [values[column] for column in columns],
+    )
+
+
+def _candidate_names(filename: str) -> Iterator[str]:
+    """生成不冲突的候选文件名: name.dcm, name_1.dcm, name_2.dcm ..."""
+    lower = filename.lower()
+    split = len(filename) - len(".nii.gz") if lower.endswith(".nii.gz") else filename.rfind(".")
+    stem, ext = (filename[:split], filename[split:]) if split > 0 else (filename, "")
+    yield filename
+    index = 1
+    while True:
+        yield f"{stem}_{index}{ext}"
+        index += 1
+
+
+def register_upload(filename: str, sha256: str, blob: str, **fields: Any) -> str:
+    """登记上传文件的名称到blob映射，同名不同内容时自动改名，返回最终文件名"""
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for candidate in _candidate_names(filename):
+            row = conn.execute("SELECT sha256 FROM dicom_files WHERE filename = ?", (candidate,)).fetchone()
+            # 旧记录（尚未迁移到blob存储）没有sha256，可直接认领
+            if row is None or row["sha256"] in (None, sha256):
+                _upsert(conn, candidate, dict(fields, sha256=sha256, blob=blob))
+                return candidate
+
+
+def delete_records(filenames: List[str]) -> None:
+    """删除索引中的文件记录"""
+    if not filenames:
+        return
+    with get_connection() as conn:
+        conn.executemany("DELETE FROM dicom_files WHERE filename = ?", [(name,) for name in filenames])
+
+
+def get_file_stats() -> Dict[str, Tuple[Optional[str], float, int]]:
+    """获取索引中所有文件的 (blob, mtime, size)，用于增量对账"""
+    with get_connection() as conn:
+        rows = conn.execute("SELECT filename, blob, mtime, size FROM dicom_files").fetchall()
+    return {row["filename"]: (row["blob"], row["mtime"], row["size"]) for row in rows}
+
+
+def get_record(filename: str) -> Optional[dict]:
+    """按文件名获取索引记录"""
+    with get_connection() as conn:
+        row = conn.execute("SELECT * FROM dicom_files WHERE filename = ?", (filename,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def blob_ref_count(blob: str) -> int:
+    """blob被引用的次数"""
+    with get_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM dicom_files WHERE blob = ?", (blob,)).fetchone()[0]
+
+
+@contextmanager
+def blob_lock() -> Iterator[sqlite3.Connection]:
+    """blob 删除与预留的跨进程互斥（数据库写锁）：检查引用并删除文件必须在锁内完成"""
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+
+def blob_in_use(conn: sqlite3.Connection, blob: str) -> bool:
+    """blob 被文件名引用或被进行中的上传预留"""
+    return conn.execute(
+        "SELECT EXISTS(SELECT 1 FROM dicom_files WHERE blob = ?) OR EXISTS(SELECT 1 FROM pending_blobs WHERE blob = ?)",
+        (blob, blob),
+    ).fetchone()[0] == 1
+
+
+def add_pending_blob(blob: str) -> str:
+    """预留blob（登记引用之前不会被回收），返回预留令牌"""
+    token = uuid.uuid4().hex
+    with blob_lock() as conn:
+        conn.execute("INSERT INTO pending_blobs (token, blob, created) VALUES (?, ?, ?)", (token, blob, time.time()))
+    return token
+
+
+def remove_pending_blob(token: str) -> None:
+    with get_connection() as conn:
+        conn.execute("DELETE FROM pending_blobs WHERE token = ?", (token,))
+
+
+def pending_blobs() -> Set[str]:
+    with get_connection() as conn:
+        rows = conn.execute("SELECT DISTINCT blob FROM pending_blobs").fetchall()
+    return {row["blob"] for row in rows}
+
+
+def expire_pending_blobs(max_age: float) -> None:
+    """清除进程崩溃后残留的预留"""
+    with get_connection() as conn:
+        conn.execute("DELETE FROM pending_blobs WHERE created < ?", (time.time() - max_age,))
+
+
+def referenced_blobs() -> Set[str]:
+    """所有被引用的blob"""
+    with get_connection() as conn:
+        rows = conn.execute("SELECT DISTINCT blob FROM dicom_files WHERE blob IS NOT NULL").fetchall()
+    return {row["blob"] for row in rows}
+
+
+def query_series(study_uid: Optional[str] = None) -> List[dict]:
+    """按 Study/Series UID 分组汇总已索引的DICOM实例"""
+    where = "WHERE series_uid IS NOT NULL"
+    params: list = []
+    if study_uid is not None:
+        where += " AND study_uid = ?"
+        params.append(study_uid)
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT study_uid, series_uid,
+                   MAX(patient_id) AS patient_id, MAX(modality) AS modality, MAX(study_date) AS study_date,
+                   COUNT(*) AS instance_count, SUM(COALESCE(number_of_frames, 1)) AS frame_count
+            FROM dicom_files {where}
+            GROUP BY study_uid, series_uid
+            ORDER BY study_uid, series_uid
+            """,
+            params,
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_series_instances(series_uid: str) -> List[dict]:
+    """获取序列内的实例，按空间位置（缺失时按InstanceNumber）排序"""
+    with get_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT * FROM dicom_files WHERE series_uid = ?
+            ORDER BY slice_position IS NULL, slice_position, instance_number IS NULL, instance_number, filename
+            """,
+            (series_uid,),
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def query_records(
+    patient_id: Optional[str] = None,
+    modality: Optional[str] = None,
+    study_date: Optional[str] = None,
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> Tuple[List[dict], int]:
+    """按条件分页查询元数据，返回 (记录列表, 总数)"""
+    conditions = []
+    params: list = []
+    if patient_id is not None:
+        conditions.append("patient_id = ?")
+        params.append(patient_id)
+    if modality is not None:
+        conditions.append("modality = ?")
+        params.append(modality)
+    if study_date is not None:
+        conditions.append("study_date = ?")
+        params.append(study_date)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with get_connection() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM dicom_files {where}", params).fetchone()[0]
+        sql = f"SELECT * FROM dicom_files {where} ORDER BY filename LIMIT ? OFFSET ?"
+        rows = conn.execute(sql, params + [limit if limit is not None else -1, offset]).fetchall()
+
+    records = []
+    for row in rows:
+        record = dict(row)
+        if record["additional_info"] is not None:
+            record["additional_info"] = json.loads(record["additional_info"])
+        records.append(record)
+    return records, total
@@ -7,6 +7,8 @@ class UploadResponse(BaseModel):
     filename: str
     saved_path: str
     message: Optional[str] = None
+    size: Optional[int] = None  # 文件大小（字节）
+    sha256: Optional[str] = None  # 文件内容哈希
 
 class StatusResponse(BaseModel):
     """服务状态响应模型"""
@@ -19,11 +21,94 @@ class DicomResult(BaseModel):
     patient_id: Optional[str] = None
     study_date: Optional[str] = None
     modality: Optional[str] = None
+    study_instance_uid: Optional[str] = None
+    series_instance_uid: Optional[str] = None
+    instance_number: Optional[int] = None
+    slice_position: Optional[float] = None  # 沿切片法线方向的位置（mm）
+    number_of_frames: Optional[int] = None
     additional_info: Optional[dict] = None  # 可选字段，用于存储额外的信息
 
 class DicomResultsResponse(BaseModel):
     """多个DICOM文件处理结果"""
     results: List[DicomResult]
+    total: Optional[int] = None  # 符合筛选条件的总数
+    offset: int = 0
+    limit: Optional[int] = None
+
+class SeriesSummary(BaseModel):
+    """DICOM序列汇总"""
+    study_instance_uid: Optional[str] = None
+    series_instance_uid: str
+    patient_id: Optional[str] = None
+    modality: Optional[str] = None
+    study_date: Optional[str] = None
+    instance_count: int
+    frame_count: int
+
+class SeriesListResponse(BaseModel):
+    """DICOM序列列表"""
+    series: List[SeriesSummary]
+
+class SeriesInstance(BaseModel):
+    """序列中的单个实例"""
+    filename: str
+    instance_number: Optional[int] = None
+    slice_position: Optional[float] = None
+    frame_count: int
+    first_frame: int  # 该实例第一帧在序列中的全局索引
+
+class SeriesManifest(BaseModel):
+    """序列清单（实例按空间位置排序）"""
+    study_instance_uid: Optional[str] = None
+    series_instance_uid: str
+    patient_id: Optional[str] = None
+    modality: Optional[str] = None
+    frame_count: int
+    instances: List[SeriesInstance]
+
+class IngestFileResult(BaseModel):
+    """批量导入中单个文件的处理结果"""
+    filename: str  # 上传中的文件名（压缩包内为相对路径）
+    status: str  # stored / skipped / invalid / error
+    stored_as: Optional[str] = None  # 索引中的文件名（重名时自动改名）
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    series_instance_uid: Optional[str] = None
+    detail: Optional[str] = None
+
+class IngestResponse(BaseModel):
+    """批量导入报告"""
+    total_files: int
+    stored: int
+    skipped: int
+    failed: int
+    total_bytes: int
+    elapsed_seconds: float
+    throughput_mb_s: float
+    files: List[IngestFileResult]
+
+class TileLevel(BaseModel):
+    """瓦片金字塔的一层（层级0为原始分辨率）"""
+    level: int
+    width: int
+    height: int
+    tiles_x: int
+    tiles_y: int
+    downsample: int
+
+class TilePyramid(BaseModel):
+    """单帧的瓦片金字塔描述"""
+    filename: str
+    frame: int
+    frame_count: int
+    tile_size: int
+    dtype: str
+    samples_per_pixel: int
+    rescale_slope: float
+    rescale_intercept: float
+    window_center: Optional[float] = None
+    window_width: Optional[float] = None
+    levels: List[TileLevel]
 
 # AI服务相关模型
 class HealthCheckResponse(BaseModel):
@@ -95,15 +180,72 @@ class BatchPredictRequest(BaseModel):
     patient_ids: Optional[List[str]] = None
     batch_name: Optional[str] = None
 
+class BatchItemStatus(BaseModel):
+    """批量预测中单个文件的状态"""
+    index: int
+    filename: str
+    patient_id: Optional[str] = None
+    status: str = "pending"  # pending, running, succeeded, failed
+    session_id: Optional[str] = None
+    error: Optional[str] = None
+
 class BatchPredictResponse(BaseModel):
     """批量预测响应"""
     success: bool
     batch_id: str
     session_ids: List[str]
-    status: str  # pending, processing, completed, failed
+    status: str  # pending, processing, completed, partial, failed
     estimated_time: Optional[int] = None  # 估计完成时间（秒）
+    batch_name: Optional[str] = None
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    items: List[BatchItemStatus] = []
+
+class LesionMeasurement(BaseModel):
+    """后端本地从分割掩码计算的单个病灶测量（体素坐标为 (i, j, k)，毫米坐标为仿射变换后的世界坐标）"""
+    lesion_id: int  # 按体积从大到小编号
+    label: int  # 掩码中的类别标签
+    voxel_count: int
+    volume_mm3: float
+    centroid_voxel: List[float]
+    centroid_mm: List[float]
+    bbox_min: List[int]
+    bbox_max: List[int]
+    extent_mm: List[float]  # 包围盒沿各体素轴的长度
+    max_diameter_mm: float  # 三维最大径
+    axial_diameter_mm: float  # 层面内最大径（RECIST长径）
+    equivalent_diameter_mm: float  # 等体积球直径
+
+class SegmentationMeasurements(BaseModel):
+    """分割掩码的病灶测量结果"""
+    shape: List[int]
+    spacing: List[float]
+    connectivity: int
+    lesion_count: int
+    total_volume_mm3: float
+    lesions: List[LesionMeasurement]
 
 class DownloadRequest(BaseModel):
     """下载请求"""
     session_id: str
-    file_type: str  # segmentation, report, raw_output
\ No newline at end of file
+    file_type: str  # segmentation, report, raw_output
+
+# 后台任务相关模型
+class JobSubmitResponse(BaseModel):
+    """任务提交响应"""
+    job_id: str
+    status: str  # pending, running, completed, failed
+    queue_position: Optional[int] = None  # 等待队列中的位置
+
+class JobStatusResponse(BaseModel):
+    """任务状态"""
+    job_id: str
+    kind: str  # predict, batch_predict
+    status: str  # pending, running, completed, failed
+    progress: float  # 0-100
+    message: Optional[str] = None
+    result: Optional[Any] = None  # 完成后为 PredictResponse / BatchPredictResponse
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
\ No newline at end of file
@@ -0,0 +1,66 @@
+import importlib.util
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+import uvicorn
+
+from app.config import ENV_PREFIX, settings
+from app.models.database import init_db
+from app.services.blob_store import collect_garbage
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+SERVER_MODES = ("development", "production")
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def server_options() -> Dict[str, Any]:
+    """按配置生成 uvicorn 启动参数
+
+    生产模式预派生多个 worker 进程共享同一监听套接字；收到 SIGTERM/SIGINT 后停止接收新连接，
+    等待进行中的请求（上传、同步预测）完成，再由生命周期关闭阶段等待后台任务完成，各自最多
+    GRACEFUL_SHUTDOWN_TIMEOUT 秒。
+    """
+    if settings.SERVER_MODE not in SERVER_MODES:
+        raise ValueError(f"不支持的服务模式: {settings.SERVER_MODE}，可选 {list(SERVER_MODES)}")
+    production = settings.SERVER_MODE == "production"
+    loop = settings.EVENT_LOOP
+    if loop == "auto":
+        loop = "uvloop" if _available("uvloop") else "asyncio"
+    http = settings.HTTP_PARSER
+    if http == "auto":
+        http = "httptools" if _available("httptools") else "h11"
+    return {
+        "host": settings.HOST,
+        "port": settings.PORT,
+        "app_dir": str(BACKEND_DIR),
+        "loop": loop,
+        "http": http,
+        "workers": settings.worker_count(),
+        # 自动重载与多进程互斥，只在开发模式使用
+        "reload": settings.DEBUG and not production,
+        "timeout_keep_alive": settings.KEEP_ALIVE_TIMEOUT,
+        "limit_concurrency": settings.LIMIT_CONCURRENCY or None,
+        "backlog": settings.BACKLOG,
+        "timeout_graceful_shutdown": settings.GRACEFUL_SHUTDOWN_TIMEOUT or None,
+    }
+
+
+def run() -> None:
+    """启动服务（工作目录需为 backend，相对路径的存储目录以此为准）"""
+    options = server_options()
+    if options["workers"] > 1 and settings.BLOB_GC_ON_STARTUP:
+        # 启动时的回收在主进程中执行一次：worker 各自回收时，先启动的 worker 可能已在接收上传
+        settings.setup()
+        init_db()
+        collect_garbage()
+        os.environ[ENV_PREFIX + "BLOB_GC_ON_STARTUP"] = "false"
+    print(
+        f"服务模式: {settings.SERVER_MODE}，worker 进程数: {options['workers']}，"
+        f"事件循环: {options['loop']}，HTTP 解析: {options['http']}"
+    )
+    uvicorn.run("app.main:app", **options)
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict
+
+import httpx
+
+from app.config import settings
+from app.models.schemas import HealthCheckResponse
+from app.services.circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fetched_at: float
+
+
+class SingleFlightCache:
+    """短TTL缓存 + 单飞合并：同一键的并发未命中只触发一次上游请求，所有等待者共享结果
+
+    过期后在 stale_ttl 窗口内先返回旧值，同时在后台刷新（stale-while-revalidate）；
+    上游失败时不缓存，异常原样抛给本次所有等待者。
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, CacheEntry] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_served = 0
+
+    async def get(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: float,
+        stale_ttl: float = 0.0,
+    ) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < ttl:
+                self.hits += 1
+                return entry.value
+            if age < ttl + stale_ttl:
+                self.stale_served += 1
+                self._start(key, fetch)
+                return entry.value
+        self.misses += 1
+        return await self.refresh(key, fetch)
+
+    async def refresh(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """强制刷新（与进行中的刷新合并）"""
+        task = self._start(key, fetch)
+        # shield: 单个等待者被取消时不影响共享的上游请求
+        return await asyncio.shield(task)
+
+    def peek(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        return entry.value if entry is not None else None
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stale_served": self.stale_served,
+            "entries": len(self._entries),
+        }
+
+    def _start(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.create_task(self._run(key, fetch))
+        # 后台刷新（返回旧值时发起）可能没有等待者，读取结果以免失败时报告 "Task exception was never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = task
+        return task
+
+    async def _run(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+        except Exception as e:
+            logger.warning(f"刷新缓存失败: {key}: {e}")
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        self._entries[key] = CacheEntry(value=value, fetched_at=time.monotonic())
+        return value
+
+
+# AI服务元数据（健康状态、支持的模态、模型信息）
+metadata_cache = SingleFlightCache()
+
+
+async def fetch_health(client: httpx.AsyncClient) -> HealthCheckResponse:
+    """向AI服务查询健康状态；连接失败或异常时返回断开/错误状态而不是抛出异常"""
+    try:
+        response = await client.get("/health")
+        logger.debug(f"AI 服务健康检查响应: {response.status_code} {response.text}")
+        if response.status_code != 200:
+            logger.warning(f"AI 服务返回非200状态码: {response.status_code}")
+            return HealthCheckResponse(
+                status="disconnected",
+                timestamp=datetime.now().isoformat(),
+                service="AI Analysis Service",
+                version="unknown"
+            )
+        data = response.json()
+        try:
+            return HealthCheckResponse(**data)
+        except Exception as pydantic_error:
+            logger.warning(f"健康检查响应验证失败，按字段手动构造: {pydantic_error}")
+            return HealthCheckResponse(
+                status=data.get("status", "unknown"),
+                service=data.get("service"),
+                version=data.get("version"),
+                timestamp=data.get("timestamp", datetime.now().isoformat()),
+                gpu_available=data.get("gpu_available"),
+                model_loaded=data.get("model_loaded")
+            )
+    except (httpx.RequestError, CircuitOpenError) as e:
+        logger.warning(f"连接 AI 服务失败: {type(e).__name__}: {str(e)}")
+        return HealthCheckResponse(
+            status="disconnected",
+            timestamp=datetime.now().isoformat(),
+            service="AI Analysis Service",
+            version="unknown"
+        )
+    except Exception as e:
+        logger.error(f"处理 AI 健康检查时发生未知错误: {type(e).__name__}: {str(e)}")
+        return HealthCheckResponse(
+            status="error",
+            timestamp=datetime.now().isoformat(),
+            service="AI Analysis Service",
+            version="unknown"
+        )
+
+
+async def fetch_json(client: httpx.AsyncClient, path: str) -> Dict[str, Any]:
+    response = await client.get(path)
+    response.raise_for_status()
+    return response.json()
+
+
+async def get_health(client: httpx.AsyncClient) -> HealthCheckResponse:
+    """健康状态：通常由后台探测保持新鲜，请求直接读内存"""
+    return await metadata_cache.get("health", lambda: fetch_health(client), ttl=settings.AI_HEALTH_TTL)
+
+
+async def get_supported_modalities(client: httpx.AsyncClient) -> Dict[str, Any]:
+    return await metadata_cache.get(
+        "supported_modalities",
+        lambda: fetch_json(client, "/supported_modalities"),
+        ttl=settings.AI_METADATA_TTL
+    )
+
+
+async def get_model_info(client: httpx.AsyncClient) -> Dict[str, Any]:
+    """模型信息几乎不变：过期后先返回旧值并在后台刷新"""
+    return await metadata_cache.get(
+        "model_info",
+        lambda: fetch_json(client, "/model_info"),
+        ttl=settings.AI_METADATA_TTL,
+        stale_ttl=settings.AI_MODEL_INFO_STALE_TTL
+    )
+
+
+async def probe_health(client: httpx.AsyncClient, interval: float) -> None:
+    """后台定期探测AI服务健康状态并写入缓存"""
+    while True:
+        await metadata_cache.refresh("health", lambda: fetch_health(client))
+        await asyncio.sleep(interval)
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import uuid
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+from app.models.schemas import PredictResponse, BatchPredictResponse, BatchItemStatus
+from app.services.circuit_breaker import CircuitOpenError, GuardedTransport, ai_breaker, ai_timeouts
+from app.services.result_cache import result_cache
+from app.services.upload_service import StoredUpload, discard_upload
+
+logger = logging.getLogger(__name__)
+
+# 可重试的AI服务响应状态码（限流和暂时性服务端错误）
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def ai_timeout(seconds: float) -> httpx.Timeout:
+    """按路由构造超时配置（连接超时统一）"""
+    return httpx.Timeout(seconds, connect=settings.AI_CONNECT_TIMEOUT)
+
+
+def create_ai_client() -> httpx.AsyncClient:
+    """创建应用级共享的AI服务客户端（连接池 + keep-alive，所有请求经过熔断器）"""
+    limits = httpx.Limits(
+        max_connections=settings.AI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.AI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.AI_KEEPALIVE_EXPIRY
+    )
+    transport = GuardedTransport(httpx.AsyncHTTPTransport(limits=limits), ai_breaker, ai_timeouts)
+    return httpx.AsyncClient(
+        base_url=settings.AI_SERVICE_URL,
+        timeout=ai_timeout(settings.AI_TIMEOUT_DEFAULT),
+        transport=transport
+    )
+
+
+async def forward_predict(
+    client: httpx.AsyncClient,
+    path: Path,
+    filename: str,
+    content_type: Optional[str],
+    modality: str,
+    patient_id: Optional[str] = None,
+    retries: int = 0
+) -> PredictResponse:
+    """将已落盘的文件转发到AI服务进行单文件预测；连接错误和暂时性错误最多重试 retries 次（指数退避）"""
+    data = {
+        "modality": modality.upper(),
+        "patient_id": patient_id
+    }
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            logger.warning(f"AI服务预测重试 {attempt}/{retries}: {filename}: {failure.error}")
+            await asyncio.sleep(settings.AI_RETRY_BACKOFF * 2 ** (attempt - 1))
+        try:
+            # 发送到AI服务（从文件分块读取转发）
+            with open(path, "rb") as fh:
+                files = {"file": (filename, fh, content_type)}
+                response = await client.post(
+                    "/predict",
+                    files=files,
+                    data=data,
+                    timeout=ai_timeout(settings.AI_TIMEOUT_PREDICT)
+                )
+
+            if response.status_code == 200:
+                result_data = response.json()
+                return PredictResponse(
+                    success=True,
+                    session_id=result_data.get("session_id"),
+                    result=result_data.get("result")
+                )
+            error_detail = response.text
+            failure = PredictResponse(
+                success=False,
+                error=f"AI analysis failed: {error_detail}"
+            )
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                return failure
+
+        except httpx.RequestError as e:
+            failure = PredictResponse(
+                success=False,
+                error=f"Connection error: {str(e)}"
+            )
+        except CircuitOpenError:
+            # 熔断时不重试，交给调用方快速失败
+            raise
+        except Exception as e:
+            return PredictResponse(
+                success=False,
+                error=f"Unexpected error: {str(e)}"
+            )
+    return failure
+
+
+async def cached_predict(
+    client: httpx.AsyncClient,
+    stored: StoredUpload,
+    filename: str,
+    content_type: Optional[str],
+    modality: str,
+    patient_id: Optional[str] = None,
+    retries: int = 0
+) -> PredictResponse:
+    """带结果缓存的单文件预测：相同文件内容、模态和模型版本直接返回缓存结果"""
+    version = await result_cache.model_version(client)
+    key = (stored.sha256, modality.upper(), version) if version is not None else None
+
+    if key is not None:
+        cached = await result_cache.get(key)
+        if cached is not None:
+            response = PredictResponse(**cached)
+            # 患者ID只属于本次请求，未提供时也不能沿用缓存中的值
+            if response.result is not None:
+                response.result.patient_id = patient_id
+            return response
+
+    response = await forward_predict(client, stored.path, filename, content_type, modality, patient_id, retries)
+    if key is not None and response.success:
+        value = response.dict()
+        if value["result"] is not None:
+            value["result"]["patient_id"] = None
+        await result_cache.put(key, value)
+    return response
+
+
+async def fan_out_batch_predict(
+    client: httpx.AsyncClient,
+    items: List[Tuple[str, StoredUpload, Optional[str]]],
+    modality: str,
+    batch_name: Optional[str] = None,
+    patient_ids: Optional[List[str]] = None,
+    concurrency: Optional[int] = None,
+    on_progress: Optional[Callable[[BatchPredictResponse], None]] = None
+) -> BatchPredictResponse:
+    """批量预测：每个文件 (文件名, 落盘文件, content_type) 单独流式提交到AI服务
+
+    - 同时进行中的请求数受 concurrency 限制，失败项按 AI_BATCH_RETRIES 重试，单项失败不影响其他文件
+    - 结果逐项汇总到 BatchPredictResponse，每完成一项回调 on_progress
+    - 每项完成后立即删除其临时文件，批次越大也只占用有限的内存和连接
+    """
+    concurrency = concurrency or settings.AI_BATCH_CONCURRENCY
+    patient_ids = patient_ids or []
+    batch = BatchPredictResponse(
+        success=False,
+        batch_id=str(uuid.uuid4()),
+        batch_name=batch_name or f"batch_{len(items)}_files",
+        session_ids=[],
+        status="processing",
+        total=len(items),
+        items=[
+            BatchItemStatus(
+                index=index,
+                filename=filename,
+                patient_id=patient_ids[index] if index < len(patient_ids) else None
+            )
+            for index, (filename, _, _) in enumerate(items)
+        ]
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item: BatchItemStatus, stored: StoredUpload, content_type: Optional[str]) -> None:
+        try:
+            async with semaphore:
+                item.status = "running"
+                response = await cached_predict(
+                    client, stored, item.filename, content_type, modality, item.patient_id,
+                    retries=settings.AI_BATCH_RETRIES
+                )
+        except CircuitOpenError as e:
+            response = PredictResponse(success=False, error=str(e))
+        finally:
+            discard_upload(stored)
+
+        if response.success:
+            item.status = "succeeded"
+            item.session_id = response.session_id
+            batch.completed += 1
+        else:
+            item.status = "failed"
+            item.error = response.error
+            batch.failed += 1
+        if on_progress is not None:
+            on_progress(batch)
+
+    await asyncio.gather(*(
+        run(item, stored, content_type)
+        for item, (_, stored, content_type) in zip(batch.items, items)
+    ))
+
+    batch.session_ids = [item.session_id for item in batch.items if item.session_id]
+    batch.success = batch.failed == 0
+    if batch.failed == 0:
+        batch.status = "completed"
+    else:
+        batch.status = "failed" if batch.completed == 0 else "partial"
+    return batch
@@ -0,0 +1,384 @@
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import nibabel as nib
+import numpy as np
+
+from app.config import settings
+from app.models.schemas import LesionMeasurement, SegmentationMeasurements
+
+# 默认连通性：26 邻域（面、棱、角相邻都算同一病灶）；6 为仅面相邻
+DEFAULT_CONNECTIVITY = 26
+
+# 最大径按固定方向上的投影跨度近似（方向越多越精确，64 个方向时最大相对误差约 2%，只会偏小）
+FERET_DIRECTIONS = 64
+AXIAL_DIRECTIONS = 32
+
+# 每个连通性的前向邻居行偏移 (dk, dj) 和行内允许的错位体素数
+NEIGHBOR_OFFSETS = {
+    6: (((0, 1), (1, 0)), 0),
+    26: (((0, 1), (1, -1), (1, 0), (1, 1)), 1),
+}
+
+
+def hemisphere_directions(count: int) -> np.ndarray:
+    """半球面上近似均匀分布的单位方向（Fibonacci 点阵），形状 (3, count)"""
+    index = np.arange(count) + 0.5
+    z = 1 - index / count
+    radius = np.sqrt(1 - z * z)
+    theta = np.pi * (1 + 5 ** 0.5) * index
+    return np.stack([radius * np.cos(theta), radius * np.sin(theta), z])
+
+
+def plane_directions(affine: np.ndarray, count: int) -> np.ndarray:
+    """层面（i, j 轴张成的平面）内的单位方向（毫米空间），形状 (3, count)"""
+    u = affine[:3, 0] / (np.linalg.norm(affine[:3, 0]) or 1.0)
+    v = affine[:3, 1] - np.dot(affine[:3, 1], u) * u
+    v = v / (np.linalg.norm(v) or 1.0)
+    theta = np.pi * np.arange(count) / count
+    return np.outer(u, np.cos(theta)) + np.outer(v, np.sin(theta))
+
+
+def extract_runs(slab: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """提取 (k, j, i) 顺序层块中每行的非零行程，返回 (k, j, 起点i, 终点i(不含), 标签值)
+
+    结果按 (k, j, 起点) 排序；标签值变化处视为新行程。
+    """
+    depth, rows, columns = slab.shape
+    padded = np.zeros((depth, rows, columns + 2), dtype=slab.dtype)
+    padded[:, :, 1:-1] = slab
+    k, j, boundary = np.nonzero(padded[:, :, 1:] != padded[:, :, :-1])
+    values = padded[k, j, boundary + 1]
+    # 每个非零起点之后的下一个边界就是该行程的终点（行尾填充的 0 保证行程不跨行）
+    starts = np.flatnonzero(values != 0)
+    return k[starts], j[starts], boundary[starts], boundary[starts + 1], values[starts].astype(np.int64)
+
+
+def run_edges(
+    row: np.ndarray,
+    j: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    value: np.ndarray,
+    rows: int,
+    width: int,
+    connectivity: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """相邻行程对：在目标行中用二分查找定位与当前行程重叠的行程区间（行程按 (行, 起点) 排序）"""
+    offsets, tolerance = NEIGHBOR_OFFSETS[connectivity]
+    key_start = row * width + start
+    key_end = row * width + end
+    sources, targets = [], []
+    for dk, dj in offsets:
+        valid = np.flatnonzero((j + dj >= 0) & (j + dj < rows))
+        target_row = row[valid] + dk * rows + dj
+        low = np.searchsorted(key_end, target_row * width + start[valid] - tolerance, side="right")
+        high = np.searchsorted(key_start, target_row * width + end[valid] + tolerance, side="left")
+        counts = np.maximum(high - low, 0)
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        source = np.repeat(valid, counts)
+        offset_in_range = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        target = np.repeat(low, counts) + offset_in_range
+        same = value[source] == value[target]
+        sources.append(source[same])
+        targets.append(target[same])
+    if not sources:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+def connected_roots(count: int, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """并查集的向量化实现：沿边传播最小编号并做指针跳跃，返回每个节点所在分量的最小节点编号"""
+    labels = np.arange(count)
+    while len(u):
+        hooked = labels.copy()
+        smaller = np.minimum(labels[u], labels[v])
+        np.minimum.at(hooked, labels[u], smaller)
+        np.minimum.at(hooked, labels[v], smaller)
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, labels):
+            break
+        labels = hooked
+    return labels
+
+
+def _resolve(parent: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    while True:
+        up = parent[ids]
+        if np.array_equal(up, ids):
+            return ids
+        ids = up
+
+
+def _group_extent(keys: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """按键分组求每列的最小/最大值，返回 (唯一键, 最小值, 最大值)"""
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[first], np.minimum.reduceat(values, first), np.maximum.reduceat(values, first)
+
+
+class LesionAccumulator:
+    """分割掩码的病灶测量：逐层块累加每个病灶的体积、包围盒、质心和直径
+
+    掩码按 (i, j, k) 体素顺序（与 NIfTI/仿射矩阵一致）逐层块提供，内存占用与层块大小成正比，与体数据大小无关。
+    连通域标记基于行程编码：每行连续的同值体素是一个行程，相邻行/层中重叠且标签相同的行程属于同一病灶，
+    统计量按行程累加而不逐体素计算；跨层块的连通关系通过上一层块最后一层的行程传递。
+    """
+
+    def __init__(self, affine: np.ndarray, connectivity: int = DEFAULT_CONNECTIVITY):
+        if connectivity not in NEIGHBOR_OFFSETS:
+            raise ValueError(f"不支持的连通性: {connectivity}，可选 {sorted(NEIGHBOR_OFFSETS)}")
+        self.affine = np.asarray(affine, dtype=np.float64)
+        self.connectivity = connectivity
+        self.directions = hemisphere_directions(FERET_DIRECTIONS)
+        self.axial_directions = plane_directions(self.affine, AXIAL_DIRECTIONS)
+        self._size = 0
+        self._capacity = 0
+        self._carry: Optional[Tuple[np.ndarray, ...]] = None
+        self._axial: List[Tuple[np.ndarray, ...]] = []
+        self._allocate(1024)
+
+    def _allocate(self, capacity: int) -> None:
+        def grow(name: str, shape: tuple, fill, dtype) -> None:
+            array = np.full((capacity,) + shape, fill, dtype=dtype)
+            if self._capacity:
+                array[:self._capacity] = getattr(self, name)
+            setattr(self, name, array)
+
+        big = np.iinfo(np.int64).max
+        grow("parent", (), 0, np.int64)
+        self.parent[self._capacity:] = np.arange(self._capacity, capacity)
+        grow("label", (), 0, np.int64)
+        grow("count", (), 0, np.int64)
+        grow("sums", (3,), 0, np.int64)
+        grow("bbox_min", (3,), big, np.int64)
+        grow("bbox_max", (3,), -1, np.int64)
+        grow("proj_min", (FERET_DIRECTIONS,), np.inf, np.float64)
+        grow("proj_max", (FERET_DIRECTIONS,), -np.inf, np.float64)
+        self._capacity = capacity
+
+    def _new_ids(self, count: int) -> np.ndarray:
+        if self._size + count > self._capacity:
+            self._allocate(max(self._capacity * 2, self._size + count))
+        ids = np.arange(self._size, self._size + count)
+        self._size += count
+        return ids
+
+    def _to_mm(self, i: np.ndarray, j: np.ndarray, k: np.ndarray) -> np.ndarray:
+        voxels = np.stack([i, j, k]).astype(np.float64)
+        return (self.affine[:3, :3] @ voxels).T + self.affine[:3, 3]
+
+    def add_slab(self, k0: int, slab: np.ndarray) -> None:
+        """累加一个层块：slab 形状 (i, j, 层数)，k0 为首层的层号（须按顺序、无间隔地提供）"""
+        slab = np.ascontiguousarray(np.asarray(slab).transpose(2, 1, 0))
+        depth, rows, columns = slab.shape
+        k, j, start, end, value = extract_runs(slab)
+
+        # 上一层块最后一层的行程放在本层块之前（局部层号 -1），用于跨层块连通
+        carry_count = 0
+        if self._carry is not None:
+            carry_j, carry_start, carry_end, carry_value, carry_ids = self._carry
+            carry_count = len(carry_j)
+            k = np.concatenate([np.full(carry_count, -1), k])
+            j = np.concatenate([carry_j, j])
+            start = np.concatenate([carry_start, start])
+            end = np.concatenate([carry_end, end])
+            value = np.concatenate([carry_value, value])
+
+        total = len(k)
+        row = (k + 1) * rows + j
+        u, v = run_edges(row, j, start, end, value, rows, columns + 2, self.connectivity)
+
+        # 上一层块的全局编号作为额外节点参与连通：同一全局分量的多个行程在本层块中不相邻时也能正确合并
+        known = np.empty(0, dtype=np.int64)
+        if carry_count:
+            known, carry_index = np.unique(_resolve(self.parent, carry_ids), return_inverse=True)
+            u = np.concatenate([u, np.arange(carry_count)])
+            v = np.concatenate([v, total + carry_index])
+        roots = connected_roots(total + len(known), u, v)
+
+        # 局部分量 -> 全局编号：含已有编号的分量取其中最小者（其余并入），其余分配新编号
+        root_ids = np.full(total + len(known), -1, dtype=np.int64)
+        if len(known):
+            known_roots = roots[total:]
+            merged = np.full(total + len(known), np.iinfo(np.int64).max, dtype=np.int64)
+            np.minimum.at(merged, known_roots, known)
+            self.parent[known] = merged[known_roots]
+            root_ids[known_roots] = merged[known_roots]
+        run_roots = roots[carry_count:total]
+        fresh = np.unique(run_roots[root_ids[run_roots] < 0])
+        root_ids[fresh] = self._new_ids(len(fresh))
+
+        ids = root_ids[run_roots]
+        k = k[carry_count:] + k0
+        j, start, end, value = j[carry_count:], start[carry_count:], end[carry_count:], value[carry_count:]
+        length = end - start
+        self.label[ids] = value
+        np.add.at(self.count, ids, length)
+        np.add.at(self.sums, ids, np.stack([(start + end - 1) * length // 2, j * length, k * length], axis=1))
+        np.minimum.at(self.bbox_min, ids, np.stack([start, j, k], axis=1))
+        np.maximum.at(self.bbox_max, ids, np.stack([end - 1, j, k], axis=1))
+
+        # 行程两端点包含病灶凸包的所有顶点，最大径只需在端点上计算
+        endpoints = self._to_mm(np.concatenate([start, end - 1]), np.tile(j, 2), np.tile(k, 2))
+        endpoint_ids = np.tile(ids, 2)
+        projection = endpoints @ self.directions
+        np.minimum.at(self.proj_min, endpoint_ids, projection)
+        np.maximum.at(self.proj_max, endpoint_ids, projection)
+        if len(ids):
+            keys = endpoint_ids * depth + np.tile(k - k0, 2)
+            keys, low, high = _group_extent(keys, endpoints @ self.axial_directions)
+            self._axial.append((keys // depth, keys % depth + k0, low, high))
+
+        last = k == k0 + depth - 1
+        self._carry = (j[last], start[last], end[last], value[last], ids[last])
+
+    def finish(self) -> List[LesionMeasurement]:
+        """合并跨层块的分量并计算每个病灶的测量结果（按体积从大到小编号）"""
+        if self._size == 0:
+            return []
+        roots = _resolve(self.parent[:self._size], np.arange(self._size))
+        lesion_roots, index = np.unique(roots, return_inverse=True)
+        lesion_count = len(lesion_roots)
+
+        count = np.zeros(lesion_count, dtype=np.int64)
+        sums = np.zeros((lesion_count, 3), dtype=np.int64)
+        bbox_min = np.full((lesion_count, 3), np.iinfo(np.int64).max, dtype=np.int64)
+        bbox_max = np.full((lesion_count, 3), -1, dtype=np.int64)
+        proj_min = np.full((lesion_count, FERET_DIRECTIONS), np.inf)
+        proj_max = np.full((lesion_count, FERET_DIRECTIONS), -np.inf)
+        np.add.at(count, index, self.count[:self._size])
+        np.add.at(sums, index, self.sums[:self._size])
+        np.minimum.at(bbox_min, index, self.bbox_min[:self._size])
+        np.maximum.at(bbox_max, index, self.bbox_max[:self._size])
+        np.minimum.at(proj_min, index, self.proj_min[:self._size])
+        np.maximum.at(proj_max, index, self.proj_max[:self._size])
+        label = self.label[lesion_roots]
+
+        # 轴位最大径：同一病灶同一层的端点可能来自合并前的不同分量，先按 (病灶, 层) 合并再取跨度
+        ids, slices, low, high = (np.concatenate(parts) for parts in zip(*self._axial))
+        slice_keys = index[ids] * (int(slices.max()) + 1) + slices
+        slice_keys, low, high = _group_extent(slice_keys, np.concatenate([low, high], axis=1))
+        width = (high[:, AXIAL_DIRECTIONS:] - low[:, :AXIAL_DIRECTIONS]).max(axis=1)
+        axial = np.zeros(lesion_count)
+        np.maximum.at(axial, slice_keys // (int(slices.max()) + 1), width)
+
+        voxel_volume = abs(float(np.linalg.det(self.affine[:3, :3])))
+        spacing = np.linalg.norm(self.affine[:3, :3], axis=0)
+        centroid = sums / count[:, None]
+        centroid_mm = centroid @ self.affine[:3, :3].T + self.affine[:3, 3]
+        diameter = (proj_max - proj_min).max(axis=1)
+        volume = count * voxel_volume
+
+        lesions = []
+        for rank, n in enumerate(np.argsort(-count, kind="stable"), start=1):
+            lesions.append(LesionMeasurement(
+                lesion_id=rank,
+                label=int(label[n]),
+                voxel_count=int(count[n]),
+                volume_mm3=round(float(volume[n]), 3),
+                centroid_voxel=centroid[n].round(3).tolist(),
+                centroid_mm=centroid_mm[n].round(3).tolist(),
+                bbox_min=bbox_min[n].tolist(),
+                bbox_max=bbox_max[n].tolist(),
+                extent_mm=((bbox_max[n] - bbox_min[n] + 1) * spacing).round(3).tolist(),
+                max_diameter_mm=round(float(diameter[n]), 3),
+                axial_diameter_mm=round(float(axial[n]), 3),
+                equivalent_diameter_mm=round(float((6 * volume[n] / np.pi) ** (1 / 3)), 3),
+            ))
+        return lesions
+
+
+def iter_array_slabs(volume: np.ndarray, slab_slices: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """内存中的 (i, j, k) 数组按层块产出视图"""
+    slab_slices = slab_slices or settings.SEGMENTATION_SLAB_SLICES
+    for k0 in range(0, volume.shape[2], slab_slices):
+        yield k0, volume[:, :, k0:k0 + slab_slices]
+
+
+def iter_nifti_slabs(img: nib.spatialimages.SpatialImage, slab_slices: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """NIfTI 掩码按层块读取（代理切片，只读取所需数据；4D 取第一个时间点）"""
+    slab_slices = slab_slices or settings.SEGMENTATION_SLAB_SLICES
+    shape = img.header.get_data_shape()
+    for k0 in range(0, shape[2], slab_slices):
+        k1 = min(k0 + slab_slices, shape[2])
+        slab = img.dataobj[:, :, k0:k1] if len(shape) == 3 else img.dataobj[:, :, k0:k1, 0]
+        yield k0, np.asarray(slab)
+
+
+def measure_lesions(
+    slabs: Iterable[Tuple[int, np.ndarray]],
+    affine: np.ndarray,
+    connectivity: int = DEFAULT_CONNECTIVITY,
+    threshold: Optional[float] = None,
+) -> List[LesionMeasurement]:
+    """从按层块产出的掩码计算病灶测量；整数掩码按标签值区分病灶类别，threshold 用于概率图二值化"""
+    accumulator = LesionAccumulator(affine, connectivity)
+    for k0, slab in slabs:
+        if threshold is not None:
+            slab = slab > threshold
+        elif not np.issubdtype(slab.dtype, np.integer) and slab.dtype != np.bool_:
+            slab = slab.astype(np.int64)
+        accumulator.add_slab(k0, slab)
+    return accumulator.finish()
+
+
+def measure_volume(
+    volume: np.ndarray,
+    affine: Optional[np.ndarray] = None,
+    connectivity: int = DEFAULT_CONNECTIVITY,
+    threshold: Optional[float] = None,
+    slab_slices: Optional[int] = None,
+) -> List[LesionMeasurement]:
+    """内存中的掩码（(i, j, k) 顺序），未给出仿射矩阵时按 1mm 各向同性处理"""
+    affine = np.eye(4) if affine is None else affine
+    return measure_lesions(iter_array_slabs(volume, slab_slices), affine, connectivity, threshold)
+
+
+def measure_nifti(
+    file_path: Path,
+    connectivity: int = DEFAULT_CONNECTIVITY,
+    threshold: Optional[float] = None,
+    slab_slices: Optional[int] = None,
+) -> SegmentationMeasurements:
+    """NIfTI 分割掩码文件：使用文件中的仿射矩阵（体素间距与方向）"""
+    try:
+        # 保持文件打开：.nii.gz 按层块顺序读取时继续解压，而不是每个层块都从头解压
+        img = nib.load(str(file_path), keep_file_open=True)
+    except (nib.filebasedimages.ImageFileError, OSError, EOFError) as e:
+        raise ValueError(f"无法读取NIfTI掩码: {e}")
+    shape = img.header.get_data_shape()
+    if len(shape) < 3:
+        raise ValueError(f"掩码维度不足: {shape}")
+    lesions = measure_lesions(iter_nifti_slabs(img, slab_slices), img.affine, connectivity, threshold)
+    spacing = np.linalg.norm(img.affine[:3, :3], axis=0)
+    return SegmentationMeasurements(
+        shape=list(shape[:3]),
+        spacing=spacing.round(6).tolist(),
+        connectivity=connectivity,
+        lesion_count=len(lesions),
+        total_volume_mm3=round(sum(lesion.volume_mm3 for lesion in lesions), 3),
+        lesions=lesions,
+    )
+
+
+def to_tumor_detection(lesion: LesionMeasurement, confidence: float = 1.0) -> Dict[str, object]:
+    """转换为与AI服务 TumorDetection 相同的结构，便于与远端返回的测量结果核对"""
+    return {
+        "tumor_id": f"lesion_{lesion.lesion_id}",
+        "location": {"centroid_mm": lesion.centroid_mm, "bbox_min": lesion.bbox_min, "bbox_max": lesion.bbox_max},
+        "size": {
+            "max_diameter_mm": lesion.max_diameter_mm,
+            "axial_diameter_mm": lesion.axial_diameter_mm,
+            "equivalent_diameter_mm": lesion.equivalent_diameter_mm,
+        },
+        "volume": lesion.volume_mm3,
+        "confidence": confidence,
+    }
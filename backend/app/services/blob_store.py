@@ -0,0 +1,209 @@
+import hashlib
+import logging
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, TypeVar
+
+from app.config import settings
+from app.models import database
+from app.services.upload_service import StoredUpload, commit_upload, discard_upload
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 支持的文件扩展名（按匹配优先级）
+SUPPORTED_EXTENSIONS = ['.nii.gz', '.nii', '.dcm']
+
+
+def file_extension(filename: str) -> Optional[str]:
+    """返回支持的扩展名（小写），不支持时返回 None"""
+    lower = filename.lower()
+    return next((ext for ext in SUPPORTED_EXTENSIONS if lower.endswith(ext)), None)
+
+
+def blob_key(sha256: str, extension: str) -> str:
+    """内容寻址的blob键：两级分片目录，保证单目录文件数有界"""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def blob_path(key: str) -> Path:
+    return settings.BLOB_DIR / key
+
+
+def blob_sha256(key: str) -> str:
+    """从blob键中取出内容哈希"""
+    return Path(key).name[:64]
+
+
+def stored_sha256(file_path: Path) -> Optional[str]:
+    """blob 存储中的文件可直接从路径得到内容哈希；其他文件（旧的平铺文件、临时文件）返回 None"""
+    try:
+        Path(file_path).resolve().relative_to(settings.BLOB_DIR.resolve())
+    except ValueError:
+        return None
+    return blob_sha256(Path(file_path).name)
+
+
+def render_dir(sha256: str) -> Path:
+    """按内容哈希存放的渲染缓存目录"""
+    return settings.RENDER_DIR / sha256[:2] / sha256
+
+
+def hash_file(path: Path, chunk_size: Optional[int] = None) -> str:
+    """分块计算文件SHA-256"""
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_blob(stored: StoredUpload, extension: str) -> str:
+    """将临时文件移入blob存储；内容已存在时直接丢弃临时文件（去重），返回blob键"""
+    key = blob_key(stored.sha256, extension)
+    dest = blob_path(key)
+    if dest.exists():
+        discard_upload(stored)
+    else:
+        commit_upload(stored, dest)
+    return key
+
+
+def store_upload(stored: StoredUpload, extension: str, register: Callable[[Path, str], Optional[T]]) -> Optional[T]:
+    """移入blob存储并登记引用（register 收到 blob 路径与键，返回 None 表示未登记）
+
+    登记完成前 blob 处于预留状态，并发的回收与 release_blob 不会删除它；未登记时按引用计数释放。
+    """
+    key = blob_key(stored.sha256, extension)
+    token = database.add_pending_blob(key)
+    result = None
+    try:
+        store_blob(stored, extension)
+        result = register(blob_path(key), key)
+    finally:
+        database.remove_pending_blob(token)
+        if result is None:
+            release_blob(key)
+    return result
+
+
+def resolve_file(filename: str) -> Optional[Path]:
+    """按文件名解析实际存储路径（兼容尚未迁移的平铺文件）"""
+    record = database.get_record(filename)
+    if record is not None and record["blob"]:
+        path = blob_path(record["blob"])
+        if path.exists():
+            return path
+    legacy = settings.UPLOAD_DIR / Path(filename).name
+    return legacy if legacy.is_file() else None
+
+
+def release_blob(key: str) -> bool:
+    """blob不再被引用（也未被预留）时删除，返回是否已删除"""
+    with database.blob_lock() as conn:
+        if database.blob_in_use(conn, key):
+            return False
+        blob_path(key).unlink(missing_ok=True)
+        shutil.rmtree(render_dir(blob_sha256(key)), ignore_errors=True)
+    return True
+
+
+def _sha256_in_use(conn, sha256: str) -> bool:
+    return any(database.blob_in_use(conn, blob_key(sha256, ext)) for ext in SUPPORTED_EXTENSIONS)
+
+
+def collect_garbage(temp_max_age: float = 3600.0) -> Dict[str, int]:
+    """回收未被引用的blob、过期的上传临时文件、失效的渲染缓存以及空的分片目录
+
+    先按引用快照筛出候选，删除前在 blob 锁内逐个复查，不会删除扫描期间刚登记或预留的 blob。
+    """
+    removed_blobs = 0
+    removed_bytes = 0
+    removed_temp = 0
+    removed_renders = 0
+    database.expire_pending_blobs(temp_max_age)
+    referenced = database.referenced_blobs() | database.pending_blobs()
+
+    if settings.BLOB_DIR.exists():
+        for path in settings.BLOB_DIR.glob("*/*/*"):
+            key = path.relative_to(settings.BLOB_DIR).as_posix()
+            if key in referenced or not path.is_file():
+                continue
+            with database.blob_lock() as conn:
+                if database.blob_in_use(conn, key):
+                    continue
+                try:
+                    size = path.stat().st_size
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+            removed_bytes += size
+            removed_blobs += 1
+
+        for shard in sorted(settings.BLOB_DIR.glob("*/*"), reverse=True) + sorted(settings.BLOB_DIR.glob("*")):
+            try:
+                shard.rmdir()  # 仅删除空目录
+            except OSError:
+                pass
+
+    if settings.RENDER_DIR.exists():
+        live = {blob_sha256(key) for key in referenced}
+        for path in settings.RENDER_DIR.glob("*/*"):
+            if path.name in live:
+                continue
+            with database.blob_lock() as conn:
+                if _sha256_in_use(conn, path.name):
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+            removed_renders += 1
+        for shard in settings.RENDER_DIR.glob("*"):
+            try:
+                shard.rmdir()
+            except OSError:
+                pass
+
+    if settings.TEMP_DIR.exists():
+        cutoff = time.time() - temp_max_age
+        for path in settings.TEMP_DIR.iterdir():
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed_temp += 1
+            except OSError:
+                pass
+
+    if removed_blobs or removed_temp or removed_renders:
+        logger.info(
+            f"垃圾回收: 删除 {removed_blobs} 个blob（{removed_bytes} 字节），"
+            f"{removed_temp} 个临时文件，{removed_renders} 组渲染缓存"
+        )
+    return {
+        "removed_blobs": removed_blobs,
+        "removed_bytes": removed_bytes,
+        "removed_temp_files": removed_temp,
+        "removed_renders": removed_renders,
+    }
+
+
+def ingest_legacy_file(file_path: Path, register: Callable[[Path, str, str], Optional[T]]) -> Optional[T]:
+    """将上传目录中的平铺文件迁移到blob存储（register 收到原路径、blob键与SHA-256）
+
+    先在原位置解析并登记，成功后才移入blob存储；无法解析的文件保留在原处，不会被回收。
+    登记与移动之间 resolve_file 会回退到原路径。
+    """
+    extension = file_extension(file_path.name)
+    if extension is None:
+        return None
+    stored = StoredUpload(path=file_path, size=file_path.stat().st_size, sha256=hash_file(file_path))
+    key = blob_key(stored.sha256, extension)
+    token = database.add_pending_blob(key)
+    try:
+        result = register(file_path, key, stored.sha256)
+        if result is not None:
+            store_blob(stored, extension)
+    finally:
+        database.remove_pending_blob(token)
+    return result
@@ -0,0 +1,273 @@
+import logging
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Iterable, Optional
+
+import httpx
+
+from app.config import settings
+from app.services.metrics import ai_upstream_errors, ai_upstream_seconds
+
+logger = logging.getLogger(__name__)
+
+# 视为AI服务故障的响应状态码（网关错误/过载）；其他 4xx/5xx 属于请求本身的问题
+FAILURE_STATUS_CODES = {502, 503, 504}
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """AI服务熔断或过载，请求被直接拒绝（不发往AI服务）"""
+
+    def __init__(self, reason: str, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f"AI服务暂不可用（{reason}），请 {retry_after} 秒后重试")
+
+
+class CircuitBreaker:
+    """AI服务熔断器 + 负载削减
+
+    - 关闭：正常放行，连续失败达到阈值后打开
+    - 打开：直接拒绝，等待 reset_timeout 后进入半开
+    - 半开：只放行一个探测请求，成功则关闭，失败则重新打开并加倍等待时间（不超过 max_reset_timeout）
+    - 任何状态下进行中的请求数超过 max_in_flight 时直接拒绝，避免请求在连接池中排队
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, max_reset_timeout: float, max_in_flight: int):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.max_in_flight = max_in_flight
+        self.state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._open_timeout = reset_timeout
+        self._opened_at = 0.0
+        self._probing = False
+        self._in_flight = 0
+        self._rejected = 0
+        self._trips = 0
+
+    def _retry_after(self) -> int:
+        remaining = self._opened_at + self._open_timeout - time.monotonic()
+        return max(1, math.ceil(remaining))
+
+    def check(self) -> None:
+        """不占用名额的快速检查：在接收上传、排队任务之前就拒绝注定失败的请求"""
+        if self.state == CIRCUIT_OPEN and time.monotonic() - self._opened_at < self._open_timeout:
+            raise CircuitOpenError("熔断中", self._retry_after())
+        if self._in_flight >= self.max_in_flight:
+            raise CircuitOpenError("请求过多", 1)
+
+    def acquire(self) -> bool:
+        """占用一个请求名额；返回该请求是否为半开状态下的探测请求"""
+        if self.state == CIRCUIT_OPEN:
+            if time.monotonic() - self._opened_at < self._open_timeout:
+                self._rejected += 1
+                raise CircuitOpenError("熔断中", self._retry_after())
+            self.state = CIRCUIT_HALF_OPEN
+            logger.info("AI服务熔断器进入半开状态，放行探测请求")
+        if self.state == CIRCUIT_HALF_OPEN:
+            if self._probing:
+                self._rejected += 1
+                raise CircuitOpenError("正在探测AI服务", 1)
+            self._probing = True
+            self._in_flight += 1
+            return True
+        if self._in_flight >= self.max_in_flight:
+            self._rejected += 1
+            raise CircuitOpenError("请求过多", 1)
+        self._in_flight += 1
+        return False
+
+    def release(self, success: Optional[bool], probe: bool) -> None:
+        """归还名额并记录结果；success 为 None 表示请求被取消，不计入成败"""
+        self._in_flight -= 1
+        if probe:
+            self._probing = False
+        if success is None:
+            return
+        if success:
+            self._failures = 0
+            if self.state != CIRCUIT_CLOSED:
+                logger.info("AI服务探测成功，熔断器关闭")
+                self.state = CIRCUIT_CLOSED
+                self._open_timeout = self.reset_timeout
+            return
+        self._failures += 1
+        if probe:
+            self._open(min(self._open_timeout * 2, self.max_reset_timeout))
+        elif self.state == CIRCUIT_CLOSED and self._failures >= self.failure_threshold:
+            self._open(self.reset_timeout)
+
+    def _open(self, timeout: float) -> None:
+        self.state = CIRCUIT_OPEN
+        self._open_timeout = timeout
+        self._opened_at = time.monotonic()
+        self._trips += 1
+        logger.warning(f"AI服务连续失败 {self._failures} 次，熔断 {timeout:g} 秒")
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "in_flight": self._in_flight,
+            "rejected": self._rejected,
+            "trips": self._trips,
+        }
+
+
+class AdaptiveTimeouts:
+    """按接口统计最近成功请求的延迟，读超时取 p99 × factor（不低于 minimum，不超过路由配置的超时）
+
+    AI服务变慢时，轻量接口在远小于配置上限的时间内失败。exclude 中的接口（预测等耗时随上传大小变化的接口）
+    不统计、不缩短超时，大文件请求不会被小文件的延迟分布截断。
+    """
+
+    def __init__(
+        self,
+        factor: float,
+        minimum: float,
+        min_samples: int,
+        window: int = 200,
+        exclude: Iterable[str] = ()
+    ):
+        self.factor = factor
+        self.minimum = minimum
+        self.min_samples = min_samples
+        self.window = window
+        self.exclude = frozenset(exclude)
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    def record(self, key: str, seconds: float) -> None:
+        if key in self.exclude:
+            return
+        samples = self._latencies.get(key)
+        if samples is None:
+            samples = self._latencies[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def read_timeout(self, key: str, configured: Optional[float]) -> Optional[float]:
+        samples = self._latencies.get(key)
+        if self.factor <= 0 or samples is None or len(samples) < self.min_samples:
+            return configured
+        ordered = sorted(samples)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        adaptive = max(self.minimum, p99 * self.factor)
+        return adaptive if configured is None else min(configured, adaptive)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return {key: self.read_timeout(key, None) for key in self._latencies}
+
+
+def route_key(path: str) -> str:
+    """按首段路径归类接口（/sessions/{id}/status -> /sessions）"""
+    return "/" + path.lstrip("/").split("/", 1)[0]
+
+
+def _client_side(error: httpx.TransportError, shortened: bool) -> bool:
+    """等待本地连接池超时、或被自适应超时提前截断，都是客户端自己的限制，不计为AI服务故障"""
+    return isinstance(error, httpx.PoolTimeout) or (isinstance(error, httpx.ReadTimeout) and shortened)
+
+
+class GuardedStream(httpx.AsyncByteStream):
+    """包装响应体：响应体读完或关闭时才归还名额并记录成败，流式下载全程计入进行中的请求，读取中途的上游故障也计入熔断"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[Optional[httpx.TransportError]], None]):
+        self._stream = stream
+        self._on_close = on_close
+        self._error: Optional[httpx.TransportError] = None
+        self._closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except httpx.TransportError as e:
+            self._error = e
+            raise
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close(self._error)
+
+
+class GuardedTransport(httpx.AsyncBaseTransport):
+    """包装AI服务客户端的传输层：所有经共享客户端发出的请求都经过熔断器和自适应超时
+
+    请求名额占用到响应体关闭为止（而不是收到响应头时），成败按状态码和响应体读取结果记录。
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, breaker: CircuitBreaker, timeouts: AdaptiveTimeouts):
+        self.transport = transport
+        self.breaker = breaker
+        self.timeouts = timeouts
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = route_key(request.url.path)
+        try:
+            probe = self.breaker.acquire()
+        except CircuitOpenError:
+            ai_upstream_errors.labels(key, "rejected").inc()
+            raise
+        timeout = request.extensions.get("timeout")
+        shortened = False
+        if timeout is not None:
+            read = self.timeouts.read_timeout(key, timeout.get("read"))
+            shortened = read != timeout.get("read")
+            request.extensions["timeout"] = {**timeout, "read": read}
+
+        start = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException as e:
+            success = None
+            if isinstance(e, httpx.TransportError):
+                if not _client_side(e, shortened):
+                    success = False
+                ai_upstream_errors.labels(key, type(e).__name__).inc()
+            self.breaker.release(success, probe)
+            raise
+
+        elapsed = time.monotonic() - start
+        ai_upstream_seconds.labels(key, response.status_code).observe(elapsed)
+        healthy = response.status_code not in FAILURE_STATUS_CODES
+        if healthy:
+            self.timeouts.record(key, elapsed)
+        else:
+            ai_upstream_errors.labels(key, response.status_code).inc()
+
+        def on_close(error: Optional[httpx.TransportError]) -> None:
+            success = healthy
+            if error is not None:
+                ai_upstream_errors.labels(key, type(error).__name__).inc()
+                success = None if _client_side(error, shortened) else False
+            self.breaker.release(success, probe)
+
+        response.stream = GuardedStream(response.stream, on_close)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+ai_breaker = CircuitBreaker(
+    failure_threshold=settings.AI_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.AI_BREAKER_RESET_TIMEOUT,
+    max_reset_timeout=settings.AI_BREAKER_MAX_RESET_TIMEOUT,
+    max_in_flight=settings.AI_MAX_IN_FLIGHT,
+)
+
+ai_timeouts = AdaptiveTimeouts(
+    factor=settings.AI_ADAPTIVE_TIMEOUT_FACTOR,
+    minimum=settings.AI_ADAPTIVE_TIMEOUT_MIN,
+    min_samples=settings.AI_ADAPTIVE_TIMEOUT_SAMPLES,
+    exclude=settings.AI_ADAPTIVE_TIMEOUT_EXCLUDE,
+)
@@ -1,13 +1,21 @@
+import asyncio
 import pydicom
+import struct
 from pathlib import Path
 from pydicom.errors import InvalidDicomError
+from pydicom.multival import MultiValue
+from pydicom.pixel_data_handlers.util import pixel_dtype
 import logging
-from typing import List, Dict, Optional
+import numpy as np
+from typing import Any, List, Dict, Optional, Tuple
+from app.models import database
+from app.services import blob_store, volume_store
+from app.services.executors import io_executor
+from app.services.pixel_cache import pixel_cache
 from app.models.schemas import DicomResult
+from app.services.metrics import parse_seconds
 import nibabel as nib
 
-# 设置日志记录
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 定义必需和可选标签
@@ -17,47 +25,89 @@ required_tags = {
     'Modality': False   # 可选
 }
 
+# 元数据解析所需的DICOM标签（仅读取这些标签，不加载像素数据）
+METADATA_TAGS = [
+    'PatientID', 'StudyDate', 'Modality', 'Rows', 'Columns',
+    'StudyInstanceUID', 'SeriesInstanceUID', 'InstanceNumber',
+    'ImagePositionPatient', 'ImageOrientationPatient', 'NumberOfFrames'
+]
+
+# 像素数据元素标签 (7FE0,0010)
+PIXEL_DATA_TAG = 0x7FE00010
+
+# 支持的文件扩展名
+SUPPORTED_PATTERNS = ["*.dcm", "*.nii", "*.nii.gz"]
+
+
+def read_header(file_path: Path) -> Optional[Dict[str, Any]]:
+    """仅读取文件头部元数据（DICOM延迟像素读取，NIfTI只解析header）"""
+    filename_lower = str(file_path).lower()
+
+    if filename_lower.endswith('.dcm'):
+        with parse_seconds.labels("pydicom").time():
+            ds = pydicom.dcmread(file_path, stop_before_pixels=True, specific_tags=METADATA_TAGS)
+        header = {"file_type": "DICOM"}
+        for tag in METADATA_TAGS:
+            header[tag] = ds[tag].value if tag in ds else None
+        return header
+    elif filename_lower.endswith('.nii') or filename_lower.endswith('.nii.gz'):
+        # nib.load 只解析头部，数据以代理形式延迟加载
+        with parse_seconds.labels("nibabel").time():
+            img = nib.load(str(file_path))
+        return {
+            "file_type": "NIfTI",
+            "shape": tuple(img.header.get_data_shape()),
+            "data_type": str(img.header.get_data_dtype()),
+        }
+    return None
+
+
+def slice_position(position: Optional[List[float]], orientation: Optional[List[float]]) -> Optional[float]:
+    """计算切片沿法线方向的位置，用于序列内排序"""
+    if not position or len(position) != 3:
+        return None
+    if orientation and len(orientation) == 6:
+        normal = np.cross(np.array(orientation[:3], dtype=float), np.array(orientation[3:], dtype=float))
+        return float(np.dot(normal, np.array(position, dtype=float)))
+    return float(position[2])
+
+
 def validate_dicom(file_path: Path) -> bool:
     """验证医学影像文件有效性（支持DICOM和NIfTI格式）"""
     if not file_path.exists():
         logger.error(f"文件不存在: {file_path}")
         return False
 
-    filename_lower = str(file_path).lower()
-    
     try:
-        # 处理DICOM文件
-        if filename_lower.endswith('.dcm'):
-            ds = pydicom.dcmread(file_path)
-            logger.info(f"成功读取DICOM文件: {file_path}")
+        header = read_header(file_path)
+        if header is None:
+            logger.error(f"不支持的文件格式: {file_path}")
+            return False
 
+        # 处理DICOM文件
+        if header["file_type"] == "DICOM":
             for tag, required in required_tags.items():
-                if required:
-                    if tag not in ds or not ds[tag].value:
-                        logger.warning(f"必需的标签缺失或无效: {tag} in {file_path}")
-                        return False
-                else:
-                    if tag in ds and ds[tag].value:
-                        logger.info(f"标签 {tag}: {ds[tag].value}")
-                    else:
-                        logger.info(f"标签 {tag} 不存在或为空")
+                if required and not header.get(tag):
+                    logger.warning(f"必需的标签缺失或无效: {tag} in {file_path}")
+                    return False
+            # 每个文件一条调试日志，标签作为结构化字段
+            logger.debug(
+                f"成功读取DICOM文件: {file_path}",
+                extra={"tags": {tag: header.get(tag) for tag in required_tags}}
+            )
             return True
-            
+
         # 处理NIfTI文件
-        elif filename_lower.endswith('.nii') or filename_lower.endswith('.nii.gz'):
-            img = nib.load(str(file_path))
-            logger.info(f"成功读取NIfTI文件: {file_path}, 形状: {img.shape}")
-            
-            # NIfTI文件基本验证：检查是否有有效的数据形状
-            if len(img.shape) < 3:
-                logger.warning(f"NIfTI文件维度不足: {file_path}, 形状: {img.shape}")
-                return False
-                
-            return True
-        else:
-            logger.error(f"不支持的文件格式: {file_path}")
+        shape = header["shape"]
+        logger.debug(f"成功读取NIfTI文件: {file_path}, 形状: {shape}")
+
+        # NIfTI文件基本验证：检查是否有有效的数据形状
+        if len(shape) < 3:
+            logger.warning(f"NIfTI文件维度不足: {file_path}, 形状: {shape}")
             return False
-            
+
+        return True
+
     except InvalidDicomError as e:
         logger.error(f"无效的DICOM文件: {file_path}, 错误信息: {e}")
         return False
@@ -65,53 +115,243 @@ def validate_dicom(file_path: Path) -> bool:
         logger.error(f"处理文件时发生错误: {file_path}, 错误信息: {e}")
         return False
 
-def get_dicom_results(directory: Path) -> List[DicomResult]:
-    """获取指定目录下所有医学影像文件的处理结果"""
-    results = []
-    
-    # 支持的文件扩展名
-    patterns = ["*.dcm", "*.nii", "*.nii.gz"]
-    
-    for pattern in patterns:
+
+def extract_metadata(file_path: Path, filename: Optional[str] = None) -> Optional[DicomResult]:
+    """解析单个医学影像文件的元数据（仅读取头部），filename 为对外展示的文件名"""
+    header = read_header(file_path)
+    if header is None:
+        return None
+    filename = filename or file_path.name
+
+    if header["file_type"] == "DICOM":
+        return DicomResult(
+            filename=filename,
+            patient_id=header["PatientID"],
+            study_date=header["StudyDate"],
+            modality=header["Modality"],
+            study_instance_uid=header["StudyInstanceUID"],
+            series_instance_uid=header["SeriesInstanceUID"],
+            instance_number=header["InstanceNumber"],
+            slice_position=slice_position(header["ImagePositionPatient"], header["ImageOrientationPatient"]),
+            number_of_frames=header["NumberOfFrames"] or 1,
+            additional_info={
+                "file_type": "DICOM",
+                "rows": str(header["Rows"] if header["Rows"] is not None else 'Unknown'),
+                "columns": str(header["Columns"] if header["Columns"] is not None else 'Unknown')
+            }
+        )
+
+    return DicomResult(
+        filename=filename,
+        patient_id=f"nifti_{Path(filename).stem}",  # 为NIfTI文件生成ID
+        study_date=None,
+        modality="Unknown",  # NIfTI文件通常不包含模态信息
+        number_of_frames=header["shape"][2] if len(header["shape"]) >= 3 else 1,
+        additional_info={
+            "file_type": "NIfTI",
+            "shape": str(header["shape"]),
+            "data_type": header["data_type"],
+            "affine_matrix": "present"
+        }
+    )
+
+
+def index_file(
+    file_path: Path,
+    filename: Optional[str] = None,
+    sha256: Optional[str] = None,
+    blob: Optional[str] = None
+) -> Optional[DicomResult]:
+    """解析文件并写入元数据索引；提供blob时登记名称映射（同名不同内容自动改名）"""
+    stat = file_path.stat()
+    result = extract_metadata(file_path, filename)
+    if result is None:
+        return None
+    fields = dict(
+        patient_id=result.patient_id,
+        study_date=result.study_date,
+        modality=result.modality,
+        additional_info=result.additional_info,
+        mtime=stat.st_mtime,
+        size=stat.st_size,
+        study_uid=result.study_instance_uid,
+        series_uid=result.series_instance_uid,
+        instance_number=result.instance_number,
+        slice_position=result.slice_position,
+        number_of_frames=result.number_of_frames,
+    )
+    if blob is not None:
+        result.filename = database.register_upload(filename=result.filename, sha256=sha256, blob=blob, **fields)
+    else:
+        database.upsert_record(filename=result.filename, **fields)
+    return result
+
+
+def reconcile_index(directory: Path) -> None:
+    """对账元数据索引：迁移平铺文件到blob存储，仅重新解析mtime或大小发生变化的文件，并清除已删除文件的记录"""
+    # 上传目录中的旧式平铺文件迁移到内容寻址存储
+    for pattern in SUPPORTED_PATTERNS:
         for file_path in directory.glob(pattern):
             try:
-                filename_lower = str(file_path).lower()
-                
-                if filename_lower.endswith('.dcm'):
-                    # 处理DICOM文件
-                    ds = pydicom.dcmread(file_path)
-                    result = DicomResult(
-                        filename=file_path.name,
-                        patient_id=getattr(ds, 'PatientID', None),
-                        study_date=getattr(ds, 'StudyDate', None),
-                        modality=getattr(ds, 'Modality', None),
-                        additional_info={
-                            "file_type": "DICOM",
-                            "rows": str(getattr(ds, 'Rows', 'Unknown')),
-                            "columns": str(getattr(ds, 'Columns', 'Unknown'))
-                        }
-                    )
-                elif filename_lower.endswith('.nii') or filename_lower.endswith('.nii.gz'):
-                    # 处理NIfTI文件
-                    img = nib.load(str(file_path))
-                    result = DicomResult(
-                        filename=file_path.name,
-                        patient_id=f"nifti_{file_path.stem}",  # 为NIfTI文件生成ID
-                        study_date=None,
-                        modality="Unknown",  # NIfTI文件通常不包含模态信息
-                        additional_info={
-                            "file_type": "NIfTI",
-                            "shape": str(img.shape),
-                            "data_type": str(img.get_fdata().dtype),
-                            "affine_matrix": "present"
-                        }
-                    )
-                else:
-                    continue
-                    
-                results.append(result)
-                
+                blob_store.ingest_legacy_file(
+                    file_path,
+                    lambda path, blob, sha256: index_file(path, filename=file_path.name, sha256=sha256, blob=blob)
+                )
             except Exception as e:
                 logger.error(f"无法读取医学影像文件 {file_path}: {e}")
-                
-    return results
\ No newline at end of file
+
+    missing = []
+    for filename, (blob, mtime, size) in database.get_file_stats().items():
+        file_path = blob_store.blob_path(blob) if blob else directory / filename
+        try:
+            stat = file_path.stat()
+            if (stat.st_mtime, stat.st_size) == (mtime, size):
+                continue
+            index_file(file_path, filename=filename)
+        except FileNotFoundError:
+            missing.append(filename)
+        except Exception as e:
+            logger.error(f"无法读取医学影像文件 {file_path}: {e}")
+
+    database.delete_records(missing)
+
+
+async def reconcile_periodically(directory: Path, interval: float) -> None:
+    """后台对账：启动时先执行一次，之后每隔 interval 秒执行（0 表示只在启动时执行）"""
+    while True:
+        try:
+            await io_executor.run(reconcile_index, directory, timeout=None)
+        except Exception as e:
+            logger.error(f"元数据索引对账失败: {e}")
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+
+
+def get_dicom_results(
+    patient_id: Optional[str] = None,
+    modality: Optional[str] = None,
+    study_date: Optional[str] = None,
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> Tuple[List[DicomResult], int]:
+    """从元数据索引获取医学影像文件的处理结果，返回 (结果列表, 总数)
+
+    只查询索引；文件系统的变化由后台对账（reconcile_periodically）或 POST /dicom/reconcile 同步。
+    """
+    records, total = database.query_records(
+        patient_id=patient_id,
+        modality=modality,
+        study_date=study_date,
+        offset=offset,
+        limit=limit,
+    )
+    results = [
+        DicomResult(
+            filename=record["filename"],
+            patient_id=record["patient_id"],
+            study_date=record["study_date"],
+            modality=record["modality"],
+            study_instance_uid=record["study_uid"],
+            series_instance_uid=record["series_uid"],
+            instance_number=record["instance_number"],
+            slice_position=record["slice_position"],
+            number_of_frames=record["number_of_frames"],
+            additional_info=record["additional_info"],
+        )
+        for record in records
+    ]
+    return results, total
+
+
+def _pixel_data_offset(fp, ds: pydicom.Dataset) -> Tuple[int, int]:
+    """定位非封装像素数据的值偏移与长度（fp 位于像素数据元素起始处）"""
+    start = fp.tell()
+    endian = "<" if ds.is_little_endian else ">"
+    header = fp.read(12)
+    group, element = struct.unpack(f"{endian}HH", header[:4])
+    if (group << 16 | element) != PIXEL_DATA_TAG:
+        raise ValueError("未找到像素数据")
+    if ds.is_implicit_VR:
+        return start + 8, struct.unpack(f"{endian}L", header[4:8])[0]
+    return start + 12, struct.unpack(f"{endian}L", header[8:12])[0]
+
+
+def _first_value(value: Any) -> Optional[float]:
+    """多值元素（如多组窗宽窗位）取第一个值"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (list, tuple, MultiValue)):
+        return float(value[0]) if len(value) else None
+    return float(value)
+
+
+def read_frame(file_path: Path, index: int) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """随机读取单帧（DICOM多帧）或单层（NIfTI），返回 (像素数组, 像素属性)
+
+    非压缩DICOM只读取目标帧所在的字节范围；压缩传输语法需完整解码。
+    """
+    filename_lower = str(file_path).lower()
+
+    if filename_lower.endswith('.nii') or filename_lower.endswith('.nii.gz'):
+        # blob 存储中的文件走内存映射的体积存储：只读取该层的页面，无需每次解压
+        volume = volume_store.open_stored_volume(file_path)
+        if volume is not None:
+            frame = np.ascontiguousarray(volume.read_slice(index).T)
+            return frame, {
+                "frame_count": volume.slice_count,
+                "rescale_slope": volume.slope,
+                "rescale_intercept": volume.intercept,
+            }
+
+        img = nib.load(str(file_path))
+        shape = img.header.get_data_shape()
+        if len(shape) < 3 or not 0 <= index < shape[2]:
+            raise IndexError(f"层索引越界: {index}")
+        # 代理切片只读取所需数据；NIfTI按 (x, y) 存储，转置为 (行, 列)
+        slab = np.asanyarray(img.dataobj[:, :, index] if len(shape) == 3 else img.dataobj[:, :, index, 0])
+        frame = np.ascontiguousarray(slab.T)
+        slope, intercept = img.header.get_slope_inter()
+        return frame, {
+            "frame_count": shape[2],
+            "rescale_slope": 1.0 if slope is None else float(slope),
+            "rescale_intercept": 0.0 if intercept is None else float(intercept),
+        }
+
+    with open(file_path, "rb") as fp:
+        ds = pydicom.dcmread(fp, stop_before_pixels=True)
+        frame_count = int(ds.get("NumberOfFrames", 1) or 1)
+        if not 0 <= index < frame_count:
+            raise IndexError(f"帧索引越界: {index}")
+        meta = {
+            "frame_count": frame_count,
+            "rescale_slope": float(ds.get("RescaleSlope", 1.0)),
+            "rescale_intercept": float(ds.get("RescaleIntercept", 0.0)),
+            "window_center": _first_value(ds.get("WindowCenter")),
+            "window_width": _first_value(ds.get("WindowWidth")),
+            "photometric_interpretation": ds.get("PhotometricInterpretation"),
+        }
+
+        transfer_syntax = ds.file_meta.TransferSyntaxUID
+        bits = int(ds.BitsAllocated)
+        samples = int(ds.get("SamplesPerPixel", 1))
+        # 直接按字节偏移读取：数据集未压缩、未整体 deflate，且多通道数据按像素交错存储（PlanarConfiguration 0）
+        raw = not transfer_syntax.is_compressed and not transfer_syntax.is_deflated
+        interleaved = samples == 1 or int(ds.get("PlanarConfiguration", 0) or 0) == 0
+        if raw and interleaved and bits % 8 == 0:
+            rows, columns = int(ds.Rows), int(ds.Columns)
+            frame_length = rows * columns * samples * bits // 8
+            offset, _ = _pixel_data_offset(fp, ds)
+            fp.seek(offset + index * frame_length)
+            buffer = fp.read(frame_length)
+            shape = (rows, columns, samples) if samples > 1 else (rows, columns)
+            return np.frombuffer(buffer, dtype=pixel_dtype(ds)).reshape(shape), meta
+
+    # 压缩/deflate 传输语法或按平面存储的多通道数据：完整解码后取目标帧；blob 存储中的文件按内容哈希缓存解码结果，
+    # 之后任何进程读取其他帧都直接映射共享缓存，不再重复解码
+    sha256 = blob_store.stored_sha256(file_path)
+    if sha256 is not None:
+        pixels = pixel_cache.get_or_decode(sha256, lambda: pydicom.dcmread(file_path).pixel_array)
+    else:
+        pixels = pydicom.dcmread(file_path).pixel_array
+    return (pixels[index] if frame_count > 1 else pixels), meta
\ No newline at end of file
@@ -0,0 +1,160 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from app.config import settings
+from app.services.metrics import executor_task_seconds, executor_wait_seconds
+from app.services.structured_log import setup_logging
+
+# 默认排队等待时间的哨兵值（区分“未指定”与“无限等待”）
+_DEFAULT = object()
+
+
+class ExecutorBusyError(Exception):
+    """执行器的排队名额已满"""
+
+    def __init__(self, name: str, retry_after: int):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"{name} 执行器繁忙，请稍后重试")
+
+
+class BoundedExecutor:
+    """有界执行器：在线程池/进程池外加一层并发名额，超出时排队等待，等待超时则拒绝（背压）
+
+    名额 = 工作者数 + 排队长度；名额在事件循环内获取，阻塞工作只在池中执行，不占用事件循环。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[int], Executor],
+        workers: int,
+        queue_size: int,
+        queue_timeout: float,
+    ):
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        self._slots = asyncio.Semaphore(workers + queue_size)
+        self._in_flight = 0
+        self._rejected = 0
+        self._completed = 0
+
+    @property
+    def executor(self) -> Executor:
+        # 延迟创建：进程池只有在第一次需要时才启动子进程
+        if self._executor is None:
+            self._executor = self._factory(self.workers)
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args, timeout: Any = _DEFAULT, **kwargs) -> Any:
+        """在池中执行 func；timeout 为获取名额的最长等待（None 表示一直等待）"""
+        timeout = self.queue_timeout if timeout is _DEFAULT else timeout
+        queued_at = time.perf_counter()
+        await self._acquire(timeout)
+
+        executor_wait_seconds.labels(self.name).observe(time.perf_counter() - queued_at)
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(func, *args, **kwargs)
+            if isinstance(self.executor, ThreadPoolExecutor):
+                # 线程池中沿用调用方的上下文（日志中的请求ID）；进程池无法传递上下文
+                call = functools.partial(contextvars.copy_context().run, call)
+            with executor_task_seconds.labels(self.name, getattr(func, "__name__", "unknown")).time():
+                return await loop.run_in_executor(self.executor, call)
+        except BrokenProcessPool:
+            # 子进程异常退出后进程池不可再用，丢弃以便下次调用时重建
+            self.shutdown_pool()
+            raise
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+            self._slots.release()
+
+    async def _acquire(self, timeout: Optional[float]) -> None:
+        """获取名额，等待超时抛出 ExecutorBusyError"""
+        if not self._slots.locked():
+            # 有空闲名额时立即获取，不经过事件循环调度
+            await self._slots.acquire()
+            return
+        # 不用 wait_for：名额恰好到手时它可能吞掉取消（调用方的后台任务因此无法停止）
+        acquire = asyncio.ensure_future(self._slots.acquire())
+        try:
+            await asyncio.wait({acquire}, timeout=timeout)
+        except asyncio.CancelledError:
+            if acquire.done() and not acquire.cancelled():
+                self._slots.release()
+            acquire.cancel()
+            raise
+        if not acquire.done():
+            acquire.cancel()
+            self._rejected += 1
+            raise ExecutorBusyError(self.name, max(1, int(self.queue_timeout)))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "rejected": self._rejected,
+        }
+
+    def shutdown_pool(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def shutdown(self) -> None:
+        self.shutdown_pool()
+        # 名额信号量绑定到首次使用的事件循环，关闭后重建以便在新的事件循环中复用
+        self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+
+
+def _thread_pool(workers: int) -> Executor:
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dicom-io")
+
+
+def _process_pool(workers: int) -> Executor:
+    # spawn 避免在多线程的服务进程中 fork 导致的锁继承问题
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        # 子进程使用同样的异步日志输出
+        initializer=setup_logging
+    )
+
+
+# I/O密集：头部解析、元数据索引、文件移动
+io_executor = BoundedExecutor(
+    "io",
+    _thread_pool,
+    workers=settings.IO_WORKERS,
+    queue_size=settings.IO_QUEUE_SIZE,
+    queue_timeout=settings.EXECUTOR_QUEUE_TIMEOUT,
+)
+
+# CPU密集：像素解压、窗宽窗位渲染、金字塔构建（多 worker 时各 worker 均分CPU核，避免进程数超额）
+cpu_executor = BoundedExecutor(
+    "cpu",
+    _process_pool,
+    workers=settings.CPU_WORKERS or max(1, (os.cpu_count() or 1) // settings.worker_count()),
+    queue_size=settings.CPU_QUEUE_SIZE,
+    queue_timeout=settings.EXECUTOR_QUEUE_TIMEOUT,
+)
+
+
+def shutdown_executors() -> None:
+    io_executor.shutdown()
+    cpu_executor.shutdown()
@@ -0,0 +1,71 @@
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+import anyio
+
+
+class RangeNotSatisfiable(Exception):
+    """Range请求超出资源范围"""
+
+    def __init__(self, size: int):
+        self.size = size
+        super().__init__(f"Requested range not satisfiable (size={size})")
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单区间 Range 头，返回闭区间 (start, end)；无法处理的格式返回 None（按完整内容响应）"""
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        # 不支持多区间，按完整内容返回
+        return None
+
+    start_str, end_str = (part.strip() for part in spec.split("-", 1))
+    try:
+        if start_str == "":
+            # 后缀区间: bytes=-N
+            length = int(end_str)
+            if length <= 0:
+                raise RangeNotSatisfiable(size)
+            start = max(size - length, 0)
+            end = size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(size)
+    return start, min(end, size - 1)
+
+
+def content_range(start: int, end: int, size: int) -> str:
+    """构造 Content-Range 响应头"""
+    return f"bytes {start}-{end}/{size}"
+
+
+async def iter_file_range(path: Path, start: int, end: int, chunk_size: int) -> AsyncIterator[bytes]:
+    """按块读取文件的闭区间 [start, end]"""
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def slice_stream(chunks: AsyncIterator[bytes], start: int, end: int) -> AsyncIterator[bytes]:
+    """从字节流中截取闭区间 [start, end]，不缓存整个流"""
+    position = 0
+    async for chunk in chunks:
+        chunk_end = position + len(chunk)
+        if chunk_end > start:
+            yield chunk[max(start - position, 0):end + 1 - position]
+        position = chunk_end
+        if position > end:
+            break
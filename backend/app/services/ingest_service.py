@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import tarfile
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+from fastapi import UploadFile
+
+from app.config import settings
+from app.models.schemas import IngestFileResult, IngestResponse
+from app.services import blob_store
+from app.services.dicom_service import index_file, validate_dicom
+from app.services.executors import cpu_executor, io_executor
+from app.services.upload_service import FileTooLargeError, StoredUpload, discard_upload, spool_to_temp
+
+logger = logging.getLogger(__name__)
+
+# 支持的压缩包格式（按匹配优先级）
+ARCHIVE_EXTENSIONS = ['.tar.gz', '.tgz', '.tar', '.zip']
+
+# DICOM Part 10 文件在128字节前导之后的魔数
+DICOM_MAGIC = b"DICM"
+DICOM_MAGIC_OFFSET = 128
+
+
+def archive_extension(filename: str) -> Optional[str]:
+    lower = filename.lower()
+    return next((ext for ext in ARCHIVE_EXTENSIONS if lower.endswith(ext)), None)
+
+
+def is_ignored(name: str) -> bool:
+    """跳过目录索引、隐藏文件和macOS资源分支"""
+    path = PurePosixPath(name)
+    return path.name.upper() == "DICOMDIR" or path.name.startswith(".") or "__MACOSX" in path.parts
+
+
+def iter_upload(file: UploadFile) -> Iterator[Tuple[str, BinaryIO]]:
+    """逐个产出上传中的文件；压缩包边读边解，成员不落地到原始路径"""
+    extension = archive_extension(file.filename)
+    if extension is None:
+        yield file.filename, file.file
+    elif extension == ".zip":
+        with zipfile.ZipFile(file.file) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, member
+    else:
+        # 流式模式只顺序读取，无需随机访问
+        with tarfile.open(fileobj=file.file, mode="r|*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member)
+
+
+def next_member(
+    members: Iterator[Tuple[str, BinaryIO]],
+) -> Union[None, IngestFileResult, Tuple[str, StoredUpload]]:
+    """读取下一个成员并写入临时文件；结束时返回 None，无需处理的成员直接返回结果"""
+    try:
+        name, fileobj = next(members)
+    except StopIteration:
+        return None
+
+    filename = PurePosixPath(name).name
+    if is_ignored(name):
+        return IngestFileResult(filename=name, status="skipped", detail="已忽略")
+    try:
+        stored = spool_to_temp(fileobj, suffix=blob_store.file_extension(filename) or ".part")
+    except FileTooLargeError as e:
+        return IngestFileResult(filename=name, status="error", detail=str(e))
+    return name, stored
+
+
+def sniff_extension(path: Path) -> Optional[str]:
+    """无扩展名的文件（如 IM000001）按DICOM魔数识别"""
+    with open(path, "rb") as f:
+        f.seek(DICOM_MAGIC_OFFSET)
+        return ".dcm" if f.read(len(DICOM_MAGIC)) == DICOM_MAGIC else None
+
+
+def ingest_file(name: str, temp_path: Path, size: int, sha256: str) -> IngestFileResult:
+    """校验、入库并索引单个文件（在进程池中执行）"""
+    stored = StoredUpload(path=temp_path, size=size, sha256=sha256)
+    filename = PurePosixPath(name).name
+    extension = blob_store.file_extension(filename)
+    if extension is None:
+        extension = sniff_extension(stored.path)
+        if extension is None:
+            discard_upload(stored)
+            return IngestFileResult(filename=name, status="skipped", size=size, detail="不支持的文件格式")
+        filename += extension
+        renamed = stored.path.with_suffix(extension)
+        os.replace(stored.path, renamed)
+        stored.path = renamed
+
+    temp_path = stored.path
+    try:
+        if not validate_dicom(stored.path):
+            discard_upload(stored)
+            return IngestFileResult(filename=name, status="invalid", size=size, detail="无效的DICOM文件")
+
+        result = blob_store.store_upload(
+            stored, extension, lambda path, blob: index_file(path, filename=filename, sha256=sha256, blob=blob)
+        )
+    except BaseException:
+        # 调用方只知道原临时路径，重命名后的临时文件在这里删除；已移入blob存储的文件由 store_upload 负责释放
+        temp_path.unlink(missing_ok=True)
+        raise
+    if result is None:
+        return IngestFileResult(filename=name, status="invalid", size=size, detail="无效的DICOM文件")
+    return IngestFileResult(
+        filename=name,
+        status="stored",
+        stored_as=result.filename,
+        size=size,
+        sha256=sha256,
+        series_instance_uid=result.series_instance_uid
+    )
+
+
+async def ingest_uploads(files: List[UploadFile]) -> IngestResponse:
+    """批量导入：解包与校验/索引流水线并行，同时处理中的文件数受 INGEST_CONCURRENCY 限制"""
+    start = time.perf_counter()
+    limit = asyncio.Semaphore(settings.INGEST_CONCURRENCY)
+    # 按上传顺序保存：已有结论的成员直接存结果，其余存处理任务
+    entries: List[Union[IngestFileResult, asyncio.Task]] = []
+
+    async def process(name: str, stored: StoredUpload) -> IngestFileResult:
+        try:
+            return await cpu_executor.run(ingest_file, name, stored.path, stored.size, stored.sha256, timeout=None)
+        except Exception as e:
+            logger.error(f"导入文件失败: {name}: {e}")
+            discard_upload(stored)
+            return IngestFileResult(filename=name, status="error", size=stored.size, detail=str(e))
+        finally:
+            limit.release()
+
+    try:
+        for file in files:
+            members = iter_upload(file)
+            try:
+                while True:
+                    await limit.acquire()
+                    try:
+                        member = await io_executor.run(next_member, members, timeout=None)
+                    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+                        limit.release()
+                        entries.append(IngestFileResult(filename=file.filename, status="error", detail=f"无法解析压缩包: {e}"))
+                        break
+                    except BaseException:
+                        limit.release()
+                        raise
+                    if member is None or isinstance(member, IngestFileResult):
+                        limit.release()
+                        if member is None:
+                            break
+                        entries.append(member)
+                        continue
+                    entries.append(asyncio.create_task(process(*member)))
+            finally:
+                await io_executor.run(members.close, timeout=None)
+    except BaseException:
+        # 读取后续成员失败（如I/O线程池繁忙）时，先等待已提交的文件处理完成（各自清理临时文件）再上抛
+        await asyncio.gather(*(entry for entry in entries if isinstance(entry, asyncio.Task)), return_exceptions=True)
+        raise
+
+    reports = [await entry if isinstance(entry, asyncio.Task) else entry for entry in entries]
+    elapsed = time.perf_counter() - start
+    stored = [report for report in reports if report.status == "stored"]
+    total_bytes = sum(report.size or 0 for report in stored)
+    return IngestResponse(
+        total_files=len(reports),
+        stored=len(stored),
+        skipped=sum(report.status == "skipped" for report in reports),
+        failed=sum(report.status in ("invalid", "error") for report in reports),
+        total_bytes=total_bytes,
+        elapsed_seconds=round(elapsed, 3),
+        throughput_mb_s=round(total_bytes / 1024 / 1024 / elapsed, 2) if elapsed > 0 else 0.0,
+        files=reports
+    )
@@ -0,0 +1,245 @@
+import hashlib
+import io
+import json
+import struct
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
+
+import nibabel as nib
+import numpy as np
+
+from app.config import settings
+from app.services.ai_service import iter_array_slabs, iter_nifti_slabs
+from app.services.render_service import write_atomic
+
+# 紧凑掩码文件格式（仿照瓦片金字塔）:
+#   魔数(8字节) | 头部长度(uint32, 小端) | JSON头部 | 层索引 | 各层数据
+# 层索引每层一项 (偏移 uint64, 长度 uint32, 编码 uint32)，偏移相对于数据区起点，
+# 任意一层都是文件中的一段连续字节，一次 seek + read 即可取出，无需解码整个体积。
+# 每层按 (i, j) 展平（Fortran 顺序，i 变化最快，与 NIfTI 磁盘布局一致），编码:
+#   empty   全零层，不占数据
+#   bitpack 二值层逐位打包（np.packbits，高位在前）
+#   rle     行程编码: 起点 uint32[n] | 长度 uint32[n] | 值 dtype[n]，只记录非零行程
+MASK_MAGIC = b"BCMASK1\0"
+MASK_MEDIA_TYPE = "application/x-bcmask"
+
+SLICE_EMPTY, SLICE_BITPACK, SLICE_RLE = 0, 1, 2
+SLICE_ENCODINGS = {SLICE_EMPTY: "empty", SLICE_BITPACK: "bitpack", SLICE_RLE: "rle"}
+
+# auto: 二值层取 bitpack / rle 中较小者，标签层用 rle
+MASK_ENCODINGS = ("auto", "bitpack", "rle")
+
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("encoding", "<u4")])
+
+Source = Union[Path, str, bytes, BinaryIO]
+
+
+def mask_path(session_id: str) -> Path:
+    """会话分割结果的紧凑格式缓存路径（会话ID取哈希，避免出现在路径中）"""
+    digest = hashlib.sha256(session_id.encode()).hexdigest()
+    return settings.MASK_DIR / digest[:2] / f"{digest}.mask"
+
+
+def _rle_encode(slices: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """对 (层数, 像素数) 的二维数组逐行提取非零行程，返回每层的 (起点, 长度, 值)"""
+    depth, size = slices.shape
+    padded = np.zeros((depth, size + 2), dtype=slices.dtype)
+    padded[:, 1:-1] = slices
+    layer, boundary = np.divmod(np.flatnonzero(padded[:, 1:] != padded[:, :-1]), size + 1)
+    values = padded[layer, boundary + 1]
+    # 每个非零起点之后的下一个边界就是该行程的终点（两端填充的 0 保证行程不跨层）
+    starts = np.flatnonzero(values != 0)
+    layer, start, end, values = layer[starts], boundary[starts], boundary[starts + 1], values[starts]
+    splits = np.searchsorted(layer, np.arange(1, depth))
+    return list(zip(np.split(start, splits), np.split(end - start, splits), np.split(values, splits)))
+
+
+def encode_slab(slab: np.ndarray, encoding: str = "auto") -> List[Tuple[int, bytes]]:
+    """编码一个 (i, j, 层数) 的层块，返回每层的 (编码, 数据)"""
+    depth = slab.shape[2]
+    # NIfTI 层块本身是 Fortran 顺序，这里通常只是视图
+    slices = slab.reshape(-1, depth, order="F").T
+    dtype = slices.dtype.newbyteorder("<")
+    binary = (slices.min(axis=1) >= 0) & (slices.max(axis=1) <= 1) if slices.size else np.ones(depth, bool)
+    if encoding == "bitpack" and not binary.all():
+        raise ValueError("bitpack 编码只适用于二值掩码")
+
+    records = []
+    for row, (start, length, values), is_binary in zip(slices, _rle_encode(slices), binary):
+        if not len(start):
+            records.append((SLICE_EMPTY, b""))
+            continue
+        # 两种编码的大小都可以直接算出，只生成较小的一种
+        use_bitpack = encoding == "bitpack" or (
+            encoding == "auto" and is_binary and (row.size + 7) // 8 < len(start) * (8 + dtype.itemsize)
+        )
+        if use_bitpack:
+            records.append((SLICE_BITPACK, np.packbits(row != 0).tobytes()))
+        else:
+            records.append((SLICE_RLE, start.astype("<u4").tobytes() + length.astype("<u4").tobytes()
+                            + values.astype(dtype).tobytes()))
+    return records
+
+
+def encode_slabs(
+    slabs: Iterable[Tuple[int, np.ndarray]],
+    shape: Tuple[int, ...],
+    dtype: np.dtype,
+    affine: Optional[np.ndarray] = None,
+    encoding: str = "auto",
+) -> bytes:
+    """按层块编码整个掩码（只在内存中保留编码后的数据），返回文件内容"""
+    if encoding not in MASK_ENCODINGS:
+        raise ValueError(f"不支持的编码: {encoding}，可选 {list(MASK_ENCODINGS)}")
+    records: List[Tuple[int, bytes]] = []
+    for _, slab in slabs:
+        records.extend(encode_slab(np.asarray(slab, dtype=dtype), encoding))
+
+    index = np.zeros(len(records), dtype=INDEX_DTYPE)
+    lengths = np.array([len(data) for _, data in records], dtype=np.int64)
+    index["length"] = lengths
+    index["offset"] = np.concatenate([[0], np.cumsum(lengths)[:-1]]) if len(records) else []
+    index["encoding"] = [kind for kind, _ in records]
+
+    header = {
+        "shape": [int(n) for n in shape[:3]],
+        "dtype": np.dtype(dtype).newbyteorder("<").str,
+        "affine": (np.eye(4) if affine is None else np.asarray(affine)).tolist(),
+        "slice_count": len(records),
+    }
+    encoded = json.dumps(header).encode()
+    return MASK_MAGIC + struct.pack("<I", len(encoded)) + encoded + index.tobytes() + b"".join(
+        data for _, data in records
+    )
+
+
+def encode_mask(
+    volume: np.ndarray,
+    affine: Optional[np.ndarray] = None,
+    encoding: str = "auto",
+    slab_slices: Optional[int] = None,
+) -> bytes:
+    """编码内存中的 (i, j, k) 掩码"""
+    if volume.ndim != 3:
+        raise ValueError(f"掩码需为三维数组: {volume.shape}")
+    return encode_slabs(iter_array_slabs(volume, slab_slices), volume.shape, volume.dtype, affine, encoding)
+
+
+def encode_nifti(file_path: Path, encoding: str = "auto", slab_slices: Optional[int] = None) -> bytes:
+    """按层块读取 NIfTI 分割掩码并编码（4D 取第一个时间点，浮点概率图需先二值化）"""
+    try:
+        img = nib.load(str(file_path), keep_file_open=True)
+    except (nib.filebasedimages.ImageFileError, OSError, EOFError) as e:
+        raise ValueError(f"无法读取NIfTI掩码: {e}")
+    shape = img.header.get_data_shape()
+    dtype = img.get_data_dtype()
+    if len(shape) < 3:
+        raise ValueError(f"掩码维度不足: {shape}")
+    if not (np.issubdtype(dtype, np.integer) or dtype == np.bool_):
+        raise ValueError(f"紧凑格式只支持整数/二值掩码: {dtype}")
+    return encode_slabs(iter_nifti_slabs(img, slab_slices), shape, dtype, img.affine, encoding)
+
+
+def build_mask_file(nifti_path: Path, dest: Path, encoding: str = "auto") -> int:
+    """NIfTI 掩码转为紧凑格式并原子写入 dest，返回文件大小"""
+    data = encode_nifti(nifti_path, encoding)
+    write_atomic(dest, data)
+    return len(data)
+
+
+def decode_slice(encoding: int, data: bytes, shape: Tuple[int, int], dtype: np.dtype) -> np.ndarray:
+    """解码单层数据为 (i, j) 数组"""
+    size = shape[0] * shape[1]
+    if encoding == SLICE_EMPTY:
+        return np.zeros(shape, dtype=dtype)
+    if encoding == SLICE_BITPACK:
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=size)
+        return bits.astype(dtype).reshape(shape, order="F")
+    if encoding == SLICE_RLE:
+        count = len(data) // (8 + dtype.itemsize)
+        start = np.frombuffer(data, dtype="<u4", count=count).astype(np.int64)
+        length = np.frombuffer(data, dtype="<u4", count=count, offset=4 * count).astype(np.int64)
+        values = np.frombuffer(data, dtype=dtype.newbyteorder("<"), count=count, offset=8 * count)
+        # 只展开非零像素：每个像素的位置 = 所在行程起点 + 在行程内的序号
+        offsets = np.cumsum(length) - length
+        positions = np.arange(int(length.sum())) + np.repeat(start - offsets, length)
+        pixels = np.zeros(size, dtype=dtype)
+        pixels[positions] = np.repeat(values, length)
+        return pixels.reshape(shape, order="F")
+    raise ValueError(f"未知的层编码: {encoding}")
+
+
+class MaskReader:
+    """紧凑掩码读取器：打开时只读取头部和层索引，按需读取单层"""
+
+    def __init__(self, source: Source):
+        if isinstance(source, (bytes, bytearray)):
+            self._file: BinaryIO = io.BytesIO(source)
+        elif isinstance(source, (str, Path)):
+            self._file = open(source, "rb")
+        else:
+            self._file = source
+        if self._file.read(len(MASK_MAGIC)) != MASK_MAGIC:
+            self._file.close()
+            raise ValueError("无效的紧凑掩码文件")
+        (length,) = struct.unpack("<I", self._file.read(4))
+        self.header: Dict[str, Any] = json.loads(self._file.read(length))
+        self.shape = tuple(self.header["shape"])
+        self.dtype = np.dtype(self.header["dtype"])
+        self.affine = np.array(self.header["affine"])
+        count = self.header["slice_count"]
+        self.index = np.frombuffer(self._file.read(count * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+        self.data_offset = len(MASK_MAGIC) + 4 + length + count * INDEX_DTYPE.itemsize
+
+    def __enter__(self) -> "MaskReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    @property
+    def slice_count(self) -> int:
+        return len(self.index)
+
+    def read_record(self, index: int) -> Tuple[int, bytes]:
+        """读取单层的原始编码数据，返回 (编码, 数据)"""
+        if not 0 <= index < self.slice_count:
+            raise IndexError(f"层号越界: {index}")
+        entry = self.index[index]
+        if entry["length"] == 0:
+            return int(entry["encoding"]), b""
+        self._file.seek(self.data_offset + int(entry["offset"]))
+        return int(entry["encoding"]), self._file.read(int(entry["length"]))
+
+    def read_slice(self, index: int) -> np.ndarray:
+        encoding, data = self.read_record(index)
+        return decode_slice(encoding, data, self.shape[:2], self.dtype)
+
+    def read_volume(self) -> np.ndarray:
+        volume = np.zeros(self.shape, dtype=self.dtype, order="F")
+        for k in range(self.slice_count):
+            if self.index[k]["encoding"] != SLICE_EMPTY:
+                volume[:, :, k] = self.read_slice(k)
+        return volume
+
+
+def decode_mask(source: Source) -> Tuple[np.ndarray, np.ndarray]:
+    """解码整个掩码，返回 ((i, j, k) 数组, 仿射矩阵)"""
+    with MaskReader(source) as reader:
+        return reader.read_volume(), reader.affine
+
+
+def read_slice_record(path: Path, index: int) -> Dict[str, Any]:
+    """读取缓存文件中的单层编码数据及解码所需的信息（供按层下载）"""
+    with MaskReader(path) as reader:
+        encoding, data = reader.read_record(index)
+        return {
+            "encoding": SLICE_ENCODINGS[encoding],
+            "shape": list(reader.shape[:2]),
+            "dtype": reader.dtype.str,
+            "slice_count": reader.slice_count,
+            "data": data,
+        }
@@ -0,0 +1,288 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 延迟类直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# 吞吐量分桶（字节/秒，1MB/s ~ 1GB/s）
+THROUGHPUT_BUCKETS = tuple(float(2 ** n * 1024 * 1024) for n in range(11))
+
+# 采集时动态生成的指标：(名称, 类型, 说明, [(标签, 值)])
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """带标签的指标；labels() 返回（并缓存）对应标签值的子指标"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _label_dict(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for key, child in list(self._children.items()):
+            yield from self._render_child(self._label_dict(key), child)
+
+    def _render_child(self, labels: Dict[str, str], child) -> Iterator[str]:
+        yield f"{self.name}{_format_labels(labels)} {_format_value(child.value)}"
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.inc(-amount)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _render_child(self, labels: Dict[str, str], child: _HistogramValue) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            bucket_labels = {**labels, "le": _format_value(bound)}
+            yield f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+        yield f"{self.name}_sum{_format_labels(labels)} {_format_value(child.sum)}"
+        yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class Registry:
+    """指标注册表：静态指标 + 采集时调用的回调（读取缓存、执行器等组件自身的统计）"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.append(collector)
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus 文本格式（version 0.0.4）"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP请求处理时间（按路由模板）", ("method", "route", "status")
+)
+http_requests_in_progress = registry.gauge("http_requests_in_progress", "正在处理的HTTP请求数")
+ai_upstream_seconds = registry.histogram(
+    "ai_upstream_request_duration_seconds", "AI服务请求延迟（到收到响应头）", ("endpoint", "status")
+)
+ai_upstream_errors = registry.counter(
+    "ai_upstream_errors_total", "AI服务请求错误数（连接错误、网关错误、熔断拒绝）", ("endpoint", "reason")
+)
+upload_bytes = registry.counter("upload_bytes_total", "已接收的上传字节数", ("source",))
+upload_throughput = registry.histogram(
+    "upload_throughput_bytes_per_second", "单个上传文件的接收速率", ("source",), THROUGHPUT_BUCKETS
+)
+parse_seconds = registry.histogram(
+    "image_parse_duration_seconds", "影像头部解析时间（pydicom/nibabel）", ("library",)
+)
+executor_task_seconds = registry.histogram(
+    "executor_task_duration_seconds", "执行器任务耗时（含进程池中的像素解码与渲染）", ("executor", "task")
+)
+executor_wait_seconds = registry.histogram(
+    "executor_queue_wait_seconds", "执行器排队等待名额的时间", ("executor",)
+)
+event_loop_lag_seconds = registry.histogram(
+    "event_loop_lag_seconds", "事件循环调度延迟（定时器实际唤醒时间与预期之差）"
+)
+
+
+def route_label(scope: dict) -> str:
+    """使用匹配到的路由模板作为标签，避免路径参数导致标签基数膨胀"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI中间件：记录每个请求的处理时间与状态码（流式响应计到最后一块发送完成）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        http_requests_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_progress.dec()
+            http_request_seconds.labels(scope["method"], route_label(scope), status_code).observe(
+                time.perf_counter() - start
+            )
+
+
+async def monitor_event_loop(interval: float) -> None:
+    """定期测量事件循环延迟：sleep 的实际唤醒时间越晚，说明循环被阻塞越久"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        event_loop_lag_seconds.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+def observe_upload(source: str, size: int, elapsed: float) -> None:
+    upload_bytes.labels(source).inc(size)
+    if elapsed > 0 and size > 0:
+        upload_throughput.labels(source).observe(size / elapsed)
+
+
+def ratio(hits: float, misses: float) -> Optional[float]:
+    total = hits + misses
+    return hits / total if total else None
@@ -0,0 +1,247 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import numpy as np
+
+from app.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: 没有跨进程文件锁，并发未命中时可能重复解码
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 解码像素缓存：解码结果以 .npy 文件存放在共享目录（默认 /dev/shm），读取时以只读内存映射打开，
+# 同一主机上的所有进程（uvicorn worker、进程池）共享同一份物理页面，命中时不发生复制。
+# 条目按内容哈希寻址；目录中的 SQLite 索引记录每个条目的大小与最近访问时间（按字节预算做 LRU 淘汰）
+# 以及所有进程共享的命中/未命中/淘汰计数。
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+COUNTERS = ("hits", "misses", "evictions")
+
+
+class PixelCache:
+    """跨进程共享的解码像素缓存（字节预算 LRU）
+
+    缓存只是加速手段：写入或索引失败（如 /dev/shm 空间不足）时记录日志并直接返回解码结果。
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, free_fraction: float = 1.0):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.free_fraction = free_fraction
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def index_path(self) -> Path:
+        return self.directory / "index.db"
+
+    def entry_path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.npy"
+
+    def _init(self) -> None:
+        with self._init_lock:
+            if self._initialized:
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.index_path), timeout=30.0)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                conn.executemany("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)", [(n,) for n in COUNTERS])
+                conn.commit()
+            finally:
+                conn.close()
+            self._initialized = True
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """每次调用独立连接（与元数据库相同的做法），保证线程与进程安全"""
+        if not self._initialized:
+            self._init()
+        conn = sqlite3.connect(str(self.index_path), timeout=30.0)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def budget(self, used: int = 0) -> int:
+        """实际字节预算：配置上限与文件系统可用空间（加上缓存已占用的 used 字节）按比例取较小者"""
+        try:
+            stat = os.statvfs(self.directory)
+        except (AttributeError, OSError):  # Windows 没有 statvfs
+            return self.max_bytes
+        return min(self.max_bytes, int((stat.f_bavail * stat.f_frsize + used) * self.free_fraction))
+
+    def _total(self, conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection, name: str, amount: int = 1) -> None:
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (amount, name))
+
+    @contextmanager
+    def _decode_lock(self, key: str) -> Iterator[None]:
+        """同一条目同一时间只由一个进程解码，其他进程等待后直接映射其结果"""
+        if fcntl is None:
+            yield
+            return
+        path = self.entry_path(key).with_suffix(".lock")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            lock = open(path, "a")
+        except OSError as e:
+            logger.warning(f"无法创建解码锁，并发未命中时可能重复解码: {e}")
+            yield
+            return
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _open(self, key: str) -> Optional[np.ndarray]:
+        try:
+            return np.load(self.entry_path(key), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key: str, count_miss: bool = True) -> Optional[np.ndarray]:
+        """命中时返回只读内存映射数组（不复制），否则返回 None"""
+        array = self._open(key)
+        with self._connection() as conn:
+            if array is None:
+                # 文件已被其他进程淘汰或尚未写入，索引中的残留条目一并删除
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                if count_miss:
+                    self._count(conn, "misses")
+                return None
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._count(conn, "hits")
+        return array
+
+    def put(self, key: str, array: np.ndarray) -> np.ndarray:
+        """写入条目（先写临时文件再原子替换），超出预算时淘汰最久未使用的条目，返回内存映射数组
+
+        写入失败（空间不足等）时不缓存，直接返回传入的数组。
+        """
+        array = np.asanyarray(array)
+        try:
+            return self._put(key, array)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"像素缓存写入失败，本次不缓存: {e}")
+            return array
+
+    def _put(self, key: str, array: np.ndarray) -> np.ndarray:
+        with self._connection() as conn:
+            used = self._total(conn)
+        if array.nbytes > self.budget(used):
+            return array
+        path = self.entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, array, allow_pickle=False)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        size = path.stat().st_size
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)", (key, size, time.time())
+            )
+            self._evict(conn, keep=key)
+        cached = self._open(key)
+        return array if cached is None else cached
+
+    def _evict(self, conn: sqlite3.Connection, keep: str) -> None:
+        total = self._total(conn)
+        # 可用空间已扣除刚写入的条目，按缓存总占用折算回去
+        budget = self.budget(total)
+        if total <= budget:
+            return
+        evicted = 0
+        for key, size in conn.execute(
+            "SELECT key, size FROM entries WHERE key != ? ORDER BY last_used", (keep,)
+        ).fetchall():
+            if total <= budget:
+                break
+            # 已映射该文件的进程不受影响：删除后页面在最后一个映射解除时才释放
+            # 锁文件保留：其他进程可能正持有它等待解码，删除后新来者会锁到另一个文件上
+            self.entry_path(key).unlink(missing_ok=True)
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        if evicted:
+            self._count(conn, "evictions", evicted)
+            logger.debug(f"像素缓存超出预算，淘汰 {evicted} 个条目")
+
+    def get_or_decode(self, key: str, decode: Callable[[], np.ndarray]) -> np.ndarray:
+        """命中直接返回共享数组；未命中时解码并写入缓存（预算为 0 时不使用缓存）
+
+        未命中数等于实际解码次数：等待其他进程解码完成后直接映射的计为命中。
+        """
+        if self.max_bytes <= 0:
+            return decode()
+        array = self._lookup(key, count_miss=False)
+        if array is not None:
+            return array
+        with self._decode_lock(key):
+            # 等锁期间其他进程可能已经写入
+            array = self._lookup(key)
+            if array is not None:
+                return array
+            return self.put(key, decode())
+
+    def _lookup(self, key: str, count_miss: bool = True) -> Optional[np.ndarray]:
+        """缓存不可用时按未命中处理"""
+        try:
+            return self.get(key, count_miss)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"像素缓存不可用，直接解码: {e}")
+            return None
+
+    def clear(self) -> None:
+        with self._connection() as conn:
+            for (key,) in conn.execute("SELECT key FROM entries").fetchall():
+                self.entry_path(key).unlink(missing_ok=True)
+            conn.execute("DELETE FROM entries")
+
+    def stats(self) -> Dict[str, Any]:
+        """所有进程共享的统计"""
+        with self._connection() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {**{name: counters.get(name, 0) for name in COUNTERS}, "entries": entries, "bytes": size,
+                "max_bytes": self.budget(size)}
+
+
+pixel_cache = PixelCache(settings.PIXEL_CACHE_DIR, settings.PIXEL_CACHE_MAX_BYTES, settings.PIXEL_CACHE_FREE_FRACTION)
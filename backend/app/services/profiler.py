@@ -0,0 +1,131 @@
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+
+@dataclass
+class Profile:
+    """一次请求期间采集到的调用栈样本（折叠栈格式，可直接用于火焰图工具）"""
+    profile_id: str
+    method: str
+    path: str
+    started_at: float
+    duration: float = 0.0
+    samples: Counter = field(default_factory=Counter)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 6),
+            "samples": sum(self.samples.values()),
+        }
+
+
+def _stack(frame) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class SamplingProfiler:
+    """低开销采样分析器：有请求被分析时，采样线程每隔 interval 秒抓取一次所有线程的调用栈
+
+    事件循环是单线程的，并发请求的样本会互相混入；适合在真实负载下定位热点，而不是精确归因到单个请求。
+    """
+
+    def __init__(self, interval: float, keep: int):
+        self.interval = interval
+        self.keep = keep
+        self.profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self._active: Dict[str, Profile] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def should_profile(self, headers: Dict[bytes, bytes]) -> bool:
+        if not settings.PROFILE_ENABLED:
+            return False
+        if settings.PROFILE_HEADER.lower().encode() in headers:
+            return True
+        return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+    def start(self, method: str, path: str) -> Profile:
+        profile = Profile(profile_id=uuid.uuid4().hex, method=method, path=path, started_at=time.time())
+        with self._lock:
+            self._active[profile.profile_id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def stop(self, profile: Profile) -> None:
+        profile.duration = time.time() - profile.started_at
+        with self._lock:
+            self._active.pop(profile.profile_id, None)
+            self.profiles[profile.profile_id] = profile
+            while len(self.profiles) > self.keep:
+                self.profiles.popitem(last=False)
+
+    def recent(self) -> List[Dict[str, object]]:
+        return [profile.summary() for profile in reversed(self.profiles.values())]
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active.values())
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = f"{names.get(thread_id, thread_id)};{_stack(frame)}"
+                for profile in active:
+                    profile.samples[stack] += 1
+            time.sleep(self.interval)
+
+
+class ProfilingMiddleware:
+    """ASGI中间件：请求带 PROFILE_HEADER 头或按 PROFILE_SAMPLE_RATE 随机抽中时采样分析，
+    响应头 X-Profile-Id 指向 /metrics/profiles/{id}"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.PROFILE_ENABLED or not profiler.should_profile(dict(scope["headers"])):
+            return await self.app(scope, receive, send)
+
+        profile = profiler.start(scope["method"], scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.profile_id.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop(profile)
+
+
+profiler = SamplingProfiler(interval=settings.PROFILE_INTERVAL, keep=settings.PROFILE_KEEP)
@@ -0,0 +1,206 @@
+import logging
+import os
+import struct
+import tempfile
+import zlib
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services import blob_store, volume_store
+from app.services.dicom_service import read_frame, read_header
+
+try:
+    from PIL import Image  # WebP编码需要Pillow（可选依赖）
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# 渲染规格 -> 最长边像素
+RENDER_SIZES = {
+    "thumbnail": settings.THUMBNAIL_SIZE,
+    "preview": settings.PREVIEW_SIZE,
+}
+
+# 模态默认窗位/窗宽；MR等没有绝对强度标尺的模态按百分位自动取窗
+DEFAULT_WINDOWS = {
+    "CT": (40.0, 400.0),  # 软组织窗
+}
+AUTO_WINDOW_PERCENTILES = (1.0, 99.0)
+
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def available_formats() -> List[str]:
+    """当前环境可输出的图像格式"""
+    return ["png", "webp"] if Image is not None else ["png"]
+
+
+def key_frame_index(frame_count: int) -> int:
+    """关键层：取中间一帧/一层"""
+    return max(frame_count, 1) // 2
+
+
+def frame_count(file_path: Path) -> int:
+    """仅读取头部获得帧数（NIfTI为第三维层数）"""
+    header = read_header(file_path) or {}
+    if header.get("file_type") == "NIfTI":
+        shape = header["shape"]
+        return shape[2] if len(shape) >= 3 else 1
+    return int(header.get("NumberOfFrames") or 1)
+
+
+def downsample(frame: np.ndarray, max_size: int) -> np.ndarray:
+    """按整数倍块均值缩小到最长边不超过 max_size（先缩小再取窗，减少计算量）"""
+    factor = -(-max(frame.shape[:2]) // max_size)
+    factor = max(1, min(factor, frame.shape[0], frame.shape[1]))
+    if factor == 1:
+        return frame.astype(np.float32)
+    height = frame.shape[0] // factor * factor
+    width = frame.shape[1] // factor * factor
+    blocks = frame[:height, :width].astype(np.float32).reshape(
+        height // factor, factor, width // factor, factor, *frame.shape[2:]
+    )
+    return blocks.mean(axis=(1, 3))
+
+
+def resolve_window(
+    values: np.ndarray,
+    meta: Dict[str, Any],
+    modality: Optional[str],
+) -> Tuple[float, float]:
+    """确定窗位/窗宽：文件自带的VOI窗 > 模态默认窗 > 百分位自动窗"""
+    if meta.get("window_center") is not None and meta.get("window_width"):
+        return meta["window_center"], meta["window_width"]
+    if modality and modality.upper() in DEFAULT_WINDOWS:
+        return DEFAULT_WINDOWS[modality.upper()]
+    low, high = np.percentile(values, AUTO_WINDOW_PERCENTILES)
+    return float(low + high) / 2, max(float(high - low), 1.0)
+
+
+def apply_window(values: np.ndarray, center: float, width: float, invert: bool = False) -> np.ndarray:
+    """线性窗宽窗位映射到 0-255"""
+    low = center - width / 2
+    scaled = np.clip((values - low) * (255.0 / width), 0, 255)
+    if invert:
+        scaled = 255 - scaled
+    return scaled.astype(np.uint8)
+
+
+def render_pixels(
+    frame: np.ndarray,
+    meta: Dict[str, Any],
+    max_size: int,
+    modality: Optional[str] = None,
+    window: Optional[Tuple[float, float]] = None,
+) -> np.ndarray:
+    """将原始帧渲染为8位灰度（或RGB）图像"""
+    values = downsample(frame, max_size)
+    if values.ndim == 3:
+        # 彩色图像不做窗宽窗位，仅按位深缩放
+        peak = 255.0 if frame.dtype == np.uint8 else max(float(values.max()), 1.0)
+        return np.clip(values * (255.0 / peak), 0, 255).astype(np.uint8)
+
+    values = values * meta.get("rescale_slope", 1.0) + meta.get("rescale_intercept", 0.0)
+    center, width = window or resolve_window(values, meta, modality)
+    invert = meta.get("photometric_interpretation") == "MONOCHROME1"
+    return apply_window(values, center, width, invert)
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+def encode_png(pixels: np.ndarray) -> bytes:
+    """8位灰度/RGB图像编码为PNG（每行使用Up过滤）"""
+    height, width = pixels.shape[:2]
+    color_type = 2 if pixels.ndim == 3 else 0
+    rows = np.ascontiguousarray(pixels, dtype=np.uint8).reshape(height, -1)
+    filtered = rows.copy()
+    filtered[1:] -= rows[:-1]
+    raw = np.hstack([np.full((height, 1), 2, dtype=np.uint8), filtered]).tobytes()
+    return (
+        PNG_SIGNATURE
+        + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+        + _png_chunk(b"IDAT", zlib.compress(raw, 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def encode_image(pixels: np.ndarray, fmt: str) -> bytes:
+    if fmt == "png":
+        return encode_png(pixels)
+    if fmt == "webp" and Image is not None:
+        buffer = BytesIO()
+        Image.fromarray(pixels).save(buffer, format="WEBP", quality=80)
+        return buffer.getvalue()
+    raise ValueError(f"不支持的图像格式: {fmt}")
+
+
+def render_frame(
+    file_path: Path,
+    index: Optional[int] = None,
+    kind: str = "thumbnail",
+    fmt: str = "png",
+    modality: Optional[str] = None,
+    window: Optional[Tuple[float, float]] = None,
+) -> bytes:
+    """渲染指定帧（默认关键层）为图像字节"""
+    if index is None:
+        index = key_frame_index(frame_count(file_path))
+    frame, meta = read_frame(file_path, index)
+    return encode_image(render_pixels(frame, meta, RENDER_SIZES[kind], modality, window), fmt)
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """先写临时文件再原子替换，避免并发请求读到写了一半的缓存文件"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def render_path(sha256: str, kind: str, index: Optional[int], fmt: str) -> Path:
+    frame = "key" if index is None else str(index)
+    return blob_store.render_dir(sha256) / f"{kind}_{frame}.{fmt}"
+
+
+def get_render(
+    file_path: Path,
+    sha256: str,
+    kind: str = "thumbnail",
+    fmt: str = "png",
+    index: Optional[int] = None,
+    modality: Optional[str] = None,
+) -> Path:
+    """获取默认窗的渲染结果，未命中时生成并写入缓存（内容哈希相同的文件共享渲染）"""
+    path = render_path(sha256, kind, index, fmt)
+    if path.exists():
+        return path
+    write_atomic(path, render_frame(file_path, index, kind, fmt, modality))
+    return path
+
+
+def precompute_renders(file_path: Path, sha256: str, modality: Optional[str] = None) -> None:
+    """上传后预先转换体积数据（NIfTI）并生成缩略图和关键层预览（失败只记录日志，访问时会按需重试）"""
+    if blob_store.file_extension(file_path.name) in (".nii", ".nii.gz"):
+        try:
+            volume_store.ensure_volume(file_path, sha256)
+        except Exception as e:
+            logger.error(f"转换体积数据失败: {file_path}: {e}")
+    for kind in RENDER_SIZES:
+        try:
+            get_render(file_path, sha256, kind, "png", modality=modality)
+        except Exception as e:
+            logger.error(f"生成预览失败: {file_path} ({kind}): {e}")
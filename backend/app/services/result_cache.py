@@ -0,0 +1,244 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+from app.services.ai_metadata import get_model_info
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.executors import ExecutorBusyError, io_executor
+
+logger = logging.getLogger(__name__)
+
+# 缓存键: (文件内容SHA-256, 影像模态, 模型版本)
+CacheKey = Tuple[str, str, str]
+Entry = Tuple[float, Dict[str, Any]]
+
+# 磁盘缓存索引：每个条目一个 JSON 文件，索引记录其模型版本、会话与最近访问时间，
+# 所有 worker 进程共享，淘汰按最近访问时间（LRU）进行，不需要扫描目录
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    session_id TEXT,
+    stored_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+CREATE INDEX IF NOT EXISTS idx_entries_session ON entries(session_id);
+"""
+
+
+class ResultCache:
+    """推理结果缓存：内存LRU + 磁盘二级缓存，按模型版本失效
+
+    磁盘读写在I/O线程池中执行；内存命中时也会在共享索引中确认条目仍然有效并刷新访问时间，
+    因此其他 worker 的淘汰与失效对本进程同样生效。
+    """
+
+    def __init__(self, max_entries: int, ttl: float, disk_dir: Optional[Path], disk_max_entries: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[CacheKey, Entry]" = OrderedDict()
+        self._model_version: Optional[str] = None
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self.hits = 0
+        self.misses = 0
+
+    async def model_version(self, client: httpx.AsyncClient) -> Optional[str]:
+        """当前模型版本（取自共享的模型信息缓存），版本变化时清除旧版本的条目"""
+        try:
+            version = str((await get_model_info(client))["version"])
+        except (httpx.HTTPError, CircuitOpenError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"无法获取模型版本，跳过结果缓存: {e}")
+            return None
+        if self._model_version is not None and version != self._model_version:
+            logger.info(f"模型版本变化 {self._model_version} -> {version}，清除旧版本的结果缓存")
+            self._memory.clear()
+            if self.disk_dir is not None:
+                await self._run_disk(self._drop_other_versions, version)
+        self._model_version = version
+        return version
+
+    async def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        """读取缓存：先查内存，再查磁盘并回填内存"""
+        entry = self._memory.get(key)
+        if entry is not None and time.time() - entry[0] > self.ttl:
+            del self._memory[key]
+            entry = None
+        if self.disk_dir is not None:
+            entry = await self._run_disk(self._lookup_disk, key, entry)
+            if entry is None:
+                self._memory.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._remember(key, entry)
+        self.hits += 1
+        return entry[1]
+
+    async def put(self, key: CacheKey, value: Dict[str, Any]) -> None:
+        """写入缓存（内存与磁盘）"""
+        entry = (time.time(), value)
+        self._remember(key, entry)
+        if self.disk_dir is not None:
+            await self._run_disk(self._write_disk, key, entry)
+
+    async def invalidate_session(self, session_id: str) -> None:
+        """会话被删除后，引用该会话的缓存结果随之失效（其他 worker 的内存条目在下次命中时于索引中确认失效）"""
+        for key in [key for key, (_, value) in self._memory.items() if value.get("session_id") == session_id]:
+            del self._memory[key]
+        if self.disk_dir is not None:
+            await self._run_disk(self._drop_session, session_id)
+
+    def clear(self) -> None:
+        """清空内存与磁盘缓存"""
+        self._memory.clear()
+        if self.disk_dir is not None and self.disk_dir.exists():
+            with self._connection() as conn:
+                conn.execute("DELETE FROM entries")
+            for path in self.disk_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "model_version": self._model_version
+        }
+
+    def _remember(self, key: CacheKey, entry: Entry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def _run_disk(self, func, *args) -> Any:
+        """磁盘缓存只是加速手段：线程池繁忙或读写失败时按未命中/未写入处理"""
+        try:
+            return await io_executor.run(func, *args)
+        except (ExecutorBusyError, OSError, sqlite3.Error) as e:
+            logger.warning(f"结果缓存磁盘读写失败: {e}")
+            return None
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        if not self._initialized:
+            self._init()
+        conn = sqlite3.connect(str(self.disk_dir / "index.db"), timeout=30.0)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _init(self) -> None:
+        with self._init_lock:
+            if self._initialized:
+                return
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            fresh = not (self.disk_dir / "index.db").exists()
+            conn = sqlite3.connect(str(self.disk_dir / "index.db"), timeout=30.0)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                conn.commit()
+            finally:
+                conn.close()
+            if fresh:
+                # 旧版本没有索引的缓存文件无法参与淘汰，直接清除
+                for path in self.disk_dir.glob("*.json"):
+                    path.unlink(missing_ok=True)
+            self._initialized = True
+
+    @staticmethod
+    def _entry_name(key: CacheKey) -> str:
+        return hashlib.sha256("|".join(key).encode("utf-8")).hexdigest()
+
+    def _disk_path(self, name: str) -> Path:
+        return self.disk_dir / f"{name}.json"
+
+    def _lookup_disk(self, key: CacheKey, cached: Optional[Entry]) -> Optional[Entry]:
+        """在索引中刷新访问时间（条目已淘汰、失效或过期时返回 None），内存未命中时再读文件"""
+        name = self._entry_name(key)
+        now = time.time()
+        with self._connection() as conn:
+            touched = conn.execute(
+                "UPDATE entries SET last_used = ? WHERE name = ? AND stored_at >= ?", (now, name, now - self.ttl)
+            ).rowcount
+        if not touched:
+            return None
+        if cached is not None:
+            return cached
+        try:
+            with open(self._disk_path(name), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if tuple(data.get("key", ())) != key:
+            return None
+        return data["stored_at"], data["value"]
+
+    def _write_disk(self, key: CacheKey, entry: Entry) -> None:
+        name = self._entry_name(key)
+        if not self._initialized:
+            self._init()
+        path = self._disk_path(name)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": list(key), "stored_at": entry[0], "value": entry[1]}, f, ensure_ascii=False)
+        tmp_path.replace(path)
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (name, version, session_id, stored_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (name, key[2], entry[1].get("session_id"), entry[0], entry[0])
+            )
+            self._evict_disk(conn)
+
+    def _evict_disk(self, conn: sqlite3.Connection) -> None:
+        """磁盘缓存超出条目上限时淘汰最久未使用的条目"""
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        overflow = count - self.disk_max_entries
+        if overflow <= 0:
+            return
+        rows = conn.execute("SELECT name FROM entries ORDER BY last_used LIMIT ?", (overflow,)).fetchall()
+        self._remove(conn, [name for (name,) in rows])
+
+    def _drop_other_versions(self, version: str) -> None:
+        with self._connection() as conn:
+            rows = conn.execute("SELECT name FROM entries WHERE version != ?", (version,)).fetchall()
+            self._remove(conn, [name for (name,) in rows])
+
+    def _drop_session(self, session_id: str) -> None:
+        with self._connection() as conn:
+            rows = conn.execute("SELECT name FROM entries WHERE session_id = ?", (session_id,)).fetchall()
+            self._remove(conn, [name for (name,) in rows])
+
+    def _remove(self, conn: sqlite3.Connection, names) -> None:
+        conn.executemany("DELETE FROM entries WHERE name = ?", [(name,) for name in names])
+        for name in names:
+            self._disk_path(name).unlink(missing_ok=True)
+
+
+result_cache = ResultCache(
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    ttl=settings.RESULT_CACHE_TTL,
+    disk_dir=settings.RESULT_CACHE_DIR,
+    disk_max_entries=settings.RESULT_CACHE_DISK_MAX_ENTRIES
+)
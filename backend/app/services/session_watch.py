@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.config import settings
+from app.services.circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# AI服务会话的结束状态，到达后停止轮询并关闭推送
+SESSION_FINISHED_STATES = ("completed", "failed", "error", "cancelled", "not_found")
+
+
+@dataclass
+class WatchedSession:
+    """被订阅的AI分析会话：一个轮询任务，多个订阅者"""
+    session_id: str
+    subscribers: List[asyncio.Queue] = field(default_factory=list)
+    snapshot: Optional[Dict[str, Any]] = None
+    updated_monotonic: float = 0.0
+    task: Optional[asyncio.Task] = None
+
+
+class SessionWatcher:
+    """AI会话状态的扇出推送：每个会话只向AI服务轮询一次，状态变化时推送给所有订阅者
+
+    对AI服务的轮询量与活跃会话数成正比，与观看的客户端数量无关；
+    会话结束或最后一个订阅者离开后停止轮询。
+    """
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self.sessions: Dict[str, WatchedSession] = {}
+
+    def subscribe(self, client: httpx.AsyncClient, session_id: str) -> asyncio.Queue:
+        """订阅会话状态；已有最新状态时立即推送一次"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = WatchedSession(session_id=session_id)
+            session.task = asyncio.create_task(self._poll(client, session))
+        queue: asyncio.Queue = asyncio.Queue()
+        if session.snapshot is not None:
+            queue.put_nowait(session.snapshot)
+        session.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, session_id: str, queue: asyncio.Queue) -> None:
+        session = self.sessions.get(session_id)
+        if session is not None and queue in session.subscribers:
+            session.subscribers.remove(queue)
+
+    def cached_status(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """正在推送的会话在一个轮询周期内的状态，可直接用于状态查询而不再请求AI服务"""
+        session = self.sessions.get(session_id)
+        if session is None or session.snapshot is None or "error" in session.snapshot:
+            return None
+        if time.monotonic() - session.updated_monotonic > self.poll_interval:
+            return None
+        return session.snapshot
+
+    async def stop(self) -> None:
+        tasks = [session.task for session in self.sessions.values() if session.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.sessions.clear()
+
+    def _publish(self, session: WatchedSession, snapshot: Dict[str, Any]) -> None:
+        session.snapshot = snapshot
+        for queue in session.subscribers:
+            queue.put_nowait(snapshot)
+
+    async def _fetch(self, client: httpx.AsyncClient, session_id: str) -> Dict[str, Any]:
+        try:
+            response = await client.get(f"/sessions/{session_id}/status")
+        except (httpx.RequestError, CircuitOpenError) as e:
+            return {"session_id": session_id, "status": "unavailable", "error": f"AI service error: {str(e)}"}
+        if response.status_code == 404:
+            return {"session_id": session_id, "status": "not_found", "error": "会话不存在"}
+        if response.status_code != 200:
+            return {"session_id": session_id, "status": "unavailable", "error": f"AI service error: {response.text}"}
+        return response.json()
+
+    async def _poll(self, client: httpx.AsyncClient, session: WatchedSession) -> None:
+        try:
+            while session.subscribers:
+                snapshot = await self._fetch(client, session.session_id)
+                session.updated_monotonic = time.monotonic()
+                if snapshot != session.snapshot:
+                    self._publish(session, snapshot)
+                if snapshot.get("status") in SESSION_FINISHED_STATES:
+                    break
+                await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            logger.error(f"会话状态轮询失败: {session.session_id}, 错误信息: {e}")
+            self._publish(session, {"session_id": session.session_id, "status": "error", "error": str(e)})
+        finally:
+            # 检查订阅者与移除会话之间没有await，新订阅者不会落入已结束的轮询
+            if self.sessions.get(session.session_id) is session:
+                del self.sessions[session.session_id]
+
+
+session_watcher = SessionWatcher(poll_interval=settings.AI_SESSION_POLL_INTERVAL)
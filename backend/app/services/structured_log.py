@@ -0,0 +1,187 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+
+# 当前请求的关联ID（由 RequestIdMiddleware 设置，日志记录自动带上）
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# LogRecord 的标准属性，其余属性视为通过 extra= 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """按调用位置限流：每个位置每秒最多 rate 条，超出后每 sample_every 条保留一条
+
+    只作用于 WARNING 以下级别；被丢弃的条数附在该位置下一条保留的日志上（suppressed 字段）。
+    """
+
+    def __init__(self, rate: float, sample_every: int):
+        super().__init__()
+        self.rate = rate
+        self.sample_every = sample_every
+        self._sites: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            # [令牌数, 上次补充时间, 已丢弃条数]
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [self.rate, now, 0]
+            site[0] = min(self.rate, site[0] + (now - site[1]) * self.rate)
+            site[1] = now
+            if site[0] >= 1:
+                site[0] -= 1
+            else:
+                site[2] += 1
+                if self.sample_every <= 0 or site[2] % self.sample_every:
+                    return False
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """单行JSON：时间、级别、logger、消息、请求ID，以及 extra= 传入的字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not getattr(record, "request_id", None):
+            record.request_id = "-"
+        line = super().format(record)
+        suppressed = getattr(record, "suppressed", None)
+        return f"{line} (另有 {suppressed} 条相同位置的日志被限流)" if suppressed else line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时直接丢弃并计数，调用方永远不会因为日志输出而阻塞"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 格式化留给后台线程；这里只固定消息参数和异常，避免跨线程引用可变对象
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def setup_logging() -> None:
+    """配置根logger：请求ID → 限流采样 → 有界队列 → 后台线程格式化并写 stdout"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter())
+
+    handler = _handler = NonBlockingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(RateLimitFilter(settings.LOG_RATE_LIMIT, settings.LOG_SAMPLE_EVERY))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """停止后台线程并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_count() -> int:
+    """因队列已满被丢弃的日志条数"""
+    return _handler.dropped if _handler is not None else 0
+
+
+class RequestIdMiddleware:
+    """ASGI中间件：沿用客户端传入的 X-Request-ID（否则生成），写入日志上下文并在响应头中返回"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        header = REQUEST_ID_HEADER.lower().encode()
+        incoming = next((value for key, value in scope["headers"] if key == header), None)
+        request_id = incoming.decode("latin-1")[:128] if incoming else uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,170 @@
+import json
+import struct
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services import blob_store
+from app.services.dicom_service import read_frame
+from app.services.render_service import encode_image, render_pixels, resolve_window, write_atomic
+
+# 金字塔文件格式（每帧一个文件，存放在该内容哈希的渲染缓存目录下）:
+#   魔数(8字节) | 头部长度(uint32, 小端) | JSON头部 | 各层像素数据
+# 每层按瓦片优先顺序存储（tiles_y, tiles_x, tile, tile[, samples]），边缘瓦片补零，
+# 因此任意瓦片都是文件中的一段连续字节，一次 seek + read 即可取出。
+# 层级0为原始分辨率，层级越高分辨率越低（每层长宽减半）。
+PYRAMID_MAGIC = b"BCTILE1\0"
+
+
+def pyramid_path(sha256: str, index: int) -> Path:
+    return blob_store.render_dir(sha256) / f"frame_{index}.tiles"
+
+
+def halve(level: np.ndarray) -> np.ndarray:
+    """2x2 块均值降采样，奇数边复制边缘像素补齐"""
+    pad = [(0, level.shape[0] % 2), (0, level.shape[1] % 2)] + [(0, 0)] * (level.ndim - 2)
+    padded = np.pad(level, pad, mode="edge").astype(np.float32)
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2, *padded.shape[2:])
+    reduced = blocks.mean(axis=(1, 3))
+    if np.issubdtype(level.dtype, np.integer):
+        reduced = np.rint(reduced)
+    return reduced.astype(level.dtype)
+
+
+def to_tiles(level: np.ndarray, tile_size: int) -> np.ndarray:
+    """补零到瓦片整数倍并重排为瓦片优先布局"""
+    height, width = level.shape[:2]
+    tiles_y, tiles_x = -(-height // tile_size), -(-width // tile_size)
+    pad = [(0, tiles_y * tile_size - height), (0, tiles_x * tile_size - width)] + [(0, 0)] * (level.ndim - 2)
+    padded = np.pad(level, pad)
+    tiled = padded.reshape(tiles_y, tile_size, tiles_x, tile_size, *level.shape[2:])
+    return np.ascontiguousarray(tiled.swapaxes(1, 2))
+
+
+def build_pyramid(
+    file_path: Path,
+    index: int,
+    modality: Optional[str] = None,
+    tile_size: Optional[int] = None,
+) -> Tuple[Dict[str, Any], bytes]:
+    """读取一帧并生成多分辨率瓦片金字塔，返回 (头部, 文件内容)"""
+    tile_size = tile_size or settings.TILE_SIZE
+    frame, meta = read_frame(file_path, index)
+
+    levels = [np.ascontiguousarray(frame)]
+    while max(levels[-1].shape[:2]) > tile_size:
+        levels.append(halve(levels[-1]))
+
+    window = None
+    if frame.ndim == 2:
+        # 统一在最低分辨率层上确定默认窗，保证所有瓦片亮度一致
+        coarse = levels[-1].astype(np.float32) * meta["rescale_slope"] + meta["rescale_intercept"]
+        window = list(resolve_window(coarse, meta, modality))
+
+    header = {
+        "tile_size": tile_size,
+        "frame": index,
+        "frame_count": meta["frame_count"],
+        "dtype": frame.dtype.str,
+        "samples_per_pixel": frame.shape[2] if frame.ndim == 3 else 1,
+        "rescale_slope": meta["rescale_slope"],
+        "rescale_intercept": meta["rescale_intercept"],
+        "photometric_interpretation": meta.get("photometric_interpretation"),
+        "window": window,
+        "levels": [],
+    }
+    chunks = []
+    offset = 0
+    for level in levels:
+        tiles = to_tiles(level, tile_size)
+        header["levels"].append({
+            "width": level.shape[1],
+            "height": level.shape[0],
+            "tiles_x": tiles.shape[1],
+            "tiles_y": tiles.shape[0],
+            "offset": offset,
+        })
+        chunks.append(tiles.tobytes())
+        offset += tiles.nbytes
+
+    encoded = json.dumps(header).encode()
+    return header, PYRAMID_MAGIC + struct.pack("<I", len(encoded)) + encoded + b"".join(chunks)
+
+
+def read_pyramid_header(path: Path) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        if f.read(len(PYRAMID_MAGIC)) != PYRAMID_MAGIC:
+            raise ValueError(f"无效的瓦片金字塔文件: {path}")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length))
+    header["data_offset"] = len(PYRAMID_MAGIC) + 4 + length
+    return header
+
+
+def cached_pyramid(sha256: str, index: int) -> Optional[Tuple[Path, Dict[str, Any]]]:
+    """已缓存的瓦片金字塔（只读头部，不解码影像）；尚未生成时返回 None"""
+    path = pyramid_path(sha256, index)
+    try:
+        return path, read_pyramid_header(path)
+    except FileNotFoundError:
+        return None
+
+
+def get_pyramid(
+    file_path: Path,
+    sha256: str,
+    index: int,
+    modality: Optional[str] = None,
+) -> Tuple[Path, Dict[str, Any]]:
+    """获取帧的瓦片金字塔，未生成时即时构建并写入缓存"""
+    path = pyramid_path(sha256, index)
+    if not path.exists():
+        _, data = build_pyramid(file_path, index, modality)
+        write_atomic(path, data)
+    return path, read_pyramid_header(path)
+
+
+def read_tile(path: Path, header: Dict[str, Any], level: int, x: int, y: int) -> np.ndarray:
+    """只读取单个瓦片的字节，裁掉边缘补零部分"""
+    if not 0 <= level < len(header["levels"]):
+        raise IndexError(f"层级越界: {level}")
+    info = header["levels"][level]
+    if not (0 <= x < info["tiles_x"] and 0 <= y < info["tiles_y"]):
+        raise IndexError(f"瓦片越界: ({x}, {y})")
+
+    tile_size = header["tile_size"]
+    samples = header["samples_per_pixel"]
+    dtype = np.dtype(header["dtype"])
+    shape = (tile_size, tile_size, samples) if samples > 1 else (tile_size, tile_size)
+    tile_bytes = tile_size * tile_size * samples * dtype.itemsize
+
+    with open(path, "rb") as f:
+        f.seek(header["data_offset"] + info["offset"] + (y * info["tiles_x"] + x) * tile_bytes)
+        tile = np.frombuffer(f.read(tile_bytes), dtype=dtype).reshape(shape)
+    return tile[:min(tile_size, info["height"] - y * tile_size), :min(tile_size, info["width"] - x * tile_size)]
+
+
+def render_tile(
+    tile: np.ndarray,
+    header: Dict[str, Any],
+    window: Optional[Tuple[float, float]] = None,
+) -> np.ndarray:
+    """按金字塔统一的默认窗（或指定窗）将瓦片渲染为8位图像"""
+    meta = {
+        "rescale_slope": header["rescale_slope"],
+        "rescale_intercept": header["rescale_intercept"],
+        "photometric_interpretation": header["photometric_interpretation"],
+    }
+    default = tuple(header["window"]) if header["window"] else None
+    return render_pixels(tile, meta, header["tile_size"], window=window or default)
+
+
+def encode_tile(
+    tile: np.ndarray,
+    header: Dict[str, Any],
+    fmt: str = "png",
+    window: Optional[Tuple[float, float]] = None,
+) -> bytes:
+    return encode_image(render_tile(tile, header, window), fmt)
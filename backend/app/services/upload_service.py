@@ -0,0 +1,172 @@
+import hashlib
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from app.config import settings
+from app.services.metrics import observe_upload
+
+
+class FileTooLargeError(Exception):
+    """上传文件超过大小限制"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"文件大小超过限制: {max_size / (1024 * 1024):g}MB")
+
+
+class UploadLimitMiddleware:
+    """ASGI中间件：在框架解析（并落盘）整个请求体之前执行大小上限
+
+    Content-Length 超限时直接返回413，不读取请求体；分块传输等未声明长度的请求边接收边计数，
+    超限时中止解析并返回413。limits 按路径指定上限，其余请求使用 default。
+    """
+
+    def __init__(self, app, limits: Dict[str, int], default: int):
+        self.app = app
+        self.limits = limits
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+
+        limit = self.limits.get(scope["path"], self.default)
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            return await self._reject(scope, receive, send, limit)
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def receive_wrapper():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise FileTooLargeError(limit)
+            return message
+
+        async def send_wrapper(message):
+            nonlocal started
+            # 超限后丢弃应用因解析中断而产生的错误响应，改为返回413
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            await self._reject(scope, receive, send, limit)
+
+    @staticmethod
+    async def _reject(scope, receive, send, limit: int) -> None:
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"请求体大小超过限制: {limit / (1024 * 1024):g}MB"},
+            headers={"Connection": "close"}
+        )
+        await response(scope, receive, send)
+
+
+@dataclass
+class StoredUpload:
+    """已落盘的上传文件"""
+    path: Path
+    size: int
+    sha256: str
+
+
+async def stream_to_temp(
+    file: UploadFile,
+    max_size: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    suffix: str = ".part"
+) -> StoredUpload:
+    """按固定块大小将上传流写入临时文件，边写边计算SHA-256并校验大小上限"""
+    max_size = settings.MAX_FILE_SIZE if max_size is None else max_size
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    settings.TEMP_DIR.mkdir(parents=True, exist_ok=True)
+
+    fd, tmp_name = tempfile.mkstemp(dir=settings.TEMP_DIR, suffix=suffix)
+    tmp_path = Path(tmp_name)
+    digest = hashlib.sha256()
+    size = 0
+    start = time.perf_counter()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+                digest.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    observe_upload("http", size, time.perf_counter() - start)
+    return StoredUpload(path=tmp_path, size=size, sha256=digest.hexdigest())
+
+
+def spool_to_temp(
+    fileobj: BinaryIO,
+    max_size: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    suffix: str = ".part"
+) -> StoredUpload:
+    """同步版本：将文件对象（如压缩包成员）分块写入临时文件，边写边哈希并校验大小上限"""
+    max_size = settings.MAX_FILE_SIZE if max_size is None else max_size
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    settings.TEMP_DIR.mkdir(parents=True, exist_ok=True)
+
+    fd, tmp_name = tempfile.mkstemp(dir=settings.TEMP_DIR, suffix=suffix)
+    tmp_path = Path(tmp_name)
+    digest = hashlib.sha256()
+    size = 0
+    start = time.perf_counter()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    observe_upload("archive", size, time.perf_counter() - start)
+    return StoredUpload(path=tmp_path, size=size, sha256=digest.hexdigest())
+
+
+def commit_upload(stored: StoredUpload, dest: Path) -> StoredUpload:
+    """将临时文件原子重命名到目标路径"""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(stored.path, dest)
+    stored.path = dest
+    return stored
+
+
+def discard_upload(stored: StoredUpload) -> None:
+    """删除未提交的临时文件"""
+    stored.path.unlink(missing_ok=True)
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import nibabel as nib
+import numpy as np
+
+from app.config import settings
+from app.services import blob_store
+
+logger = logging.getLogger(__name__)
+
+# 体积存储：NIfTI 的体素数据一次性解压为未压缩的原始文件（与 NIfTI 磁盘布局相同，Fortran 顺序），
+# 之后按层/层块/ROI 读取都通过内存映射完成，只触及所需的页面，重复访问只是页缓存读取。
+# 形状、数据类型、仿射矩阵与缩放参数记录在旁边的 JSON 文件中（旁车文件存在即表示转换完成）。
+# 未压缩的 .nii 无需转换，旁车文件直接指向原文件中的数据偏移。
+# 两者都放在内容哈希对应的渲染缓存目录下，随 blob 一起回收。
+VOLUME_VERSION = 1
+VOLUME_DATA = "volume.raw"
+VOLUME_SIDECAR = "volume.json"
+
+
+def sidecar_path(sha256: str) -> Path:
+    return blob_store.render_dir(sha256) / VOLUME_SIDECAR
+
+
+def _write_json_atomic(path: Path, data: Dict[str, Any]) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".part")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def convert_volume(file_path: Path, sha256: str, chunk_size: Optional[int] = None) -> Dict[str, Any]:
+    """把 NIfTI 转换为可内存映射的布局并写入旁车文件，返回旁车内容
+
+    数据区本身已是连续的 Fortran 顺序数组，转换只是按块解压复制，内存占用恒定。
+    """
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    img = nib.load(str(file_path))
+    proxy = img.dataobj
+    shape = tuple(int(n) for n in proxy.shape)
+    if len(shape) < 3:
+        raise ValueError(f"NIfTI文件维度不足: {shape}")
+    dtype = np.dtype(proxy.dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+
+    directory = blob_store.render_dir(sha256)
+    directory.mkdir(parents=True, exist_ok=True)
+    if str(file_path).lower().endswith(".nii"):
+        data_file, offset = Path(file_path), int(proxy.offset)
+    else:
+        data_file, offset = directory / VOLUME_DATA, 0
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with nib.openers.ImageOpener(str(file_path)) as source, os.fdopen(fd, "wb") as out:
+                source.seek(int(proxy.offset))
+                remaining = nbytes
+                while remaining:
+                    chunk = source.read(min(chunk_size, remaining))
+                    if not chunk:
+                        raise ValueError(f"NIfTI数据不完整: {file_path}")
+                    out.write(chunk)
+                    remaining -= len(chunk)
+            os.replace(tmp, data_file)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    sidecar = {
+        "version": VOLUME_VERSION,
+        "data_file": str(data_file),
+        "offset": offset,
+        "shape": list(shape),
+        "dtype": dtype.str,
+        "affine": img.affine.tolist(),
+        # nibabel 加载时把缩放参数移到代理上，头部中的值已被重置
+        "slope": 1.0 if proxy.slope is None or not np.isfinite(proxy.slope) else float(proxy.slope),
+        "intercept": 0.0 if proxy.inter is None or not np.isfinite(proxy.inter) else float(proxy.inter),
+    }
+    _write_json_atomic(directory / VOLUME_SIDECAR, sidecar)
+    logger.info(f"体积数据已转换: {file_path} -> {data_file} ({nbytes} 字节)")
+    return sidecar
+
+
+class Volume:
+    """内存映射的体积：读取方法返回所需区域的副本，像素值未经缩放（slope/intercept 另行提供）"""
+
+    def __init__(self, sidecar: Dict[str, Any]):
+        self.shape: Tuple[int, ...] = tuple(sidecar["shape"])
+        self.dtype = np.dtype(sidecar["dtype"])
+        self.affine = np.array(sidecar["affine"])
+        self.slope = sidecar["slope"]
+        self.intercept = sidecar["intercept"]
+        self.data = np.memmap(
+            sidecar["data_file"], dtype=self.dtype, mode="r",
+            offset=sidecar["offset"], shape=self.shape, order="F",
+        )
+
+    @property
+    def slice_count(self) -> int:
+        return self.shape[2]
+
+    def _check_slices(self, start: int, stop: int) -> None:
+        if not 0 <= start < stop <= self.slice_count:
+            raise IndexError(f"层索引越界: [{start}, {stop})")
+
+    def _volume(self, volume: int) -> np.ndarray:
+        """4D 数据取第 volume 个时间点"""
+        if len(self.shape) == 3:
+            return self.data
+        if not 0 <= volume < int(np.prod(self.shape[3:])):
+            raise IndexError(f"时间点越界: {volume}")
+        return self.data.reshape(self.shape[:3] + (-1,), order="F")[..., volume]
+
+    def read_slice(self, index: int, volume: int = 0) -> np.ndarray:
+        """单层 (i, j)：一段连续字节"""
+        self._check_slices(index, index + 1)
+        return np.array(self._volume(volume)[:, :, index])
+
+    def read_slab(self, start: int, stop: int, volume: int = 0) -> np.ndarray:
+        """连续多层 (i, j, 层数)：一段连续字节"""
+        self._check_slices(start, stop)
+        return np.array(self._volume(volume)[:, :, start:stop], order="F")
+
+    def read_roi(self, start: Tuple[int, int, int], stop: Tuple[int, int, int], volume: int = 0) -> np.ndarray:
+        """三维感兴趣区 [start, stop)：每层只读取包含该区域的行"""
+        if not all(0 <= a < b <= n for a, b, n in zip(start, stop, self.shape[:3])):
+            raise IndexError(f"ROI越界: {list(start)} - {list(stop)}，体积形状 {list(self.shape[:3])}")
+        region = tuple(slice(a, b) for a, b in zip(start, stop))
+        return np.array(self._volume(volume)[region], order="F")
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "shape": list(self.shape),
+            "dtype": self.dtype.str,
+            "affine": self.affine.tolist(),
+            "spacing": np.linalg.norm(self.affine[:3, :3], axis=0).round(6).tolist(),
+            "rescale_slope": self.slope,
+            "rescale_intercept": self.intercept,
+        }
+
+
+# 每个进程缓存已打开的内存映射（进程池中的工作进程各自持有）
+_handles: "OrderedDict[str, Volume]" = OrderedDict()
+_handles_lock = threading.Lock()
+
+
+def _load_sidecar(sha256: str) -> Optional[Dict[str, Any]]:
+    try:
+        sidecar = json.loads(sidecar_path(sha256).read_text())
+    except (OSError, ValueError):
+        return None
+    if sidecar.get("version") != VOLUME_VERSION or not Path(sidecar["data_file"]).exists():
+        return None
+    return sidecar
+
+
+def open_volume(file_path: Path, sha256: str) -> Volume:
+    """打开体积（首次访问时转换），结果按内容哈希缓存"""
+    with _handles_lock:
+        volume = _handles.get(sha256)
+        if volume is not None:
+            _handles.move_to_end(sha256)
+            return volume
+    sidecar = _load_sidecar(sha256) or convert_volume(file_path, sha256)
+    volume = Volume(sidecar)
+    with _handles_lock:
+        _handles[sha256] = volume
+        while len(_handles) > settings.VOLUME_HANDLE_CACHE:
+            _handles.popitem(last=False)
+    return volume
+
+
+def open_stored_volume(file_path: Path) -> Optional[Volume]:
+    """blob 存储中的 NIfTI 返回内存映射体积，其他文件返回 None（由调用方回退到 nibabel）"""
+    sha256 = blob_store.stored_sha256(file_path)
+    return open_volume(file_path, sha256) if sha256 else None
+
+
+def ensure_volume(file_path: Path, sha256: str) -> None:
+    """上传后预先转换（已转换时跳过）"""
+    if _load_sidecar(sha256) is None:
+        convert_volume(file_path, sha256)
+
+
+def evict(sha256: str) -> None:
+    with _handles_lock:
+        _handles.pop(sha256, None)
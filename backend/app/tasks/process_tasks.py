@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional
+
+from app.config import settings
+from app.services.executors import ExecutorBusyError, io_executor
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED)
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+@dataclass
+class Job:
+    """后台任务"""
+    job_id: str
+    kind: str
+    handler: Callable[["Job"], Awaitable[Any]]
+    cleanup: Optional[Callable[[], None]] = None
+    status: str = JOB_PENDING
+    progress: float = 0.0
+    message: Optional[str] = None
+    result: Any = None
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    finished_monotonic: Optional[float] = None
+    subscribers: List[asyncio.Queue] = field(default_factory=list)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """任务状态快照（用于状态查询和进度事件）"""
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+
+_JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    snapshot TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs(updated);
+"""
+
+
+class JobStore:
+    """任务状态快照的共享存储：任务在提交它的 worker 进程内执行，多 worker 时其他 worker 从这里查询"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._initialized = False
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=5.0)
+        try:
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_JOB_SCHEMA)
+                self._initialized = True
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def save_many(self, snapshots: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO jobs (job_id, snapshot, updated) VALUES (?, ?, ?)",
+                [(snapshot["job_id"], json.dumps(snapshot, ensure_ascii=False), now) for snapshot in snapshots]
+            )
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connection() as conn:
+            row = conn.execute("SELECT snapshot FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def prune(self, max_age: float) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM jobs WHERE updated < ?", (time.time() - max_age,))
+
+
+class JobQueue:
+    """进程内任务队列：有界等待队列 + 固定数量的worker（即并发上限）
+
+    共享存储的写入在I/O线程池中进行：进度更新按 flush_interval 合并为批量写入，提交和结束时立即唤醒写入；
+    过期任务按 prune_interval 定期清理。
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_queue: int,
+        result_ttl: float,
+        store: Optional[JobStore] = None,
+        flush_interval: float = 0.5,
+        prune_interval: float = 60.0
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.store = store
+        self.flush_interval = flush_interval
+        self.prune_interval = prune_interval
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        # 等待中任务的ID，按入队顺序（worker 按 FIFO 取出）
+        self._waiting: Deque[str] = deque()
+        self._worker_tasks: List[asyncio.Task] = []
+        self._background: List[asyncio.Task] = []
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._flush_now: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+
+    async def start(self) -> None:
+        """启动worker与后台维护任务"""
+        self._closing = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._waiting.clear()
+        self._flush_now = asyncio.Event()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._background = [asyncio.create_task(self._prune_periodically())]
+        if self.store is not None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self, timeout: float = 0) -> None:
+        """停止接收新任务，等待已提交的任务完成（最多 timeout 秒），之后取消剩余任务"""
+        self._closing = True
+        if timeout > 0 and self._queue is not None and self._worker_tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"等待后台任务完成超时（{timeout}秒），取消剩余任务")
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._waiting.clear()
+        for job in self.jobs.values():
+            if job.status == JOB_PENDING:
+                self._finish(job, JOB_FAILED, error="服务关闭，任务已取消")
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        self._background = []
+        # 批量写入任务不取消（中途取消会丢失已取出的快照）：唤醒它写入最后的状态（包括上面取消的任务）后退出
+        if self._flusher is not None:
+            flusher, self._flusher = self._flusher, None
+            self._flush_now.set()
+            await asyncio.gather(flusher, return_exceptions=True)
+        await self._flush()
+
+    def submit(
+        self,
+        kind: str,
+        handler: Callable[[Job], Awaitable[Any]],
+        cleanup: Optional[Callable[[], None]] = None
+    ) -> Job:
+        """提交任务并立即返回；队列已满时抛出 QueueFullError"""
+        if self._queue is None:
+            raise RuntimeError("任务队列未启动")
+        if self._closing:
+            raise QueueFullError("服务正在关闭，暂不接收新任务")
+        job = Job(job_id=str(uuid.uuid4()), kind=kind, handler=handler, cleanup=cleanup)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"任务队列已满（{self.max_queue}）")
+        self._waiting.append(job.job_id)
+        self.jobs[job.job_id] = job
+        self._save(job, urgent=True)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """本进程内的任务"""
+        return self.jobs.get(job_id)
+
+    def snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务状态快照：本进程内的任务直接返回，否则从共享存储查询"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        if self.store is None:
+            return None
+        try:
+            return self.store.load(job_id)
+        except sqlite3.Error as e:
+            logger.warning(f"读取共享任务状态失败: {job_id}, 错误信息: {e}")
+            return None
+
+    def queue_position(self, job: Job) -> Optional[int]:
+        """等待中任务在队列中的位置（从1开始）"""
+        if job.status != JOB_PENDING:
+            return None
+        try:
+            return self._waiting.index(job.job_id) + 1
+        except ValueError:
+            return None
+
+    def update(
+        self,
+        job: Job,
+        progress: Optional[float] = None,
+        message: Optional[str] = None,
+        urgent: bool = False
+    ) -> None:
+        """更新任务进度并通知订阅者"""
+        if progress is not None:
+            job.progress = progress
+        if message is not None:
+            job.message = message
+        job.updated_at = datetime.now().isoformat()
+        self._publish(job, urgent)
+
+    def subscribe(self, job: Job) -> asyncio.Queue:
+        """订阅任务进度事件"""
+        queue: asyncio.Queue = asyncio.Queue()
+        queue.put_nowait(job.snapshot())
+        job.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, job: Job, queue: asyncio.Queue) -> None:
+        if queue in job.subscribers:
+            job.subscribers.remove(queue)
+
+    def _publish(self, job: Job, urgent: bool = False) -> None:
+        snapshot = job.snapshot()
+        for queue in job.subscribers:
+            queue.put_nowait(snapshot)
+        self._save(job, urgent, snapshot)
+
+    def _save(self, job: Job, urgent: bool = False, snapshot: Optional[Dict[str, Any]] = None) -> None:
+        """记录待写入共享存储的最新快照，由后台任务批量写入；urgent 时立即唤醒写入"""
+        if self.store is None:
+            return
+        self._dirty[job.job_id] = snapshot or job.snapshot()
+        if urgent and self._flush_now is not None:
+            self._flush_now.set()
+
+    async def _flush(self) -> None:
+        """在I/O线程池中批量写入共享存储（失败只记录日志并留待下次重试，不影响任务本身）"""
+        if self.store is None or not self._dirty:
+            return
+        pending, self._dirty = self._dirty, {}
+        try:
+            await io_executor.run(self.store.save_many, list(pending.values()))
+        except (ExecutorBusyError, sqlite3.Error) as e:
+            logger.warning(f"写入共享任务状态失败（{len(pending)}个任务）: {e}")
+            # 写入期间又有更新的任务以较新的快照为准
+            for job_id, snapshot in pending.items():
+                self._dirty.setdefault(job_id, snapshot)
+
+    async def _flush_periodically(self) -> None:
+        """按 flush_interval 或被唤醒时批量写入；stop() 清空 _flusher 并唤醒后写入最后一批并退出"""
+        while self._flusher is not None:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self._flush()
+
+    async def _prune_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.prune_interval)
+            await self._prune()
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_monotonic = time.monotonic()
+        job.message = "已完成" if status == JOB_COMPLETED else "失败"
+        if status == JOB_COMPLETED:
+            job.progress = 100.0
+        if job.cleanup is not None:
+            try:
+                job.cleanup()
+            except Exception as e:
+                logger.error(f"任务清理失败: {job.job_id}, 错误信息: {e}")
+        self.update(job, urgent=True)
+
+    async def _prune(self) -> None:
+        """清除超过保留时间的已结束任务"""
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_monotonic is not None and now - job.finished_monotonic > self.result_ttl
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+        if self.store is not None:
+            try:
+                await io_executor.run(self.store.prune, self.result_ttl)
+            except (ExecutorBusyError, sqlite3.Error) as e:
+                logger.warning(f"清理共享任务状态失败: {e}")
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            self._waiting.popleft()
+            try:
+                job.status = JOB_RUNNING
+                self.update(job, message="处理中")
+                try:
+                    result = await job.handler(job)
+                except asyncio.CancelledError:
+                    self._finish(job, JOB_FAILED, error="服务关闭，任务已取消")
+                    raise
+                except Exception as e:
+                    logger.error(f"任务执行失败: {job.job_id}, 错误信息: {e}")
+                    self._finish(job, JOB_FAILED, error=str(e))
+                else:
+                    self._finish(job, JOB_COMPLETED, result=result)
+            finally:
+                self._queue.task_done()
+
+
+job_queue = JobQueue(
+    workers=settings.JOB_WORKERS,
+    max_queue=settings.JOB_QUEUE_SIZE,
+    result_ttl=settings.JOB_RESULT_TTL,
+    flush_interval=settings.JOB_STORE_FLUSH_INTERVAL,
+    prune_interval=settings.JOB_PRUNE_INTERVAL,
+    # 单进程时任务状态只在本进程内，无需共享
+    store=JobStore(settings.JOB_STORE_PATH) if settings.worker_count() > 1 else None
+)
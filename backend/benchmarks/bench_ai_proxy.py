@@ -0,0 +1,154 @@
+"""
+AI服务代理负载基准测试：对比每请求新建客户端（旧实现）与共享连接池客户端的吞吐和p99延迟
+用法: python benchmarks/bench_ai_proxy.py [--requests 2000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_stub(port: int) -> None:
+    """本地模拟AI服务"""
+    import uvicorn
+    from fastapi import FastAPI
+
+    stub = FastAPI()
+
+    @stub.get("/model_info")
+    async def model_info():
+        return {
+            "model_name": "stub",
+            "version": "1.0",
+            "supported_modalities": ["CT", "MRI"],
+            "input_formats": [".dcm", ".nii.gz"],
+            "model_status": "ready",
+            "description": "benchmark stub"
+        }
+
+    uvicorn.run(stub, host="127.0.0.1", port=port, log_level="warning")
+
+
+def run_backend(port: int, stub_port: int, mode: str) -> None:
+    """启动后端；per-request 模式下用依赖覆盖还原旧的每请求建连行为"""
+    import uvicorn
+    from app.config import settings
+
+    settings.AI_SERVICE_URL = f"http://127.0.0.1:{stub_port}"
+    from app.api.v1 import ai
+    from app.main import app
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if mode == "per-request":
+        async def per_request_client():
+            async with httpx.AsyncClient(base_url=settings.AI_SERVICE_URL) as client:
+                yield client
+
+        app.dependency_overrides[ai.get_ai_client] = per_request_client
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"服务未就绪: {url}")
+
+
+async def load(url: str, total: int, concurrency: int):
+    """并发压测，返回 (每秒请求数, p99延迟ms, 失败数)"""
+    latencies = []
+    failures = 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        async def worker():
+            nonlocal failures
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        failures += 1
+                except httpx.HTTPError:
+                    failures += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    return total / elapsed, p99, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--role", choices=["stub", "backend"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--stub-port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="pooled", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == "stub":
+        return run_stub(args.port)
+    if args.role == "backend":
+        os.chdir(BACKEND_DIR)
+        return run_backend(args.port, args.stub_port, args.mode)
+
+    stub_port = free_port()
+    stub = subprocess.Popen([sys.executable, __file__, "--role", "stub", "--port", str(stub_port)])
+    try:
+        asyncio.run(wait_ready(f"http://127.0.0.1:{stub_port}/model_info"))
+        print(f"{'模式':<14}{'req/s':>10}{'p99(ms)':>10}{'失败':>6}")
+        for mode in ("per-request", "pooled"):
+            port = free_port()
+            backend = subprocess.Popen([
+                sys.executable, __file__, "--role", "backend", "--port", str(port),
+                "--stub-port", str(stub_port), "--mode", mode
+            ])
+            try:
+                url = f"http://127.0.0.1:{port}/api/v1/ai/model_info"
+                asyncio.run(wait_ready(url))
+                rps, p99, failures = asyncio.run(load(url, args.requests, args.concurrency))
+                print(f"{mode:<14}{rps:>10.1f}{p99:>10.1f}{failures:>6}")
+            finally:
+                backend.terminate()
+                backend.wait()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+执行器基准测试：在大量列表查询、上传和像素渲染的同时探测 /api/v1/ai/health 的延迟，
+对比在事件循环内直接执行（旧实现）与DICOM执行器（线程池+进程池）
+用法: python benchmarks/bench_executor.py [--duration 10] [--concurrency 8] [--size 2048]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from bench_ai_proxy import free_port, wait_ready  # noqa: E402
+from bench_tiles import make_dicom  # noqa: E402
+
+
+def run_stub(port: int) -> None:
+    """本地模拟AI服务的健康检查接口"""
+    import uvicorn
+    from fastapi import FastAPI
+
+    stub = FastAPI()
+
+    @stub.get("/health")
+    async def health():
+        return {"status": "healthy", "service": "stub", "timestamp": "2024-01-01T00:00:00"}
+
+    uvicorn.run(stub, host="127.0.0.1", port=port, log_level="warning")
+
+
+def run_backend(port: int, stub_port: int, mode: str) -> None:
+    """启动后端；inline 模式下把执行器替换为直接调用，还原阻塞事件循环的旧行为"""
+    import contextlib
+    import logging
+
+    import uvicorn
+    from app.config import settings
+
+    settings.AI_SERVICE_URL = f"http://127.0.0.1:{stub_port}"
+    settings.MAX_FILE_SIZE = 1024 * 1024 * 1024
+    settings.RENDER_ON_UPLOAD = False
+    from app.main import app
+    from app.services import executors
+
+    if mode == "inline":
+        async def run_inline(self, func, *args, timeout=None, **kwargs):
+            return func(*args, **kwargs)
+
+        executors.BoundedExecutor.run = run_inline
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # 后端日志会淹没结果
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def heavy_load(client: httpx.AsyncClient, sample: Path, stop: asyncio.Event, index: int) -> int:
+    """循环执行上传、列表查询和自定义窗渲染，返回完成的请求数"""
+    done = 0
+    content = sample.read_bytes()
+    while not stop.is_set():
+        name = f"load_{index}_{done}.dcm"
+        await client.post("/api/v1/dicom/upload", files={"file": (name, content)})
+        await client.get("/api/v1/dicom/results")
+        await client.get(f"/api/v1/dicom/{name}/preview", params={"kind": "preview", "wc": 40, "ww": 400})
+        done += 3
+    return done
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, interval: float = 0.05):
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/api/v1/ai/health")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    return statistics.median(latencies), p99, latencies[-1]
+
+
+async def measure(base_url: str, sample: Path, duration: float, concurrency: int):
+    """返回 (空闲时health延迟, 负载下health延迟, 负载请求吞吐)"""
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, stop))
+        await asyncio.sleep(min(duration, 2.0))
+        stop.set()
+        idle = await probe_task
+
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, stop))
+        workers = [asyncio.create_task(heavy_load(client, sample, stop, i)) for i in range(concurrency)]
+        await asyncio.sleep(duration)
+        stop.set()
+        loaded = await probe_task
+        completed = sum(await asyncio.gather(*workers))
+    return summarize(idle), summarize(loaded), completed / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=10.0, help="负载持续时间（秒）")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发负载客户端数")
+    parser.add_argument("--size", type=int, default=2048, help="测试影像边长")
+    parser.add_argument("--role", choices=["stub", "backend"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--stub-port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="executor", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == "stub":
+        return run_stub(args.port)
+    if args.role == "backend":
+        return run_backend(args.port, args.stub_port, args.mode)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sample = Path(tmp) / "sample.dcm"
+        make_dicom(sample, "CT", 1, args.size, args.size)
+
+        stub_port = free_port()
+        stub = subprocess.Popen([sys.executable, __file__, "--role", "stub", "--port", str(stub_port)])
+        try:
+            asyncio.run(wait_ready(f"http://127.0.0.1:{stub_port}/health"))
+            print(f"{'模式':<10}{'空闲p50/p99(ms)':>18}{'负载p50/p99/max(ms)':>26}{'负载req/s':>12}")
+            for mode in ("inline", "executor"):
+                workdir = Path(tmp) / mode
+                workdir.mkdir()
+                port = free_port()
+                backend = subprocess.Popen(
+                    [
+                        sys.executable, __file__, "--role", "backend", "--port", str(port),
+                        "--stub-port", str(stub_port), "--mode", mode
+                    ],
+                    cwd=workdir,
+                    env={**os.environ, "PYTHONPATH": str(BACKEND_DIR)}
+                )
+                try:
+                    base_url = f"http://127.0.0.1:{port}"
+                    asyncio.run(wait_ready(f"{base_url}/api/v1/dicom/test"))
+                    idle, loaded, rps = asyncio.run(measure(base_url, sample, args.duration, args.concurrency))
+                    print(
+                        f"{mode:<10}{f'{idle[0]:.1f}/{idle[1]:.1f}':>18}"
+                        f"{f'{loaded[0]:.1f}/{loaded[1]:.1f}/{loaded[2]:.1f}':>26}{rps:>12.1f}"
+                    )
+                finally:
+                    backend.terminate()
+                    backend.wait()
+        finally:
+            stub.terminate()
+            stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+日志开销基准测试：批量导入热路径上每个文件校验的日志耗时（头部解析结果预先缓存，只计日志与校验逻辑）
+对比旧实现（同步 StreamHandler，每个文件逐标签输出 INFO）与结构化异步日志（INFO / DEBUG+限流），
+日志经管道写给另一个进程，与容器/进程管理器收集 stdout 的方式一致
+用法: python benchmarks/bench_logging.py [--files 20000] [--threads 4]
+"""
+import argparse
+import io
+import logging
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.config import settings  # noqa: E402
+from app.services import dicom_service, structured_log  # noqa: E402
+from app.services.dicom_service import logger, required_tags, validate_dicom  # noqa: E402
+from bench_tiles import make_dicom  # noqa: E402
+
+
+class LineCounter(io.TextIOWrapper):
+    """统计写出的日志行数"""
+    lines = 0
+
+    def write(self, text: str) -> int:
+        self.lines += text.count("\n")
+        return super().write(text)
+
+
+def legacy_validate(path: Path) -> bool:
+    """旧版 validate_dicom 的日志模式：每个文件一条读取日志 + 每个可选标签一条 INFO"""
+    header = dicom_service.read_header(path)
+    logger.info(f"成功读取DICOM文件: {path}")
+    for tag, required in required_tags.items():
+        if required:
+            if not header.get(tag):
+                return False
+        elif header.get(tag):
+            logger.info(f"标签 {tag}: {header[tag]}")
+        else:
+            logger.info(f"标签 {tag} 不存在或为空")
+    return True
+
+
+def configure(mode: str, output) -> None:
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    structured_log.shutdown_logging()
+    if mode == "legacy":
+        # 旧实现：logging.basicConfig(level=INFO)，调用线程内同步格式化并写出
+        handler = logging.StreamHandler(output)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        return
+    settings.LOG_LEVEL = "DEBUG" if mode == "debug" else "INFO"
+    stdout, sys.stdout = sys.stdout, output
+    try:
+        structured_log.setup_logging()
+    finally:
+        sys.stdout = stdout
+
+
+def run(mode: str, sample: Path, files: int, threads: int, output) -> list:
+    """返回每个文件的处理耗时（微秒）"""
+    configure(mode, output)
+    validate = legacy_validate if mode == "legacy" else validate_dicom
+
+    def one(_):
+        start = time.perf_counter()
+        validate(sample)
+        return (time.perf_counter() - start) * 1e6
+
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = list(pool.map(one, range(files)))
+    structured_log.shutdown_logging()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=20000, help="模拟导入的文件数")
+    parser.add_argument("--threads", type=int, default=4, help="并发校验线程数（对应I/O执行器）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sample = Path(tmp) / "sample.dcm"
+        make_dicom(sample, "CT", 1, 64, 64)
+        header = dicom_service.read_header(sample)
+        dicom_service.read_header = lambda path: header
+
+        print(f"{'模式':<10}{'总耗时(s)':>12}{'每文件p50(us)':>16}{'每文件p99(us)':>16}{'日志行数':>10}")
+        for mode in ("legacy", "info", "debug"):
+            reader = subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+            output = LineCounter(reader.stdin, encoding="utf-8", line_buffering=True)
+            start = time.perf_counter()
+            latencies = sorted(run(mode, sample, args.files, args.threads, output))
+            elapsed = time.perf_counter() - start
+            output.close()
+            reader.wait()
+            p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+            print(f"{mode:<10}{elapsed:>12.2f}{statistics.median(latencies):>16.1f}{p99:>16.1f}{output.lines:>10}")
+
+
+if __name__ == "__main__":
+    main()
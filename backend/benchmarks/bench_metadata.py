@@ -0,0 +1,125 @@
+"""
+元数据解析基准测试：对比完整读取与仅读取头部的单文件耗时和峰值内存
+用法: python benchmarks/bench_metadata.py [--frames 300] [--size 512]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pydicom
+from pydicom.dataset import FileDataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.dicom_service import read_header  # noqa: E402
+
+
+def make_multiframe_dicom(path: Path, frames: int, rows: int = 512, columns: int = 512) -> None:
+    """生成多帧CT测试文件"""
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2.1"
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset(str(path), {}, file_meta=meta, preamble=b"\0" * 128)
+    ds.PatientID = "BENCH"
+    ds.StudyDate = "20240101"
+    ds.Modality = "CT"
+    ds.Rows = rows
+    ds.Columns = columns
+    ds.NumberOfFrames = frames
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 1
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.PixelData = np.zeros((frames, rows, columns), dtype=np.int16).tobytes()
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.save_as(str(path))
+
+
+def make_nifti(path: Path, size: int) -> None:
+    """生成 size³ 的压缩NIfTI测试文件"""
+    data = np.random.randint(-1024, 2048, size=(size, size, size), dtype=np.int16)
+    nib.save(nib.Nifti1Image(data, np.eye(4)), str(path))
+
+
+def full_read(path: str) -> None:
+    """旧实现：完整读取像素/体数据"""
+    if path.endswith('.dcm'):
+        ds = pydicom.dcmread(path)
+        _ = ds.PatientID, ds.Rows, ds.Columns
+    else:
+        img = nib.load(path)
+        _ = str(img.get_fdata().dtype)
+
+
+def header_read(path: str) -> None:
+    """新实现：仅读取头部"""
+    read_header(Path(path))
+
+
+def peak_rss_kb() -> int:
+    """当前进程的峰值RSS（KB），Linux下读取VmHWM以避免继承父进程的高水位"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(func, path: str, queue) -> None:
+    baseline = peak_rss_kb()
+    start = time.perf_counter()
+    func(path)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, peak_rss_kb() - baseline))
+
+
+def measure(func, path: Path):
+    """在独立进程中运行，返回 (耗时秒, 峰值RSS增量 MB)"""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_measure, args=(func, str(path), queue))
+    process.start()
+    elapsed, maxrss_kb = queue.get()
+    process.join()
+    return elapsed, maxrss_kb / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=300, help="多帧DICOM的帧数（512x512）")
+    parser.add_argument("--size", type=int, default=512, help="NIfTI体数据边长")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dcm_path = Path(tmp) / "multiframe.dcm"
+        nii_path = Path(tmp) / "volume.nii.gz"
+        print("生成测试数据...")
+        make_multiframe_dicom(dcm_path, args.frames)
+        make_nifti(nii_path, args.size)
+
+        print(f"{'文件':<20}{'方式':<10}{'耗时(ms)':>12}{'峰值RSS增量(MB)':>14}")
+        for path in (dcm_path, nii_path):
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            for name, func in (("full", full_read), ("header", header_read)):
+                elapsed, rss = measure(func, path)
+                print(f"{path.name:<20}{name:<10}{elapsed * 1000:>12.1f}{rss:>14.1f}")
+            print(f"  ({size_mb:.1f} MB on disk)")
+
+
+if __name__ == "__main__":
+    main()
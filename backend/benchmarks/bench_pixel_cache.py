@@ -0,0 +1,79 @@
+"""
+解码像素缓存基准测试：RLE 压缩的多帧 DICOM 在进程池（模拟多个 worker）中随机读取单帧
+对比每次完整解码（不缓存）与共享解码像素缓存（首次解码后各进程直接映射）
+用法: python benchmarks/bench_pixel_cache.py [--frames 50] [--size 512] [--workers 4] [--reads 40]
+"""
+import argparse
+import multiprocessing
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pydicom
+from pydicom.uid import RLELossless
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.config import settings  # noqa: E402
+from app.services import blob_store  # noqa: E402
+from app.services.dicom_service import read_frame  # noqa: E402
+from app.services.pixel_cache import pixel_cache  # noqa: E402
+from bench_tiles import make_dicom  # noqa: E402
+
+
+def timed_read(path: Path, index: int) -> float:
+    start = time.perf_counter()
+    read_frame(path, index)
+    return (time.perf_counter() - start) * 1000
+
+
+def run(path: Path, workers: int, reads: int, max_bytes: int) -> list:
+    """进程池以 fork 启动，继承这里设置的缓存预算与目录"""
+    pixel_cache.max_bytes = max_bytes
+    indexes = np.random.default_rng(0).integers(0, pixel_count(path), reads).tolist()
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+        return list(pool.map(timed_read, [path] * reads, indexes))
+
+
+def pixel_count(path: Path) -> int:
+    return int(pydicom.dcmread(path, stop_before_pixels=True).NumberOfFrames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--reads", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.BLOB_DIR = Path(tmp) / "blobs"
+        pixel_cache.directory = Path(tmp) / "pixel_cache"
+        source = Path(tmp) / "source.dcm"
+        make_dicom(source, "CT", args.frames, args.size, args.size)
+        ds = pydicom.dcmread(source)
+        ds.compress(RLELossless)
+        ds.save_as(source)
+        path = blob_store.blob_path(blob_store.blob_key(blob_store.hash_file(source), ".dcm"))
+        path.parent.mkdir(parents=True)
+        source.rename(path)
+        print(f"RLE 多帧 DICOM: {args.frames} 帧 {args.size}x{args.size}，{args.workers} 个进程随机读取 {args.reads} 次")
+
+        print(f"{'模式':<12}{'总耗时(s)':>12}{'p50(ms)':>12}{'p95(ms)':>12}")
+        for name, max_bytes in (("不缓存", 0), ("共享缓存", 1024 ** 3)):
+            start = time.perf_counter()
+            latencies = sorted(run(path, args.workers, args.reads, max_bytes))
+            elapsed = time.perf_counter() - start
+            p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+            print(f"{name:<12}{elapsed:>12.2f}{statistics.median(latencies):>12.2f}{p95:>12.2f}")
+        print("缓存统计:", pixel_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
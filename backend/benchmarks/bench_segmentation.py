@@ -0,0 +1,109 @@
+"""
+分割后处理基准测试：512x512x600 掩码上的连通域标记与病灶测量
+合成若干椭球病灶 + 随机散点噪声；对比内存数组与 NIfTI(.nii.gz) 按层块流式读取 / 整卷读取的耗时与峰值内存（各自在子进程中运行）
+用法: python benchmarks/bench_segmentation.py [--shape 512 512 600] [--lesions 40] [--slab 32]
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.services.ai_service import measure_nifti, measure_volume  # noqa: E402
+
+
+def make_mask(shape, lesions: int, specks: float, seed: int = 0) -> np.ndarray:
+    """椭球病灶（标签 1/2 交替）+ 比例为 specks 的孤立散点（模拟模型输出的假阳性碎片）"""
+    rng = np.random.default_rng(seed)
+    mask = np.zeros(shape, dtype=np.uint8)
+    for n in range(lesions):
+        radius = rng.uniform(4, 40, 3)
+        center = rng.uniform(radius, np.array(shape) - radius)
+        low = np.maximum(np.floor(center - radius).astype(int), 0)
+        high = np.minimum(np.ceil(center + radius).astype(int) + 1, shape)
+        grid = np.ogrid[tuple(slice(a, b) for a, b in zip(low, high))]
+        inside = sum(((axis - c) / r) ** 2 for axis, c, r in zip(grid, center, radius)) <= 1
+        mask[tuple(slice(a, b) for a, b in zip(low, high))][inside] = 1 + n % 2
+    speck_count = int(mask.size * specks)
+    mask[np.unravel_index(rng.integers(0, mask.size, speck_count), shape)] = 1
+    return mask
+
+
+def peak_rss_mb() -> float:
+    """本进程峰值常驻内存；Linux 上 ru_maxrss 会跨 exec 继承父进程的峰值，优先读取 VmHWM"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode: str, path: str, slab: int) -> None:
+    """子进程：执行一次测量并输出耗时与峰值内存"""
+    start = time.perf_counter()
+    if mode == "memory":
+        img = nib.load(path)
+        volume = np.asarray(img.dataobj)
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        lesions = measure_volume(volume, img.affine, slab_slices=slab)
+        result = {"count": len(lesions), "load": load}
+    else:
+        depth = nib.load(path).shape[2]
+        result = {"count": measure_nifti(Path(path), slab_slices=depth if mode == "whole" else slab).lesion_count}
+    result["elapsed"] = time.perf_counter() - start
+    result["rss_mb"] = peak_rss_mb()
+    print(json.dumps(result))
+
+
+def run_child(mode: str, path: Path, slab: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", mode, "--path", str(path), "--slab", str(slab)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shape", type=int, nargs=3, default=[512, 512, 600])
+    parser.add_argument("--lesions", type=int, default=40, help="椭球病灶数")
+    parser.add_argument("--specks", type=float, default=1e-4, help="散点占体素的比例")
+    parser.add_argument("--slab", type=int, default=32, help="每个层块的层数")
+    parser.add_argument("--child", choices=["memory", "stream", "whole"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child, args.path, args.slab)
+
+    shape = tuple(args.shape)
+    mask = make_mask(shape, args.lesions, args.specks)
+    voxels = mask.size
+    print(f"掩码 {shape}，前景体素 {np.count_nonzero(mask)} ({np.count_nonzero(mask) / voxels:.2%})")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "mask.nii.gz"
+        nib.save(nib.Nifti1Image(mask, np.diag([0.7, 0.7, 1.25, 1.0])), path)
+        del mask
+        print(f"{'模式':<14}{'耗时(s)':>10}{'体素/秒':>14}{'病灶数':>10}{'峰值RSS(MB)':>14}")
+        for mode, name in (("memory", "内存数组"), ("stream", f"流式 {args.slab} 层"), ("whole", "整卷读取")):
+            result = run_child(mode, path, args.slab)
+            print(
+                f"{name:<14}{result['elapsed']:>10.2f}{voxels / result['elapsed'] / 1e6:>12.0f}M"
+                f"{result['count']:>10}{result['rss_mb']:>14.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
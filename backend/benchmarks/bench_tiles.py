@@ -0,0 +1,156 @@
+"""
+瓦片金字塔基准测试：对比下载完整文件后解码首帧与按瓦片获取首屏的首像素时间(time-to-first-pixel)
+用法: python benchmarks/bench_tiles.py [--frames 300] [--dx-size 2048] [--mbps 100]
+"""
+import argparse
+import io
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+import pydicom
+from pydicom.dataset import FileDataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_dicom(path: Path, modality: str, frames: int, rows: int, columns: int) -> None:
+    """生成带噪声的测试文件（噪声使PNG瓦片接近最坏压缩率）"""
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2.1"
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset(str(path), {}, file_meta=meta, preamble=b"\0" * 128)
+    ds.PatientID = "BENCH"
+    ds.StudyDate = "20240101"
+    ds.Modality = modality
+    ds.Rows = rows
+    ds.Columns = columns
+    ds.NumberOfFrames = frames
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 1
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    rng = np.random.default_rng(0)
+    ds.PixelData = rng.integers(-1024, 2048, size=(frames, rows, columns), dtype=np.int16).tobytes()
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.save_as(str(path))
+
+
+def run_backend(port: int) -> None:
+    """在临时工作目录中启动后端（上传目录、索引均为相对路径）"""
+    import logging
+
+    import uvicorn
+    from app.config import settings
+
+    settings.MAX_FILE_SIZE = 4 * 1024 * 1024 * 1024
+    settings.RENDER_ON_UPLOAD = False
+    from app.main import app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"服务未就绪: {url}")
+
+
+def full_download(client: httpx.Client, filename: str, frame: int):
+    """旧方式：下载完整文件并在客户端解码出目标帧"""
+    start = time.perf_counter()
+    response = client.get(f"/api/v1/dicom/{filename}")
+    pixels = pydicom.dcmread(io.BytesIO(response.content)).pixel_array
+    _ = pixels[frame] if pixels.ndim == 3 else pixels
+    return time.perf_counter() - start, len(response.content)
+
+
+def first_tile(client: httpx.Client, filename: str, frame: int):
+    """新方式：获取金字塔描述后取最低分辨率层（单瓦片即为整帧概览）"""
+    start = time.perf_counter()
+    pyramid = client.get(f"/api/v1/dicom/{filename}/tiles", params={"frame": frame})
+    top = len(pyramid.json()["levels"]) - 1
+    tile = client.get(f"/api/v1/dicom/{filename}/tiles/{top}/0/0", params={"frame": frame, "format": "png"})
+    tile.raise_for_status()
+    return time.perf_counter() - start, len(pyramid.content) + len(tile.content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=300, help="多帧CT的帧数（512x512）")
+    parser.add_argument("--dx-size", type=int, default=2048, help="DX单帧边长")
+    parser.add_argument("--mbps", type=float, default=100.0, help="估算传输时间所用带宽(Mbit/s)")
+    parser.add_argument("--role", choices=["backend"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == "backend":
+        return run_backend(args.port)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cases = [
+            ("dx.dcm", "DX", 1, args.dx_size, args.dx_size),
+            ("ct.dcm", "CT", args.frames, 512, 512),
+        ]
+        print("生成测试数据...")
+        for name, modality, frames, rows, columns in cases:
+            make_dicom(tmp / name, modality, frames, rows, columns)
+
+        port = free_port()
+        backend = subprocess.Popen(
+            [sys.executable, __file__, "--role", "backend", "--port", str(port)],
+            cwd=tmp,
+            env={**os.environ, "PYTHONPATH": str(BACKEND_DIR)}
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(f"{base_url}/health")
+            with httpx.Client(base_url=base_url, timeout=600.0) as client:
+                for name, *_ in cases:
+                    with open(tmp / name, "rb") as f:
+                        client.post("/api/v1/dicom/upload", files={"file": (name, f)}).raise_for_status()
+
+                bytes_per_second = args.mbps * 1e6 / 8
+                print(f"{'文件':<10}{'方式':<14}{'本地(ms)':>10}{'传输(KB)':>12}{f'@{args.mbps:g}Mbps(ms)':>16}")
+                for name, modality, frames, rows, columns in cases:
+                    frame = frames // 2
+                    for label, func in (
+                        ("full", full_download),
+                        ("tiles(cold)", first_tile),
+                        ("tiles(warm)", first_tile),
+                    ):
+                        elapsed, size = func(client, name, frame)
+                        projected = elapsed + size / bytes_per_second
+                        print(f"{name:<10}{label:<14}{elapsed * 1000:>10.1f}{size / 1024:>12.1f}{projected * 1000:>16.1f}")
+        finally:
+            backend.terminate()
+            backend.wait()
+
+
+if __name__ == "__main__":
+    main()
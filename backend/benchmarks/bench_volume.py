@@ -0,0 +1,86 @@
+"""
+体积存储基准测试：.nii.gz 随机读取单层 / 层块 / ROI
+对比每次 nib.load + 代理切片（需从头解压到目标层）与内存映射体积存储（一次性转换后按页读取）
+用法: python benchmarks/bench_volume.py [--shape 512 512 300] [--reads 20]
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.config import settings  # noqa: E402
+from app.services import volume_store  # noqa: E402
+
+
+def timed(func, reads):
+    """返回每次调用的耗时（毫秒）"""
+    latencies = []
+    for args in reads:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{name:<28}{statistics.median(latencies):>12.2f}{p95:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shape", type=int, nargs=3, default=[512, 512, 300])
+    parser.add_argument("--reads", type=int, default=20, help="每种访问方式的随机读取次数")
+    args = parser.parse_args()
+
+    shape = tuple(args.shape)
+    rng = np.random.default_rng(0)
+    # 平滑的体模 + 噪声，压缩率接近真实CT
+    grid = np.indices(shape, sparse=True)
+    volume = (1000 * np.cos(grid[0] / 40) * np.sin(grid[1] / 30) + grid[2]).astype(np.int16)
+    volume += rng.integers(-20, 20, shape, dtype=np.int16)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.RENDER_DIR = Path(tmp) / "renders"
+        path = Path(tmp) / "volume.nii.gz"
+        nib.save(nib.Nifti1Image(volume, np.diag([0.7, 0.7, 1.25, 1.0])), path)
+        print(f"体积 {shape} int16，.nii.gz {path.stat().st_size / 2 ** 20:.1f}MB")
+
+        start = time.perf_counter()
+        volume_store.convert_volume(path, "0" * 64)
+        print(f"一次性转换: {time.perf_counter() - start:.2f}s\n")
+        store = volume_store.open_volume(path, "0" * 64)
+
+        def nib_slice(k):
+            return np.asarray(nib.load(str(path)).dataobj[:, :, k])
+
+        def nib_slab(k):
+            return np.asarray(nib.load(str(path)).dataobj[:, :, k:k + 16])
+
+        def nib_roi(i, j, k):
+            return np.asarray(nib.load(str(path)).dataobj[i:i + 64, j:j + 64, k:k + 64])
+
+        slices = [(int(k),) for k in rng.integers(0, shape[2], args.reads)]
+        slabs = [(int(k),) for k in rng.integers(0, shape[2] - 16, args.reads)]
+        rois = [tuple(int(rng.integers(0, n - 64)) for n in shape) for _ in range(args.reads)]
+
+        print(f"{'访问方式':<24}{'p50(ms)':>12}{'p95(ms)':>12}")
+        report("单层 nibabel", timed(nib_slice, slices))
+        report("单层 体积存储", timed(store.read_slice, slices))
+        report("16层层块 nibabel", timed(nib_slab, slabs))
+        report("16层层块 体积存储", timed(lambda k: store.read_slab(k, k + 16), slabs))
+        report("64^3 ROI nibabel", timed(nib_roi, rois))
+        report("64^3 ROI 体积存储", timed(lambda i, j, k: store.read_roi((i, j, k), (i + 64, j + 64, k + 64)), rois))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import pytest
+
+from app.config import settings
+from app.models import database
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """每个测试使用独立的上传目录与元数据库（配置中的存储路径是相对工作目录的）"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "_initialized", False)
+    settings.setup()
+    database.init_db()
+    return tmp_path
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import time
+
+from app.config import settings
+from app.models import database
+from app.services import blob_store
+from app.services.upload_service import StoredUpload
+
+
+def make_upload(content: bytes, name: str = "upload.part") -> StoredUpload:
+    path = settings.TEMP_DIR / name
+    path.write_bytes(content)
+    return StoredUpload(path=path, size=len(content), sha256=hashlib.sha256(content).hexdigest())
+
+
+def store(content: bytes, filename: str):
+    """移入blob存储并登记文件名，返回 (最终文件名, blob键)"""
+    stored = make_upload(content)
+    return blob_store.store_upload(
+        stored, ".dcm",
+        lambda path, blob: (database.register_upload(filename, stored.sha256, blob, mtime=0.0, size=stored.size), blob)
+    )
+
+
+def delete(filename: str) -> None:
+    blob = database.get_record(filename)["blob"]
+    database.delete_records([filename])
+    blob_store.release_blob(blob)
+
+
+def test_store_upload_deduplicates_content(storage):
+    first, blob = store(b"same", "a.dcm")
+    second, same_blob = store(b"same", "b.dcm")
+    assert (first, second) == ("a.dcm", "b.dcm")
+    assert same_blob == blob
+    assert database.blob_ref_count(blob) == 2
+    assert len(list(settings.BLOB_DIR.glob("*/*/*"))) == 1
+    assert not any(settings.TEMP_DIR.iterdir())
+
+
+def test_blob_removed_with_last_reference(storage):
+    _, blob = store(b"same", "a.dcm")
+    store(b"same", "b.dcm")
+    delete("a.dcm")
+    assert blob_store.blob_path(blob).exists()
+    delete("b.dcm")
+    assert not blob_store.blob_path(blob).exists()
+
+
+def test_unregistered_upload_is_released(storage):
+    stored = make_upload(b"invalid")
+    assert blob_store.store_upload(stored, ".dcm", lambda path, blob: None) is None
+    assert not list(settings.BLOB_DIR.glob("*/*/*"))
+
+
+def test_pending_blob_survives_release_and_gc(storage):
+    stored = make_upload(b"pending")
+    key = blob_store.blob_key(stored.sha256, ".dcm")
+    token = database.add_pending_blob(key)
+    blob_store.store_blob(stored, ".dcm")
+    # 登记引用之前的窗口内，释放与回收都不会删除预留中的blob
+    assert blob_store.release_blob(key) is False
+    blob_store.collect_garbage()
+    assert blob_store.blob_path(key).exists()
+    database.remove_pending_blob(token)
+    assert blob_store.release_blob(key) is True
+    assert not blob_store.blob_path(key).exists()
+
+
+def test_collect_garbage(storage):
+    _, kept = store(b"kept", "kept.dcm")
+    orphan = make_upload(b"orphan")
+    orphan_key = blob_store.store_blob(orphan, ".dcm")
+    orphan_renders = blob_store.render_dir(blob_store.blob_sha256(orphan_key))
+    orphan_renders.mkdir(parents=True)
+    (orphan_renders / "preview.png").write_bytes(b"png")
+    stale = settings.TEMP_DIR / "stale.part"
+    stale.write_bytes(b"stale")
+    old = time.time() - 7200
+    os.utime(stale, (old, old))
+    fresh = settings.TEMP_DIR / "fresh.part"
+    fresh.write_bytes(b"fresh")
+
+    blob_store.collect_garbage(temp_max_age=3600)
+
+    assert blob_store.blob_path(kept).exists()
+    assert not blob_store.blob_path(orphan_key).exists()
+    assert not orphan_renders.exists()
+    assert not stale.exists()
+    assert fresh.exists()
+    # 空的分片目录一并删除
+    assert sorted(path.relative_to(settings.BLOB_DIR).as_posix() for path in settings.BLOB_DIR.rglob("*")) == [
+        kept[:2], kept[:5], kept
+    ]
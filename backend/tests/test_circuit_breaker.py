@@ -0,0 +1,198 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    AdaptiveTimeouts,
+    CircuitBreaker,
+    CircuitOpenError,
+    GuardedTransport,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(circuit_breaker, "time", fake)
+    return fake
+
+
+def make_breaker(max_in_flight=10):
+    return CircuitBreaker(failure_threshold=2, reset_timeout=10, max_reset_timeout=25, max_in_flight=max_in_flight)
+
+
+def fail(breaker):
+    probe = breaker.acquire()
+    breaker.release(False, probe)
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = make_breaker()
+    fail(breaker)
+    assert breaker.state == CIRCUIT_CLOSED
+    fail(breaker)
+    assert breaker.state == CIRCUIT_OPEN
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.acquire()
+    assert exc_info.value.retry_after == 10
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_success_resets_failure_count(clock):
+    breaker = make_breaker()
+    fail(breaker)
+    breaker.release(True, breaker.acquire())
+    fail(breaker)
+    assert breaker.state == CIRCUIT_CLOSED
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = make_breaker()
+    fail(breaker)
+    fail(breaker)
+    clock.now += 10
+    assert breaker.acquire() is True
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    # 探测期间只放行一个请求
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.release(True, True)
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.stats()["in_flight"] == 0
+
+
+def test_half_open_probe_failure_reopens_with_doubled_timeout(clock):
+    breaker = make_breaker()
+    fail(breaker)
+    fail(breaker)
+    clock.now += 10
+    fail(breaker)
+    assert breaker.state == CIRCUIT_OPEN
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.acquire()
+    assert exc_info.value.retry_after == 10
+    clock.now += 10
+    fail(breaker)
+    # 等待时间加倍但不超过 max_reset_timeout
+    clock.now += 24
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    clock.now += 1
+    assert breaker.acquire() is True
+    assert breaker.stats()["trips"] == 3
+
+
+def test_cancelled_probe_releases_without_verdict(clock):
+    breaker = make_breaker()
+    fail(breaker)
+    fail(breaker)
+    clock.now += 10
+    breaker.release(None, breaker.acquire())
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert breaker.acquire() is True
+
+
+def test_in_flight_limit_sheds_load(clock):
+    breaker = make_breaker(max_in_flight=2)
+    breaker.acquire()
+    breaker.acquire()
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.release(True, False)
+    breaker.acquire()
+    # check() 只做快速判断，不计入拒绝次数
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_adaptive_timeout_needs_min_samples():
+    timeouts = AdaptiveTimeouts(factor=3, minimum=1, min_samples=5)
+    for _ in range(4):
+        timeouts.record("/sessions", 2.0)
+    assert timeouts.read_timeout("/sessions", 60) == 60
+    timeouts.record("/sessions", 2.0)
+    assert timeouts.read_timeout("/sessions", 60) == 6.0
+    # 不超过路由配置的超时，不低于 minimum
+    assert timeouts.read_timeout("/sessions", 4) == 4
+    fast = AdaptiveTimeouts(factor=3, minimum=1, min_samples=1)
+    fast.record("/health", 0.01)
+    assert fast.read_timeout("/health", 60) == 1
+
+
+def test_adaptive_timeout_skips_excluded_routes():
+    timeouts = AdaptiveTimeouts(factor=3, minimum=1, min_samples=1, exclude=["/predict"])
+    timeouts.record("/predict", 2.0)
+    assert timeouts.read_timeout("/predict", 300) == 300
+    assert timeouts.stats() == {}
+
+
+class BrokenStream(httpx.AsyncByteStream):
+    """先返回一块数据，随后连接中断"""
+
+    async def __aiter__(self):
+        yield b"partial"
+        raise httpx.ReadError("connection reset")
+
+
+def guarded_client(breaker, stream_factory, status_code=200):
+    def handler(request):
+        return httpx.Response(status_code, stream=stream_factory())
+
+    transport = GuardedTransport(httpx.MockTransport(handler), breaker, AdaptiveTimeouts(factor=0, minimum=1, min_samples=1))
+    return httpx.AsyncClient(transport=transport, base_url="http://ai")
+
+
+def test_guarded_stream_holds_slot_until_body_closed(clock):
+    breaker = make_breaker()
+
+    async def run():
+        async with guarded_client(breaker, lambda: httpx.ByteStream(b"body")) as client:
+            async with client.stream("GET", "/download/1/segmentation") as response:
+                assert breaker.stats()["in_flight"] == 1
+                assert await response.aread() == b"body"
+            assert breaker.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_guarded_stream_counts_mid_body_failures(clock):
+    breaker = make_breaker()
+
+    async def run():
+        async with guarded_client(breaker, BrokenStream) as client:
+            for _ in range(2):
+                with pytest.raises(httpx.ReadError):
+                    await client.get("/download/1/segmentation")
+
+    asyncio.run(run())
+    assert breaker.stats()["in_flight"] == 0
+    assert breaker.state == CIRCUIT_OPEN
+
+
+def test_guarded_transport_counts_gateway_errors(clock):
+    breaker = make_breaker()
+
+    async def run():
+        async with guarded_client(breaker, lambda: httpx.ByteStream(b""), status_code=503) as client:
+            for _ in range(2):
+                assert (await client.get("/sessions")).status_code == 503
+
+    asyncio.run(run())
+    assert breaker.state == CIRCUIT_OPEN
@@ -0,0 +1,39 @@
+from app.models import database
+
+
+def register(filename, sha256, blob=None):
+    return database.register_upload(filename, sha256, blob or f"{sha256}.dcm", mtime=0.0, size=1)
+
+
+def test_register_upload_keeps_name_for_new_file(storage):
+    assert register("ct.dcm", "a" * 64) == "ct.dcm"
+
+
+def test_register_upload_same_content_reuses_name(storage):
+    assert register("ct.dcm", "a" * 64) == "ct.dcm"
+    assert register("ct.dcm", "a" * 64) == "ct.dcm"
+    assert database.blob_ref_count("a" * 64 + ".dcm") == 1
+
+
+def test_register_upload_renames_on_conflict(storage):
+    assert register("ct.dcm", "a" * 64) == "ct.dcm"
+    assert register("ct.dcm", "b" * 64) == "ct_1.dcm"
+    assert register("ct.dcm", "c" * 64) == "ct_2.dcm"
+    # 已登记的内容再次上传时找回原来的名字
+    assert register("ct.dcm", "b" * 64) == "ct_1.dcm"
+    assert database.get_record("ct_2.dcm")["sha256"] == "c" * 64
+
+
+def test_register_upload_renames_compound_extension(storage):
+    assert register("mask.nii.gz", "a" * 64) == "mask.nii.gz"
+    assert register("mask.nii.gz", "b" * 64) == "mask_1.nii.gz"
+    assert register("README", "a" * 64) == "README"
+    assert register("README", "b" * 64) == "README_1"
+
+
+def test_register_upload_claims_legacy_record(storage):
+    # 尚未迁移到blob存储的旧记录没有sha256，可直接认领
+    with database.get_connection() as conn:
+        database._upsert(conn, "ct.dcm", {"mtime": 0.0, "size": 1})
+    assert register("ct.dcm", "a" * 64) == "ct.dcm"
+    assert database.get_record("ct.dcm")["blob"] == "a" * 64 + ".dcm"
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.services.http_range import RangeNotSatisfiable, parse_range_header, slice_stream
+
+
+def test_parse_range_header_single_range():
+    assert parse_range_header("bytes=10-19", 100) == (10, 19)
+    # 结束位置超出资源大小时截断
+    assert parse_range_header("bytes=90-200", 100) == (90, 99)
+
+
+def test_parse_range_header_open_ended():
+    assert parse_range_header("bytes=40-", 100) == (40, 99)
+
+
+def test_parse_range_header_suffix():
+    assert parse_range_header("bytes=-10", 100) == (90, 99)
+    assert parse_range_header("bytes=-500", 100) == (0, 99)
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-200", "bytes=20-10", "bytes=-0"])
+def test_parse_range_header_unsatisfiable(header):
+    with pytest.raises(RangeNotSatisfiable) as exc_info:
+        parse_range_header(header, 100)
+    assert exc_info.value.size == 100
+
+
+@pytest.mark.parametrize("header", [None, "", "items=0-10", "bytes=0-10,20-30", "bytes=abc-", "bytes=10"])
+def test_parse_range_header_falls_back_to_full_content(header):
+    assert parse_range_header(header, 100) is None
+
+
+def collect(chunks, start, end):
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def run():
+        return b"".join([part async for part in slice_stream(source(), start, end)])
+
+    return asyncio.run(run())
+
+
+def test_slice_stream_across_chunk_boundaries():
+    chunks = [b"abcd", b"efgh", b"ijkl"]
+    assert collect(chunks, 2, 9) == b"cdefghij"
+    assert collect(chunks, 4, 7) == b"efgh"
+    assert collect(chunks, 0, 0) == b"a"
+
+
+def test_slice_stream_stops_after_end():
+    consumed = []
+
+    async def source():
+        for chunk in [b"abcd", b"efgh", b"ijkl"]:
+            consumed.append(chunk)
+            yield chunk
+
+    async def run():
+        return b"".join([part async for part in slice_stream(source(), 1, 5)])
+
+    assert asyncio.run(run()) == b"bcdef"
+    assert consumed == [b"abcd", b"efgh"]
@@ -0,0 +1,70 @@
+import asyncio
+import sqlite3
+
+from app.tasks.process_tasks import JOB_COMPLETED, JOB_RUNNING, JobQueue, JobStore
+
+
+def test_snapshot_visible_to_other_worker(tmp_path):
+    path = tmp_path / "jobs.db"
+
+    async def run():
+        # 两个队列模拟两个 worker 进程：各自的 JobStore 连接同一个数据库文件
+        owner = JobQueue(workers=1, max_queue=4, result_ttl=60, store=JobStore(path), flush_interval=0.01)
+        other = JobQueue(workers=1, max_queue=4, result_ttl=60, store=JobStore(path))
+        await owner.start()
+        release = asyncio.Event()
+
+        async def handler(job):
+            owner.update(job, progress=50.0, message="处理中", urgent=True)
+            await release.wait()
+            return {"ok": True}
+
+        job = owner.submit("test", handler)
+        assert other.get(job.job_id) is None
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            snapshot = other.snapshot(job.job_id)
+            if snapshot and snapshot["progress"] == 50.0:
+                break
+        assert snapshot["status"] == JOB_RUNNING
+
+        release.set()
+        await owner.stop(timeout=1)
+        snapshot = other.snapshot(job.job_id)
+        assert snapshot["status"] == JOB_COMPLETED
+        assert snapshot["result"] == {"ok": True}
+        assert other.snapshot("missing") is None
+
+    asyncio.run(run())
+
+
+def test_store_prune_removes_expired_rows(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    store.save_many([{"job_id": "old"}, {"job_id": "new"}])
+    with sqlite3.connect(str(store.path)) as conn:
+        conn.execute("UPDATE jobs SET updated = updated - 120 WHERE job_id = 'old'")
+    store.prune(60)
+    assert store.load("old") is None
+    assert store.load("new") == {"job_id": "new"}
+
+
+def test_queue_prune_drops_finished_jobs(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+
+    async def run():
+        queue = JobQueue(workers=1, max_queue=4, result_ttl=0, store=store, flush_interval=0.01)
+        await queue.start()
+
+        async def handler(job):
+            return None
+
+        job = queue.submit("test", handler)
+        await queue._queue.join()
+        await queue._flush()
+        assert store.load(job.job_id)["status"] == JOB_COMPLETED
+        await queue._prune()
+        assert queue.get(job.job_id) is None
+        assert store.load(job.job_id) is None
+        await queue.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,81 @@
+import nibabel as nib
+import numpy as np
+import pytest
+
+from app.services import mask_codec
+
+
+def random_mask(shape, labels, density, seed):
+    """随机掩码：部分层全零，其余层按 density 随机填充标签 1..labels"""
+    rng = np.random.default_rng(seed)
+    mask = (rng.random(shape) < density) * rng.integers(1, labels + 1, shape)
+    mask[:, :, rng.random(shape[2]) < 0.3] = 0
+    return mask
+
+
+@pytest.mark.parametrize("encoding", ["auto", "rle"])
+@pytest.mark.parametrize("dtype", [np.uint8, np.int16, np.uint16, np.int32])
+@pytest.mark.parametrize("density", [0.02, 0.5, 0.98])
+def test_label_mask_roundtrip(encoding, dtype, density):
+    mask = random_mask((37, 29, 11), 4, density, seed=int(density * 100)).astype(dtype)
+    affine = np.diag([0.7, 0.8, 2.5, 1.0])
+    volume, decoded_affine = mask_codec.decode_mask(mask_codec.encode_mask(mask, affine, encoding, slab_slices=4))
+    assert volume.dtype == mask.dtype
+    np.testing.assert_array_equal(volume, mask)
+    np.testing.assert_array_equal(decoded_affine, affine)
+
+
+@pytest.mark.parametrize("encoding", ["auto", "bitpack", "rle"])
+@pytest.mark.parametrize("density", [0.0, 0.01, 0.5, 1.0])
+def test_binary_mask_roundtrip(encoding, density):
+    # 奇数尺寸：按位打包的最后一个字节不满
+    mask = random_mask((33, 17, 9), 1, density, seed=7).astype(np.uint8)
+    if density == 1.0:
+        mask[:] = 1
+    data = mask_codec.encode_mask(mask, encoding=encoding)
+    np.testing.assert_array_equal(mask_codec.decode_mask(data)[0], mask)
+    with mask_codec.MaskReader(data) as reader:
+        for k in range(mask.shape[2]):
+            np.testing.assert_array_equal(reader.read_slice(k), mask[:, :, k])
+
+
+def test_slice_encodings_and_size():
+    mask = np.zeros((64, 64, 3), dtype=np.uint8)
+    mask[10:50, 10:50, 1] = 1  # 大块实心区域：行程编码更小
+    mask[::2, :, 2] = 1  # 隔行条纹：按位打包更小
+    data = mask_codec.encode_mask(mask)
+    with mask_codec.MaskReader(data) as reader:
+        assert list(reader.index["encoding"]) == [
+            mask_codec.SLICE_EMPTY, mask_codec.SLICE_RLE, mask_codec.SLICE_BITPACK
+        ]
+    assert len(data) < mask.nbytes
+
+
+def test_bitpack_rejects_labels():
+    mask = np.zeros((4, 4, 1), dtype=np.uint8)
+    mask[0, 0, 0] = 2
+    with pytest.raises(ValueError):
+        mask_codec.encode_mask(mask, encoding="bitpack")
+
+
+def test_nifti_roundtrip_and_slice_records(tmp_path):
+    mask = random_mask((40, 30, 13), 3, 0.1, seed=3).astype(np.int16)
+    affine = np.array([[-0.9, 0, 0, 10], [0, 0.9, 0, -5], [0, 0, 3.0, 2], [0, 0, 0, 1]])
+    source = tmp_path / "mask.nii.gz"
+    nib.save(nib.Nifti1Image(mask, affine), str(source))
+    dest = tmp_path / "mask.bcmask"
+
+    size = mask_codec.build_mask_file(source, dest)
+
+    assert dest.stat().st_size == size
+    volume, decoded_affine = mask_codec.decode_mask(dest)
+    np.testing.assert_array_equal(volume, mask)
+    np.testing.assert_allclose(decoded_affine, affine)
+    record = mask_codec.read_slice_record(dest, 5)
+    decoded = mask_codec.decode_slice(
+        {name: code for code, name in mask_codec.SLICE_ENCODINGS.items()}[record["encoding"]],
+        record["data"], tuple(record["shape"]), np.dtype(record["dtype"])
+    )
+    np.testing.assert_array_equal(decoded, mask[:, :, 5])
+    with pytest.raises(IndexError):
+        mask_codec.read_slice_record(dest, 13)
@@ -0,0 +1,110 @@
+import itertools
+from collections import deque
+
+import numpy as np
+import pytest
+
+from app.services.ai_service import measure_volume
+
+
+def neighbor_offsets(connectivity):
+    offsets = [offset for offset in itertools.product((-1, 0, 1), repeat=3) if any(offset)]
+    if connectivity == 6:
+        offsets = [offset for offset in offsets if sum(map(abs, offset)) == 1]
+    return offsets
+
+
+def bfs_components(volume, connectivity):
+    """参考实现：逐体素广度优先搜索，同一标签且相邻的体素属于同一病灶"""
+    offsets = neighbor_offsets(connectivity)
+    visited = np.zeros(volume.shape, dtype=bool)
+    components = []
+    for seed in zip(*np.nonzero(volume)):
+        if visited[seed]:
+            continue
+        label = volume[seed]
+        visited[seed] = True
+        queue = deque([seed])
+        voxels = []
+        while queue:
+            voxel = queue.popleft()
+            voxels.append(voxel)
+            for offset in offsets:
+                neighbor = tuple(a + b for a, b in zip(voxel, offset))
+                if all(0 <= n < s for n, s in zip(neighbor, volume.shape)) and not visited[neighbor] \
+                        and volume[neighbor] == label:
+                    visited[neighbor] = True
+                    queue.append(neighbor)
+        components.append((int(label), np.array(voxels)))
+    return components
+
+
+def max_distance(points):
+    if len(points) < 2:
+        return 0.0
+    return float(np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)).max())
+
+
+def reference(volume, affine, connectivity):
+    lesions = []
+    for label, voxels in bfs_components(volume, connectivity):
+        mm = voxels @ affine[:3, :3].T + affine[:3, 3]
+        axial = max(max_distance(mm[voxels[:, 2] == k]) for k in np.unique(voxels[:, 2]))
+        lesions.append({
+            "label": label,
+            "voxel_count": len(voxels),
+            "bbox_min": voxels.min(axis=0).tolist(),
+            "bbox_max": voxels.max(axis=0).tolist(),
+            "centroid_voxel": voxels.mean(axis=0),
+            "max_diameter_mm": max_distance(mm),
+            "axial_diameter_mm": axial,
+        })
+    return lesions
+
+
+def sort_key(lesion):
+    return lesion["label"], lesion["bbox_min"], lesion["bbox_max"], lesion["voxel_count"]
+
+
+@pytest.mark.parametrize("connectivity", [6, 26])
+@pytest.mark.parametrize("slab_slices", [1, 3, 64])
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_bfs_reference(connectivity, slab_slices, seed):
+    rng = np.random.default_rng(seed)
+    shape = tuple(rng.integers(6, 14, 3))
+    volume = ((rng.random(shape) < rng.uniform(0.1, 0.45)) * rng.integers(1, 3, shape)).astype(np.uint8)
+    affine = np.diag([*rng.uniform(0.5, 2.5, 3), 1.0])
+    affine[:3, 3] = rng.uniform(-50, 50, 3)
+
+    lesions = measure_volume(volume, affine, connectivity=connectivity, slab_slices=slab_slices)
+    expected = reference(volume, affine, connectivity)
+
+    assert len(lesions) == len(expected)
+    counts = [lesion.voxel_count for lesion in lesions]
+    assert counts == sorted(counts, reverse=True)
+    assert [lesion.lesion_id for lesion in lesions] == list(range(1, len(lesions) + 1))
+    voxel_volume = float(np.prod(np.diag(affine)[:3]))
+    for lesion, ref in zip(sorted((lesion.dict() for lesion in lesions), key=sort_key), sorted(expected, key=sort_key)):
+        assert sort_key(lesion) == sort_key(ref)
+        np.testing.assert_allclose(lesion["centroid_voxel"], ref["centroid_voxel"], atol=1e-3)
+        np.testing.assert_allclose(
+            lesion["centroid_mm"], ref["centroid_voxel"] @ affine[:3, :3].T + affine[:3, 3], atol=1e-2
+        )
+        assert lesion["volume_mm3"] == pytest.approx(ref["voxel_count"] * voxel_volume, abs=1e-3)
+        # 最大径按有限方向的投影跨度近似，只会偏小，误差在几个百分点以内
+        assert ref["max_diameter_mm"] * 0.97 - 1e-3 <= lesion["max_diameter_mm"] <= ref["max_diameter_mm"] + 1e-3
+        assert ref["axial_diameter_mm"] * 0.99 - 1e-3 <= lesion["axial_diameter_mm"] <= ref["axial_diameter_mm"] + 1e-3
+
+
+def test_threshold_and_empty_volume():
+    probabilities = np.zeros((8, 8, 4), dtype=np.float32)
+    assert measure_volume(probabilities) == []
+    probabilities[1:3, 1:3, 1] = 0.9
+    probabilities[5, 5, 2] = 0.4
+    lesions = measure_volume(probabilities, threshold=0.5)
+    assert [(lesion.label, lesion.voxel_count) for lesion in lesions] == [(1, 4)]
+
+
+def test_rejects_unknown_connectivity():
+    with pytest.raises(ValueError):
+        measure_volume(np.zeros((2, 2, 2), dtype=np.uint8), connectivity=18)
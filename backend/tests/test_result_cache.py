@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import result_cache as result_cache_module
+from app.services.result_cache import ResultCache
+
+
+class Clock:
+    """可控的时钟：每次读取前进1秒，保证访问时间严格递增"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1.0
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache_module, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+def key(name):
+    return (name * 64, "CT", "v1")
+
+
+def disk_names(cache):
+    with cache._connection() as conn:
+        return {name for (name,) in conn.execute("SELECT name FROM entries")}
+
+
+def test_memory_lru_eviction(clock):
+    cache = ResultCache(max_entries=2, ttl=3600, disk_dir=None, disk_max_entries=0)
+
+    async def scenario():
+        await cache.put(key("a"), {"n": 1})
+        await cache.put(key("b"), {"n": 2})
+        assert await cache.get(key("a")) == {"n": 1}
+        await cache.put(key("c"), {"n": 3})
+        return [await cache.get(key(name)) for name in "abc"]
+
+    assert asyncio.run(scenario()) == [{"n": 1}, None, {"n": 3}]
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_disk_evicts_least_recently_used(clock, tmp_path):
+    cache = ResultCache(max_entries=1, ttl=3600, disk_dir=tmp_path, disk_max_entries=2)
+
+    async def scenario():
+        await cache.put(key("a"), {"n": 1})
+        await cache.put(key("b"), {"n": 2})
+        # 读取 a 刷新其访问时间，超出上限时淘汰的是 b
+        assert await cache.get(key("a")) == {"n": 1}
+        await cache.put(key("c"), {"n": 3})
+
+    asyncio.run(scenario())
+    expected = {cache._entry_name(key("a")), cache._entry_name(key("c"))}
+    assert disk_names(cache) == expected
+    assert {path.stem for path in tmp_path.glob("*.json")} == expected
+
+    # 其他 worker（共享同一磁盘目录）读到相同的结果
+    other = ResultCache(max_entries=10, ttl=3600, disk_dir=tmp_path, disk_max_entries=2)
+
+    async def lookup():
+        return [await other.get(key(name)) for name in "abc"]
+
+    assert asyncio.run(lookup()) == [{"n": 1}, None, {"n": 3}]
+
+
+def test_expired_entries_miss(clock, tmp_path):
+    cache = ResultCache(max_entries=10, ttl=5, disk_dir=tmp_path, disk_max_entries=10)
+
+    async def scenario():
+        await cache.put(key("a"), {"n": 1})
+        clock.now += 10
+        return await cache.get(key("a"))
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_invalidate_session(clock, tmp_path):
+    cache = ResultCache(max_entries=10, ttl=3600, disk_dir=tmp_path, disk_max_entries=10)
+    other = ResultCache(max_entries=10, ttl=3600, disk_dir=tmp_path, disk_max_entries=10)
+
+    async def scenario():
+        await cache.put(key("a"), {"session_id": "s1"})
+        await cache.put(key("b"), {"session_id": "s2"})
+        # 另一个 worker 的内存中也缓存了 a
+        assert await other.get(key("a")) == {"session_id": "s1"}
+        await cache.invalidate_session("s1")
+        return await cache.get(key("a")), await other.get(key("a")), await other.get(key("b"))
+
+    assert asyncio.run(scenario()) == (None, None, {"session_id": "s2"})
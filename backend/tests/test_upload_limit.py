@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, Request
+
+from app.services.upload_service import UploadLimitMiddleware
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.post("/upload")
+    @app.post("/other")
+    async def receive_body(request: Request):
+        return {"size": len(await request.body())}
+
+    app.add_middleware(UploadLimitMiddleware, limits={"/upload": 10}, default=20)
+    return app
+
+
+def post(path, content, headers=None):
+    async def run():
+        async with httpx.AsyncClient(app=make_app(), base_url="http://test") as client:
+            return await client.post(path, content=content, headers=headers)
+
+    return asyncio.run(run())
+
+
+def chunked(*chunks):
+    async def body():
+        for chunk in chunks:
+            yield chunk
+
+    return body()
+
+
+def test_body_within_limit_passes():
+    response = post("/upload", b"x" * 10)
+    assert response.status_code == 200
+    assert response.json() == {"size": 10}
+
+
+def test_declared_content_length_over_limit_is_rejected():
+    response = post("/upload", b"x" * 11)
+    assert response.status_code == 413
+    assert "MB" in response.json()["detail"]
+
+
+def test_streamed_body_over_limit_is_rejected():
+    # 未声明 Content-Length 的分块请求：边接收边计数
+    response = post("/upload", chunked(b"x" * 6, b"x" * 6))
+    assert response.status_code == 413
+
+
+def test_streamed_body_within_limit_passes():
+    response = post("/upload", chunked(b"x" * 5, b"x" * 5))
+    assert response.status_code == 200
+    assert response.json() == {"size": 10}
+
+
+def test_other_paths_use_default_limit():
+    assert post("/other", b"x" * 15).status_code == 200
+    assert post("/other", b"x" * 21).status_code == 413
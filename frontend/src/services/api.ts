@@ -32,6 +32,11 @@ export const dicomApi = {  // 上传DICOM文件
     return api.get(`/v1/dicom/${filename}`, {
       responseType: 'blob'
     });
+  },
+
+  // 获取缩略图/关键层预览地址（可直接用于 <img src>，无需下载完整影像）
+  getPreviewUrl(filename: string, kind: 'thumbnail' | 'preview' = 'thumbnail') {
+    return `/api/v1/dicom/${encodeURIComponent(filename)}/preview?kind=${kind}`;
   }
 };
 
@@ -94,18 +99,45 @@ export const aiApi = {
       timeout: 600000 // 批量处理需要更长时间
     });
   },
-  // 下载分析结果
-  async downloadResult(sessionId: string, fileType: 'segmentation' | 'report' | 'raw_output' | 'pdf') {
+  // 下载分析结果（分割结果可用 format: 'compact' 获取紧凑格式）
+  async downloadResult(
+    sessionId: string,
+    fileType: 'segmentation' | 'report' | 'raw_output' | 'pdf',
+    format: 'raw' | 'compact' = 'raw'
+  ) {
     return api.get(`/v1/ai/download/${sessionId}/${fileType}`, {
+      params: format === 'compact' ? { format } : undefined,
       responseType: 'blob'
     });
   },
 
+  // 按层获取分割结果（紧凑格式单层数据，解码方式见响应头 X-Mask-Encoding / X-Mask-Shape / X-Mask-Dtype）
+  async getSegmentationSlice(sessionId: string, index: number) {
+    return api.get(`/v1/ai/download/${sessionId}/segmentation/slices/${index}`, {
+      responseType: 'arraybuffer'
+    });
+  },
+
   // 获取分析会话状态
   async getSessionStatus(sessionId: string) {
     return api.get(`/v1/ai/sessions/${sessionId}/status`);
   },
 
+  // 订阅分析会话进度（SSE推送，替代轮询 getSessionStatus）
+  // 事件类型固定为 status，具体状态在数据的 status 字段中；会话结束后后端关闭连接，这里同时关闭以免自动重连
+  subscribeSessionStatus(sessionId: string, onUpdate: (status: any) => void) {
+    const source = new EventSource(`/api/v1/ai/sessions/${encodeURIComponent(sessionId)}/events`);
+    const finished = ['completed', 'failed', 'error', 'cancelled', 'not_found'];
+    source.addEventListener('status', ((event: MessageEvent) => {
+      const snapshot = JSON.parse(event.data);
+      onUpdate(snapshot);
+      if (finished.includes(snapshot.status)) {
+        source.close();
+      }
+    }) as EventListener);
+    return () => source.close();
+  },
+
   // 删除分析会话
   async deleteSession(sessionId: string) {
     return api.delete(`/v1/ai/sessions/${sessionId}`);
@@ -1,5 +1,5 @@
 @echo off
 echo 启动医学影像分析系统后端服务...
 cd /d "d:\医学竞赛\backend"
-python app\main.py
+python -m app.main
 pause
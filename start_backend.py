@@ -6,30 +6,39 @@ import subprocess
 import sys
 import os
 
-def start_backend():
-    """启动后端服务"""
-    backend_dir = os.path.join(os.path.dirname(__file__), 'backend')
+def start_backend(production=False):
+    """启动后端服务（其他配置可通过 BACKEND_ 前缀的环境变量覆盖，如 BACKEND_WORKERS=8）"""
+    backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
     os.chdir(backend_dir)
     
     print("正在启动后端服务...")
     print(f"工作目录: {os.getcwd()}")
     
+    env = dict(os.environ)
+    if production:
+        env["BACKEND_SERVER_MODE"] = "production"
+    
     try:
         # 启动FastAPI服务
-        cmd = [sys.executable, "app/main.py"]
+        cmd = [sys.executable, "-m", "app.main"]
         print(f"执行命令: {' '.join(cmd)}")
         
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
         
         # 输出启动信息
-        for line in process.stdout:
-            print(line.strip())
+        try:
+            for line in process.stdout:
+                print(line.strip())
+        except KeyboardInterrupt:
+            print("\n正在关闭服务，等待进行中的上传和预测完成...")
+            process.terminate()
+            # 继续转发输出直到服务退出，避免管道写满阻塞关闭过程
+            for line in process.stdout:
+                print(line.strip())
+        process.wait()
             
-    except KeyboardInterrupt:
-        print("\n正在关闭服务...")
-        process.terminate()
     except Exception as e:
         print(f"启动失败: {e}")
 
 if __name__ == "__main__":
-    start_backend()
+    start_backend(production="--production" in sys.argv[1:])
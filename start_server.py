@@ -1,4 +1,3 @@
-import uvicorn
 from pathlib import Path
 import sys
 import os
@@ -9,6 +8,7 @@ sys.path.append(backend_dir)
 
 # 现在导入模块
 from app.config import settings
+from app.server import run
 
 # 创建上传目录
 settings.setup()
@@ -17,4 +17,4 @@ if __name__ == "__main__":
     print(f"Starting server at http://localhost:{settings.PORT}")
     print(f"Backend path: {backend_dir}")
     os.chdir(backend_dir)  # 切换工作目录
-    uvicorn.run("app.main:app", host=settings.HOST, port=settings.PORT, reload=True)
+    run()